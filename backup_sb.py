@@ -1,7 +1,10 @@
-import psycopg2
-import pandas as pd
 import os
+import time
 from datetime import datetime
+from db import pool_supabase, stampa_riepilogo_query
+from backup_store import STORE_DIR, scrivi_manifest, manifest_precedente
+from esportazione import esporta_tabelle, stampa_report
+from storico import aggiorna_storico
 
 # 🔐 Recupero password da variabile d'ambiente
 db_password = os.environ.get("SUPABASE_PASSWORD")
@@ -14,36 +17,17 @@ if not db_password:
     # 👉 Solo per test, puoi decommentare la riga seguente e inserire la password a mano
     # db_password = "INSERISCI_LA_TUA_PASSWORD"
 
-# 🔐 Credenziali Supabase (modifica se necessario)
-SUPABASE_HOST = "aws-1-eu-central-1.pooler.supabase.com"
-SUPABASE_PORT = 6543
-SUPABASE_DB = "postgres"
-SUPABASE_USER = "postgres.vhowswomnwhbfdpslsep"
-SUPABASE_PASSWORD = db_password
+# 🔐 Credenziali Supabase: lette da db.py (variabili SUPABASE_*)
 
-# 📁 Cartella principale di output
-REPO_DIR = os.path.dirname(os.path.abspath(__file__))
-BASE_DIR = os.path.join(REPO_DIR, "backup")
-
-# 📅 Crea sottocartella con data nel formato yyyy_mm_dd
+# 📁 Archivio deduplicato: backup/store (CSV gzip per hash) + backup/manifest/YYYY_MM_DD.json
+# Le tabelle invariate rispetto a un backup precedente non occupano altro spazio
 today_str = datetime.now().strftime("%Y_%m_%d")
-OUTPUT_DIR = os.path.join(BASE_DIR, today_str)
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-print(f"📂 Le tabelle verranno salvate in: {OUTPUT_DIR}")
-print("Percorso assoluto:", os.path.abspath(OUTPUT_DIR))
-print("Esiste la cartella?", os.path.exists(OUTPUT_DIR))
-print("Contenuto della cartella padre:", os.listdir(os.path.dirname(OUTPUT_DIR)))
+print(f"📂 Le tabelle verranno salvate in: {STORE_DIR} (manifest {today_str})")
 
 # 🔌 Connessione al database
 try:
-    conn = psycopg2.connect(
-        host=SUPABASE_HOST,
-        database=SUPABASE_DB,
-        user=SUPABASE_USER,
-        password=SUPABASE_PASSWORD,
-        port=SUPABASE_PORT
-    )
+    pool = pool_supabase()
+    conn = pool.prendi()
     cur = conn.cursor()
     print("✅ Connessione a Supabase riuscita!")
 except Exception as e:
@@ -62,23 +46,47 @@ try:
 except Exception as e:
     print("❌ Errore durante il recupero delle tabelle:", e)
     cur.close()
-    conn.close()
+    pool.chiudi()
     raise SystemExit
 
-# 💾 Esporta ogni tabella in CSV
-for table in tables:
-    try:
-        print(f"⏳ Esporto {table}...")
-        df = pd.read_sql(f'SELECT * FROM "{table}"', conn)
-        filepath = os.path.join(OUTPUT_DIR, f"{table}.csv")
-        df.to_csv(filepath, index=False)
-        print(f"✅ Esportata {table} → {filepath}")
-    except Exception as e:
-        print(f"❌ Errore su {table}: {e}")
-
-# 🔒 Chiudi connessione
+# 🔒 La connessione di servizio torna al pool: l'export usa le sue
 cur.close()
-conn.close()
-print("🎉 Esportazione completata!")
+pool.rilascia(conn)
+
+# 💾 Esporta le tabelle con COPY in parallelo (snapshot condiviso) direttamente nello store
+precedente = manifest_precedente(today_str)
+tabelle_precedenti = precedente["tabelle"] if precedente else {}
+t_inizio = time.perf_counter()
+risultati = esporta_tabelle(pool, tables)
+secondi = time.perf_counter() - t_inizio
 
+manifest = {}
+for table, voce in risultati.items():
+    if isinstance(voce, Exception):
+        print(f"❌ Errore su {table}: {voce}")
+        continue
+    manifest[table] = voce
+    if tabelle_precedenti.get(table, {}).get("sha256") == voce["sha256"]:
+        print(f"⏸️ {table} invariata ({voce['righe']} righe) → solo riferimento a {voce['sha256'][:12]}")
+    else:
+        print(f"✅ Esportata {table} ({voce['righe']} righe, {voce['byte_compressi'] / 1024:.1f} KB compressi)")
+stampa_report(risultati, secondi)
 
+percorso_manifest = scrivi_manifest(today_str, manifest)
+nuovi = [t for t, v in manifest.items() if v["nuovo"]]
+byte_nuovi = sum(manifest[t]["byte_compressi"] for t in nuovi)
+print(f"📒 Manifest: {percorso_manifest}")
+print(
+    f"📦 {len(nuovi)}/{len(manifest)} tabelle nuove nello store (+{byte_nuovi / 1024:.1f} KB) "
+    f"in {secondi:.2f}s"
+)
+
+# 📈 Storico quotazioni: aggiunge al registro il giorno appena salvato
+try:
+    aggiorna_storico()
+except Exception as e:
+    print(f"⚠️ Aggiornamento dello storico non riuscito (backup comunque salvato): {e}")
+
+stampa_riepilogo_query(pool)
+pool.chiudi()
+print("🎉 Esportazione completata!")
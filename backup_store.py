@@ -0,0 +1,235 @@
+# Archivio backup deduplicato (content-addressed)
+# Ogni snapshot di tabella è un CSV compresso gzip salvato come backup/store/<sha256>.csv.gz,
+# dove lo sha256 è quello del CSV non compresso: una tabella che non cambia da un giorno
+# all'altro viene solo referenziata dal manifest del giorno (backup/manifest/YYYY_MM_DD.json).
+# "origine" nel manifest dice chi ha scritto il CSV: "pandas" (to_csv dei backup storici) o
+# "copy" (COPY ... CSV HEADER di Postgres); i due formati differiscono per NULL, booleani e numeri.
+#
+# Uso:
+#   python backup_store.py elenco
+#   python backup_store.py importa [--rimuovi]       # cartelle legacy backup/YYYY_MM_DD -> store
+#   python backup_store.py ripristina 2026_08_08 [--dest cartella]
+
+import os
+import re
+import sys
+import gzip
+import json
+import shutil
+import hashlib
+import tempfile
+import argparse
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.join(REPO_DIR, "backup")
+STORE_DIR = os.path.join(BASE_DIR, "store")
+MANIFEST_DIR = os.path.join(BASE_DIR, "manifest")
+
+# Cartelle legacy: una per giorno con un CSV per tabella
+CARTELLA_GIORNO = re.compile(r"^\d{4}_\d{2}_\d{2}$")
+
+
+def percorso_oggetto(sha):
+    return os.path.join(STORE_DIR, f"{sha}.csv.gz")
+
+
+class NuovoOggetto:
+    """File in scrittura per lo store: comprime in gzip mentre calcola sha256 e byte del CSV.
+
+    Si può passare direttamente a copy_expert: memoria costante qualunque sia la tabella.
+    """
+
+    def __init__(self):
+        os.makedirs(STORE_DIR, exist_ok=True)
+        fd, self._tmp = tempfile.mkstemp(dir=STORE_DIR, suffix=".tmp")
+        self._file = os.fdopen(fd, "wb")
+        # mtime=0 e nessun nome file: stesso CSV -> stesso .gz, niente differenze spurie in git
+        self._gz = gzip.GzipFile(filename="", fileobj=self._file, mode="wb", compresslevel=9, mtime=0)
+        self._sha = hashlib.sha256()
+        self.byte = 0
+
+    def write(self, dati):
+        if isinstance(dati, str):
+            dati = dati.encode("utf-8")
+        self._sha.update(dati)
+        self.byte += len(dati)
+        self._gz.write(dati)
+        return len(dati)
+
+    def chiudi(self, righe=None, origine="pandas"):
+        """Completa l'oggetto e restituisce la voce per il manifest (scartato se già presente)"""
+        self._gz.close()
+        self._file.close()
+        sha = self._sha.hexdigest()
+        percorso = percorso_oggetto(sha)
+        nuovo = not os.path.exists(percorso)
+        if nuovo:
+            os.replace(self._tmp, percorso)
+        else:
+            os.remove(self._tmp)
+        return {
+            "sha256": sha,
+            "byte": self.byte,
+            "byte_compressi": os.path.getsize(percorso),
+            "righe": righe,
+            "origine": origine,
+            "nuovo": nuovo,
+        }
+
+    def annulla(self):
+        self._gz.close()
+        self._file.close()
+        if os.path.exists(self._tmp):
+            os.remove(self._tmp)
+
+
+def salva_tabella(contenuto, righe=None, origine="pandas"):
+    """Salva il CSV (bytes) nello store se non c'è già. Restituisce la voce per il manifest"""
+    oggetto = NuovoOggetto()
+    oggetto.write(contenuto)
+    return oggetto.chiudi(righe, origine)
+
+
+def leggi_tabella(sha):
+    """Contenuto CSV (bytes) di un oggetto dello store, con verifica dell'hash"""
+    with gzip.open(percorso_oggetto(sha), "rb") as f:
+        contenuto = f.read()
+    if hashlib.sha256(contenuto).hexdigest() != sha:
+        raise RuntimeError(f"❌ Oggetto corrotto nello store: {sha}")
+    return contenuto
+
+
+def scrivi_manifest(data, tabelle):
+    """Manifest del giorno: tabella -> sha256/righe/byte (senza il flag 'nuovo')"""
+    os.makedirs(MANIFEST_DIR, exist_ok=True)
+    manifest = {
+        "data": data,
+        "creato": datetime.now().isoformat(timespec="seconds"),
+        "formato": "csv.gz",
+        "tabelle": {
+            nome: {k: v for k, v in voce.items() if k != "nuovo"}
+            for nome, voce in sorted(tabelle.items())
+        },
+    }
+    percorso = os.path.join(MANIFEST_DIR, f"{data}.json")
+    with open(percorso, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+        f.write("\n")
+    return percorso
+
+
+def leggi_manifest(data):
+    percorso = os.path.join(MANIFEST_DIR, f"{data}.json")
+    if not os.path.exists(percorso):
+        return None
+    with open(percorso, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def date_disponibili():
+    """Date ripristinabili: manifest dello store più eventuali cartelle legacy non importate"""
+    date = set()
+    if os.path.isdir(MANIFEST_DIR):
+        date.update(f[:-5] for f in os.listdir(MANIFEST_DIR) if f.endswith(".json"))
+    if os.path.isdir(BASE_DIR):
+        date.update(d for d in os.listdir(BASE_DIR) if CARTELLA_GIORNO.match(d))
+    return sorted(date)
+
+
+def manifest_precedente(data):
+    """Manifest più recente prima di data (per dire quali tabelle sono cambiate)"""
+    if not os.path.isdir(MANIFEST_DIR):
+        return None
+    precedenti = sorted(f[:-5] for f in os.listdir(MANIFEST_DIR) if f.endswith(".json") and f[:-5] < data)
+    return leggi_manifest(precedenti[-1]) if precedenti else None
+
+
+def tabelle_del_giorno(data):
+    """Tabella -> contenuto CSV (bytes) per una data, dallo store o dalla cartella legacy"""
+    manifest = leggi_manifest(data)
+    if manifest is not None:
+        return {nome: leggi_tabella(voce["sha256"]) for nome, voce in manifest["tabelle"].items()}
+
+    cartella = os.path.join(BASE_DIR, data)
+    if not os.path.isdir(cartella):
+        raise FileNotFoundError(f"❌ Nessun backup per il {data}")
+    tabelle = {}
+    for nome_file in sorted(os.listdir(cartella)):
+        if nome_file.endswith(".csv"):
+            with open(os.path.join(cartella, nome_file), "rb") as f:
+                tabelle[nome_file[:-4]] = f.read()
+    return tabelle
+
+
+def ripristina(data, destinazione):
+    """Ricostruisce la cartella CSV di una data (stesso formato dei backup legacy)"""
+    os.makedirs(destinazione, exist_ok=True)
+    tabelle = tabelle_del_giorno(data)
+    for nome, contenuto in tabelle.items():
+        with open(os.path.join(destinazione, f"{nome}.csv"), "wb") as f:
+            f.write(contenuto)
+    print(f"✅ Ripristinate {len(tabelle)} tabelle del {data} in {destinazione}")
+    return tabelle
+
+
+def importa_cartelle(rimuovi=False):
+    """Porta le cartelle legacy backup/YYYY_MM_DD nello store, un manifest per giorno"""
+    giorni = sorted(d for d in os.listdir(BASE_DIR) if CARTELLA_GIORNO.match(d))
+    byte_prima = byte_nuovi = oggetti_nuovi = 0
+    for giorno in giorni:
+        tabelle = {}
+        for nome, contenuto in tabelle_del_giorno(giorno).items():
+            voce = salva_tabella(contenuto)
+            tabelle[nome] = voce
+            byte_prima += voce["byte"]
+            if voce["nuovo"]:
+                oggetti_nuovi += 1
+                byte_nuovi += voce["byte_compressi"]
+        scrivi_manifest(giorno, tabelle)
+        if rimuovi:
+            # Il giorno è ricostruibile dallo store: la cartella non serve più
+            if ripristina_uguale(giorno, tabelle):
+                shutil.rmtree(os.path.join(BASE_DIR, giorno))
+            else:
+                print(f"⚠️ {giorno}: verifica fallita, cartella mantenuta")
+    print(
+        f"📦 Importati {len(giorni)} giorni: {byte_prima / 1e6:.1f} MB di CSV -> "
+        f"{oggetti_nuovi} oggetti nuovi, {byte_nuovi / 1e6:.1f} MB compressi"
+    )
+
+
+def ripristina_uguale(data, tabelle):
+    """True se lo store ricostruisce byte per byte la cartella legacy"""
+    cartella = os.path.join(BASE_DIR, data)
+    for nome, voce in tabelle.items():
+        with open(os.path.join(cartella, f"{nome}.csv"), "rb") as f:
+            if f.read() != leggi_tabella(voce["sha256"]):
+                return False
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archivio backup Supabase deduplicato")
+    comandi = parser.add_subparsers(dest="comando", required=True)
+    comandi.add_parser("elenco", help="date disponibili")
+    importa = comandi.add_parser("importa", help="importa le cartelle legacy nello store")
+    importa.add_argument("--rimuovi", action="store_true", help="elimina le cartelle importate e verificate")
+    rip = comandi.add_parser("ripristina", help="ricostruisce i CSV di una data")
+    rip.add_argument("data", help="YYYY_MM_DD")
+    rip.add_argument("--dest", help="cartella di destinazione (default ripristino/<data>)")
+    args = parser.parse_args(argv)
+
+    if args.comando == "elenco":
+        for data in date_disponibili():
+            fonte = "store" if leggi_manifest(data) else "cartella"
+            print(f"{data}  ({fonte})")
+    elif args.comando == "importa":
+        importa_cartelle(rimuovi=args.rimuovi)
+    elif args.comando == "ripristina":
+        destinazione = args.dest or os.path.join(REPO_DIR, "ripristino", args.data)
+        ripristina(args.data, destinazione)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
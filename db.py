@@ -0,0 +1,251 @@
+# Connessioni Postgres condivise da ETL, backup e sync
+# Un pool per database: un solo handshake TLS per run invece di uno per fase,
+# health check alla presa, statement timeout, retry sugli errori di connessione
+# transitori e tempi per singola query (le query lente finiscono nel log del run).
+# Lo statement timeout è impostato con SET LOCAL all'inizio di ogni transazione: sul
+# transaction pooler di Supabase (porta 6543) un SET di sessione finirebbe sulla connessione
+# server di qualcun altro. A pool pieno prendi() aspetta che si liberi una connessione.
+
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.sql import Composable
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+
+import metriche
+
+# === CONFIGURAZIONE DA ENV ===
+SUPABASE_HOST = os.environ.get("SUPABASE_HOST", "aws-1-eu-central-1.pooler.supabase.com")
+SUPABASE_PORT = int(os.environ.get("SUPABASE_PORT", 6543))
+SUPABASE_DB = os.environ.get("SUPABASE_DB", "postgres")
+SUPABASE_USER = os.environ.get("SUPABASE_USER", "postgres.vhowswomnwhbfdpslsep")
+SUPABASE_PASSWORD = os.environ.get("SUPABASE_PASSWORD")
+
+POOL_MAX = int(os.environ.get("SUPABASE_POOL_MAX", 4))
+# Secondi di attesa massima per una connessione a pool pieno
+POOL_ATTESA_S = float(os.environ.get("SUPABASE_POOL_WAIT_S", 120))
+STATEMENT_TIMEOUT_MS = int(os.environ.get("SUPABASE_STATEMENT_TIMEOUT_MS", 120_000))
+MAX_TENTATIVI = int(os.environ.get("SUPABASE_MAX_RETRIES", 3))
+QUERY_LENTA_MS = int(os.environ.get("SUPABASE_SLOW_QUERY_MS", 500))
+
+logger = logging.getLogger(__name__)
+
+# Errori per cui ha senso riprovare (rete, pooler, server in riavvio)
+ERRORI_TRANSITORI = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+# === TEMPI PER QUERY ===
+_query_log = []
+_query_lock = threading.Lock()
+
+
+def _registra_query(sql, secondi, righe):
+    testo = sql.decode() if isinstance(sql, bytes) else str(sql)
+    testo = " ".join(testo.split())
+    with _query_lock:
+        _query_log.append({"sql": testo, "secondi": secondi, "righe": righe})
+    # Round trip, righe e tempo sul database nello stadio della pipeline in corso
+    metriche.conta("query")
+    metriche.conta("righe_db", max(righe, 0))
+    metriche.conta("secondi_db", secondi)
+    if secondi * 1000 >= QUERY_LENTA_MS:
+        messaggio = f"🐢 Query lenta ({secondi:.2f}s, {righe} righe): {testo[:120]}"
+        print(messaggio)
+        logger.warning(messaggio)
+
+
+def statistiche_query():
+    """Copia delle query eseguite nel run: sql, secondi, righe"""
+    with _query_lock:
+        return list(_query_log)
+
+
+class CursoreCronometrato(extensions.cursor):
+    """Cursore che registra il tempo di ogni execute/executemany/copy.
+
+    La prima istruzione di ogni transazione è preceduta da SET LOCAL statement_timeout.
+    """
+
+    def _testo(self, query):
+        # Le query composte con psycopg2.sql vanno rese come testo per il log
+        return query.as_string(self.connection) if isinstance(query, Composable) else query
+
+    def _timeout_transazione(self):
+        conn = self.connection
+        if not conn.autocommit and conn.info.transaction_status == extensions.TRANSACTION_STATUS_IDLE:
+            super().execute("SET LOCAL statement_timeout = %s", (STATEMENT_TIMEOUT_MS,))
+
+    def execute(self, query, vars=None):
+        self._timeout_transazione()
+        t0 = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            _registra_query(self._testo(query), time.perf_counter() - t0, self.rowcount)
+
+    def executemany(self, query, vars_list):
+        self._timeout_transazione()
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            _registra_query(self._testo(query), time.perf_counter() - t0, self.rowcount)
+
+    def copy_expert(self, sql, file, size=8192):
+        self._timeout_transazione()
+        t0 = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            _registra_query(self._testo(sql), time.perf_counter() - t0, self.rowcount)
+
+
+# === POOL ===
+class Pool:
+    """Pool di connessioni thread-safe verso un database.
+
+    Accetta un DSN completo oppure i parametri di psycopg2.connect.
+    """
+
+    def __init__(self, dsn=None, maxconn=POOL_MAX, nome="db", **parametri):
+        self.nome = nome
+        self._dsn = dsn
+        self._parametri = parametri
+        self._maxconn = maxconn
+        self._pool = None
+        self._lock = threading.Lock()
+        # Una connessione per permesso: a pool pieno si aspetta invece di avere PoolError
+        self._posti = threading.BoundedSemaphore(maxconn)
+        self._handshake = set()
+
+    def _crea_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = _con_retry(
+                    lambda: ThreadedConnectionPool(
+                        1,
+                        self._maxconn,
+                        dsn=self._dsn,
+                        cursor_factory=CursoreCronometrato,
+                        **self._parametri,
+                    ),
+                    f"apertura pool {self.nome}",
+                )
+        return self._pool
+
+    def prendi(self, attesa=POOL_ATTESA_S):
+        """Prende una connessione sana dal pool (health check), aspettando al più attesa secondi"""
+
+        def tentativo():
+            pool = self._crea_pool()
+            conn = pool.getconn()
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.commit()
+            except ERRORI_TRANSITORI:
+                pool.putconn(conn, close=True)
+                raise
+            self._handshake.add(id(conn))
+            return conn
+
+        if not self._posti.acquire(timeout=attesa):
+            raise PoolError(f"pool {self.nome}: nessuna connessione libera dopo {attesa:.0f}s (maxconn={self._maxconn})")
+        try:
+            return _con_retry(tentativo, f"connessione {self.nome}")
+        except BaseException:
+            self._posti.release()
+            raise
+
+    def rilascia(self, conn, chiudi=False):
+        """Restituisce la connessione al pool (annullando eventuali transazioni aperte)"""
+        try:
+            if not conn.closed and conn.status != extensions.STATUS_READY:
+                conn.rollback()
+            self._pool.putconn(conn, close=chiudi or bool(conn.closed))
+        finally:
+            self._posti.release()
+
+    @contextmanager
+    def connessione(self):
+        """Connessione dal pool: commit all'uscita, rollback in caso di errore"""
+        conn = self.prendi()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self.rilascia(conn)
+
+    @property
+    def maxconn(self):
+        return self._maxconn
+
+    @property
+    def handshake(self):
+        """Connessioni fisiche distinte aperte dal pool in questo run"""
+        return len(self._handshake)
+
+    def chiudi(self):
+        if self._pool is not None:
+            self._pool.closeall()
+            self._pool = None
+
+
+def _con_retry(funzione, descrizione, tentativi=MAX_TENTATIVI):
+    """Esegue funzione riprovando con backoff esponenziale sugli errori transitori"""
+    for tentativo in range(1, tentativi + 1):
+        try:
+            return funzione()
+        except ERRORI_TRANSITORI as e:
+            if tentativo == tentativi:
+                raise
+            attesa = 2 ** (tentativo - 1)
+            print(f"⚠️ {descrizione}: errore transitorio ({e}). Riprovo tra {attesa}s...")
+            time.sleep(attesa)
+
+
+_pool_supabase = None
+_pool_supabase_lock = threading.Lock()
+
+
+def pool_supabase(maxconn=POOL_MAX):
+    """Pool condiviso verso Supabase, configurato dalle variabili SUPABASE_*.
+
+    maxconn vale solo per la prima chiamata, quella che crea il pool (anche da più thread).
+    """
+    global _pool_supabase
+    with _pool_supabase_lock:
+        if _pool_supabase is None:
+            if not SUPABASE_PASSWORD:
+                raise RuntimeError("Missing SUPABASE_PASSWORD environment variable (set as GitHub Secret)")
+            _pool_supabase = Pool(
+                maxconn=maxconn,
+                nome="supabase",
+                host=SUPABASE_HOST,
+                port=SUPABASE_PORT,
+                dbname=SUPABASE_DB,
+                user=SUPABASE_USER,
+                password=SUPABASE_PASSWORD,
+            )
+        return _pool_supabase
+
+
+def stampa_riepilogo_query(pool=None, quante=5):
+    """Stampa numero di query, tempo totale e le query più lente del run"""
+    query = statistiche_query()
+    totale = sum(q["secondi"] for q in query)
+    riga = f"🗄️ Query eseguite: {len(query)} in {totale:.2f}s"
+    if pool is not None:
+        riga += f" — connessioni aperte: {pool.handshake}"
+    print(riga)
+    for q in sorted(query, key=lambda q: q["secondi"], reverse=True)[:quante]:
+        print(f"   {q['secondi']:.3f}s  {q['righe']:>6} righe  {q['sql'][:100]}")
@@ -0,0 +1,149 @@
+# Export delle tabelle con COPY ... TO STDOUT direttamente nello store dei backup
+# Niente DataFrame: i blocchi di COPY finiscono nel gzip man mano che arrivano (memoria costante).
+# Più tabelle in parallelo, ognuna sulla propria connessione del pool, tutte sullo stesso
+# snapshot esportato (pg_export_snapshot) così il backup è coerente a un istante preciso.
+# Le righe escono in ordine di PK: stesso contenuto -> stessi byte -> stesso oggetto nello store.
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extensions import ISOLATION_LEVEL_REPEATABLE_READ
+
+from backup_store import NuovoOggetto
+
+WORKERS = int(os.environ.get("BACKUP_WORKERS", 3))
+
+
+def _inizia_snapshot(conn, snapshot=None):
+    """Transazione REPEATABLE READ in sola lettura, eventualmente sullo snapshot indicato"""
+    conn.set_session(isolation_level=ISOLATION_LEVEL_REPEATABLE_READ, readonly=True)
+    if snapshot:
+        with conn.cursor() as cur:
+            cur.execute("SET TRANSACTION SNAPSHOT %s", (snapshot,))
+
+
+def _chiudi_snapshot(conn):
+    conn.rollback()
+    conn.set_session(isolation_level="DEFAULT", readonly="DEFAULT")
+
+
+def _ordinamento(cur, tabella):
+    """ORDER BY deterministico: le colonne della PK, l'intera riga come testo se manca"""
+    cur.execute(
+        """
+        SELECT a.attname
+        FROM pg_index i
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+        WHERE i.indrelid = format('public.%%I', %s::text)::regclass AND i.indisprimary
+        ORDER BY array_position(i.indkey, a.attnum);
+        """,
+        (tabella,),
+    )
+    pk = [r[0] for r in cur.fetchall()]
+    if not pk:
+        return sql.SQL("t::text")
+    return sql.SQL(", ").join(sql.Identifier(c) for c in pk)
+
+
+def copia_tabella(conn, tabella):
+    """COPY di una tabella nello store. Restituisce la voce del manifest con il tempo impiegato"""
+    t0 = time.perf_counter()
+    oggetto = NuovoOggetto()
+    try:
+        with conn.cursor() as cur:
+            query = sql.SQL("COPY (SELECT * FROM {} t ORDER BY {}) TO STDOUT WITH (FORMAT csv, HEADER true)").format(
+                sql.Identifier(tabella), _ordinamento(cur, tabella)
+            )
+            cur.copy_expert(query.as_string(conn), oggetto)
+            righe = cur.rowcount
+    except Exception:
+        oggetto.annulla()
+        raise
+    voce = oggetto.chiudi(righe=righe, origine="copy")
+    voce["secondi"] = round(time.perf_counter() - t0, 3)
+    return voce
+
+
+def _copia_su_snapshot(pool, tabella, snapshot):
+    conn = pool.prendi()
+    try:
+        _inizia_snapshot(conn, snapshot)
+        return copia_tabella(conn, tabella)
+    finally:
+        _chiudi_snapshot(conn)
+        pool.rilascia(conn)
+
+
+def esporta_tabelle(pool, tabelle, workers=WORKERS):
+    """Esporta le tabelle in parallelo su uno snapshot condiviso.
+
+    Restituisce {tabella: voce} (sha256, righe, byte, byte_compressi, secondi, nuovo) oppure
+    {tabella: eccezione} per le tabelle fallite. Se lo snapshot non si può esportare
+    (es. pooler che non lo consente) tutte le tabelle passano in sequenza sulla stessa
+    transazione REPEATABLE READ, che resta comunque coerente.
+    """
+    risultati = {}
+    # Il coordinatore occupa una connessione del pool per tutto l'export
+    if workers > pool.maxconn - 1:
+        workers = max(1, pool.maxconn - 1)
+        print(f"ℹ️ Export limitato a {workers} worker (pool {pool.nome} da {pool.maxconn} connessioni)")
+    coordinatore = pool.prendi()
+    try:
+        _inizia_snapshot(coordinatore)
+        try:
+            with coordinatore.cursor() as cur:
+                cur.execute("SELECT pg_export_snapshot()")
+                snapshot = cur.fetchone()[0]
+        except psycopg2.Error as e:
+            print(f"⚠️ pg_export_snapshot non disponibile ({e}). Export sequenziale su un'unica transazione.")
+            coordinatore.rollback()
+            _inizia_snapshot(coordinatore)
+            snapshot = None
+
+        if snapshot is None or workers <= 1:
+            for tabella in tabelle:
+                try:
+                    risultati[tabella] = copia_tabella(coordinatore, tabella)
+                except psycopg2.Error as e:
+                    risultati[tabella] = e
+                    # La transazione è abortita: ne riapro una (lo snapshot non è più lo stesso)
+                    _chiudi_snapshot(coordinatore)
+                    _inizia_snapshot(coordinatore)
+            return risultati
+
+        print(f"📸 Snapshot condiviso {snapshot} su {workers} connessioni")
+        # Il coordinatore tiene aperta la transazione finché tutti i worker hanno finito
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export") as executor:
+            futures = {
+                tabella: executor.submit(_copia_su_snapshot, pool, tabella, snapshot)
+                for tabella in tabelle
+            }
+            for tabella, future in futures.items():
+                try:
+                    risultati[tabella] = future.result()
+                except Exception as e:
+                    risultati[tabella] = e
+        return risultati
+    finally:
+        _chiudi_snapshot(coordinatore)
+        pool.rilascia(coordinatore)
+
+
+def stampa_report(risultati, secondi_totali):
+    """Righe, byte e tempo per tabella più il totale"""
+    print(f"{'tabella':<30} {'righe':>9} {'CSV':>10} {'gzip':>10} {'tempo':>8}")
+    righe_tot = byte_tot = 0
+    for tabella, voce in risultati.items():
+        if isinstance(voce, Exception):
+            print(f"{tabella:<30} ❌ {str(voce).splitlines()[0]}")
+            continue
+        righe_tot += voce["righe"] or 0
+        byte_tot += voce["byte"]
+        print(
+            f"{tabella:<30} {voce['righe']:>9} {voce['byte'] / 1024:>8.1f}KB "
+            f"{voce['byte_compressi'] / 1024:>8.1f}KB {voce['secondi']:>7.2f}s"
+        )
+    print(f"{'TOTALE':<30} {righe_tot:>9} {byte_tot / 1024:>8.1f}KB {'':>10} {secondi_totali:>7.2f}s")
@@ -0,0 +1,154 @@
+# Configurazione e stadi condivisi dell'ETL listone (fc_to_sb_to_gs_ETL.py e multi_lega.py)
+# Importarlo non ha effetti: credenziali Google, controllo dei secrets, cartella dei download
+# e log.txt vengono preparati solo da prepara_ambiente(), chiamata dagli script all'avvio.
+# Selenium viene importato solo se serve il login di fallback.
+
+import os
+import shutil
+import logging
+
+from sheets_sink import SheetsSink
+
+# === CONFIGURAZIONE DA ENV / SECRETS ===
+# Host/porta/utente Supabase: vedi db.py (SUPABASE_HOST, SUPABASE_PORT, ...)
+SUPABASE_PASSWORD = os.environ.get("SUPABASE_PASSWORD")
+SUPABASE_TABLE = os.environ.get("SUPABASE_TABLE", "giocatore")
+SUPABASE_TABLE_CREDITI = os.environ.get("SUPABASE_TABLE_CREDITI", "squadra")
+SUPABASE_TABLE_MOVIMENTI = os.environ.get("SUPABASE_TABLE_MOVIMENTI", "movimenti_squadra")
+SUPABASE_TABLE_ASTE = os.environ.get("SUPABASE_TABLE_ASTE", "asta")
+
+FANTACALCIO_USERNAME = os.environ.get("FANTACALCIO_USERNAME", "mura88")
+FANTACALCIO_PASSWORD = os.environ.get("FANTACALCIO_PASSWORD")  # <- SECRET
+
+# Optional: JSON content for Google credentials (if needed by your pipeline)
+GOOGLE_CREDENTIALS_JSON = os.environ.get("GOOGLE_CREDENTIALS_JSON")  # <- SECRET (raw JSON string)
+GOOGLE_CREDENTIALS_PATH = os.path.join(os.getcwd(), "google_credentials.json")
+
+# === PATHS ===
+DOWNLOAD_DIR = os.path.join(os.getcwd(), "downloads")
+TARGET_FILE = os.path.join(DOWNLOAD_DIR, "listone.xlsx")
+NOME_ETL = "fc_to_sb_to_gs"
+# Elabora il listone anche se identico all'ultimo run riuscito
+FORZA_ELABORAZIONE = os.environ.get("FORZA_ELABORAZIONE", "0") == "1"
+LOG_FILE = os.path.join(os.getcwd(), "log.txt")
+
+
+def prepara_ambiente(richiedi_supabase=True):
+    """Credenziali Google su file, controllo dei secrets, cartella dei download e log.txt"""
+    if GOOGLE_CREDENTIALS_JSON:
+        with open(GOOGLE_CREDENTIALS_PATH, "w", encoding="utf-8") as f:
+            f.write(GOOGLE_CREDENTIALS_JSON)
+
+    # Controlli minimi sui secrets
+    if richiedi_supabase and not SUPABASE_PASSWORD:
+        raise RuntimeError("Missing SUPABASE_PASSWORD environment variable (set as GitHub Secret)")
+    if not FANTACALCIO_PASSWORD:
+        raise RuntimeError("Missing FANTACALCIO_PASSWORD environment variable (set as GitHub Secret)")
+
+    os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+    logging.basicConfig(
+        filename=LOG_FILE,
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
+
+
+# === LOGIN FANTACALCIO (FALLBACK) ===
+def login_selenium():
+    """Login Fantacalcio tramite Selenium (fallback): restituisce cookie e link del listone"""
+    from selenium import webdriver
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.common.keys import Keys
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.chrome.service import Service
+    from webdriver_manager.chrome import ChromeDriverManager
+
+    options = webdriver.ChromeOptions()
+    options.add_argument("--headless=new")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--window-size=1920,1080")
+
+    # Se Chromium è installato in CI, proviamo a usarlo
+    chromium_path = shutil.which("chromium") or shutil.which("chromium-browser") or shutil.which("google-chrome")
+    if chromium_path:
+        options.binary_location = chromium_path
+
+    service = Service(ChromeDriverManager().install())
+    driver = webdriver.Chrome(service=service, options=options)
+
+    try:
+        driver.get("https://www.fantacalcio.it/login")
+
+        username_input = WebDriverWait(driver, 20).until(
+            EC.presence_of_element_located((By.NAME, "username"))
+        )
+        password_input = driver.find_element(By.NAME, "password")
+
+        username_input.send_keys(FANTACALCIO_USERNAME)
+        password_input.send_keys(FANTACALCIO_PASSWORD)
+        password_input.send_keys(Keys.RETURN)
+
+        WebDriverWait(driver, 20).until(EC.url_contains("fantacalcio.it"))
+        driver.get("https://www.fantacalcio.it/quotazioni-fantacalcio")
+
+        download_link = WebDriverWait(driver, 20).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, "a.download-players-price-serie-a"))
+        )
+        href = download_link.get_attribute("href")
+        return driver.get_cookies(), href
+    finally:
+        driver.quit()
+
+
+# === FOGLI GOOGLE ===
+def foglio_listone(df):
+    """Frame per il foglio Listone (None se il listone non è stato rielaborato)"""
+    if df is None:
+        return None
+    # L'id resta su Supabase: il foglio ha la sua colonna "ID Calciatore" in fondo
+    df = df.drop(columns=["id"], errors="ignore")
+    rename_mapping = {
+        "nome": "Calciatore",
+        "ruolo": "Ruolo",
+        "club": "CSA",
+        "detentore_cartellino": "Detentore Cartellino",
+        "squadra_att": "Squadra Attuale",
+        "costo": "Costo",
+        "tipo_contratto": "Tipo Contratto",
+        "quot_att_mantra": "Quotazione Attuale",
+        "id": "ID Calciatore"
+    }
+
+    df = df.rename(columns=rename_mapping)
+    df['Ruolo'] = df['Ruolo'].astype(str).str.replace('{', '').str.replace('}', '')
+    df.drop(["priorita"], axis=1, inplace=True, errors='ignore')
+    df['ID Calciatore'] = 1
+    return df
+
+
+def foglio_crediti(sbc):
+    sbc = sbc[['nome', 'crediti']]
+    return sbc.rename(columns={'nome': 'Squadra', 'crediti': 'Crediti'})
+
+
+def foglio_mercato(sbm):
+    sbm = sbm[['data', 'evento', 'stagione']]
+    return sbm.rename(columns={'data': 'Data', 'evento': 'Evento', 'stagione': 'Stagione'})
+
+
+def scrivi_fogli(spreadsheet, listone, crediti, mercato, aste):
+    """Aggiorna i fogli Google con una sola scrittura a differenze per tutto lo spreadsheet"""
+    print("⬆️ Aggiornamento Google Sheet (Listone, Nuova_Crediti, Mercato, Durata_Aste)...")
+    sink = SheetsSink(spreadsheet)
+    if listone is not None:
+        sink.scrivi("Listone", listone)
+    sink.scrivi("Nuova_Crediti", crediti)
+    sink.scrivi("Mercato", mercato)
+    sink.scrivi("Durata_Aste", aste)
+    riepilogo = sink.flush()
+    print("✅ Google Sheet aggiornato.")
+    return riepilogo
@@ -1,21 +1,23 @@
 import os
-import shutil
 import time
 import sys
 import json
 import logging
 import pandas as pd
 import gspread
-from gspread_dataframe import set_with_dataframe
 import numpy as np
-import psycopg2
-import requests
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from db import pool_supabase, stampa_riepilogo_query
+from listone import scarica_listone_file, listone_gia_caricato, segna_listone_caricato, leggi_listone
+from sheets_sink import SheetsSink
+from giocatori import carica_giocatori_bulk
+from pipeline import Pipeline
+from metriche import scrivi_report
 import warnings
 warnings.filterwarnings("ignore")
 
@@ -41,6 +43,11 @@ WAIT_SECONDS = 5
 download_dir = os.path.join(os.getcwd(), "downloads")
 os.makedirs(download_dir, exist_ok=True)
 target_file = os.path.join(download_dir, "listone.xlsx")
+NOME_ETL = "fc_to_gs_to_sb"
+# Elabora il listone anche se identico all'ultimo run riuscito
+FORZA_ELABORAZIONE = os.environ.get("FORZA_ELABORAZIONE", "0") == "1"
+# SCRIVI_SHEETS=0 carica solo Supabase, senza aggiornare i fogli Supabase/Appoggio_listone
+SCRIVI_SHEETS = os.environ.get("SCRIVI_SHEETS", "1") == "1"
 
 # ----------------------------
 # Legge credenziali Google da ENV
@@ -54,7 +61,8 @@ gc = gspread.service_account_from_dict(json.loads(gspread_credentials_json))
 # ----------------------------
 # Funzione download + parsing
 # ----------------------------
-def scarica_listone():
+def login_selenium():
+    """Login Fantacalcio via Selenium (fallback): restituisce cookie e link del listone"""
     options = webdriver.ChromeOptions()
     options.add_argument("--headless")
     options.add_argument("--no-sandbox")
@@ -95,217 +103,191 @@ def scarica_listone():
         href = download_link.get_attribute("href")
 
         logger.info(f"🔹 Scaricando file listone da {href}")
-        cookies = driver.get_cookies()
-        session = requests.Session()
-        for c in cookies:
-            session.cookies.set(c['name'], c['value'])
-
-        response = session.get(href)
-        with open(target_file, "wb") as f:
-            f.write(response.content)
+        return driver.get_cookies(), href
 
     finally:
         driver.quit()
 
+
+def scarica_listone():
+    metodo, sha = scarica_listone_file(
+        "mura88", os.environ.get("FANTACALCIO_PASSWORD"), target_file, login_selenium
+    )
+    logger.info(f"🔹 Listone scaricato via {metodo} (sha256 {sha[:12]})")
+    if listone_gia_caricato(target_file, sha, NOME_ETL) and not FORZA_ELABORAZIONE:
+        return None, sha
+
     # Lettura file
     try:
-        df = pd.read_excel(target_file, engine="openpyxl")
-        return df
+        df = leggi_listone(target_file)
+        return df, sha
     except Exception:
         with open(target_file, "rb") as f:
             head = f.read(200).decode(errors="ignore")
         if "<html" in head.lower():
             logger.warning("⚠️ File scaricato in formato HTML, uso pd.read_html()")
-            return pd.read_html(target_file)[0]
+            return _intestazione_da_prima_riga(pd.read_html(target_file)[0]), sha
         elif ";" in head or "," in head:
             try:
                 logger.warning("⚠️ File scaricato in formato CSV, uso sep=';'")
-                return pd.read_csv(target_file, sep=";")
+                return _intestazione_da_prima_riga(pd.read_csv(target_file, sep=";")), sha
             except:
                 logger.warning("⚠️ Uso sep=',' per CSV")
-                return pd.read_csv(target_file, sep=",")
+                return _intestazione_da_prima_riga(pd.read_csv(target_file, sep=",")), sha
         else:
             raise ValueError("❌ Formato file sconosciuto")
 
+
+def _intestazione_da_prima_riga(df):
+    # Nei formati di ripiego la prima riga è il titolo del foglio: l'intestazione vera è la riga successiva
+    df.columns = df.iloc[0]
+    return df[1:]
+
 # ----------------------------
-# Retry loop per scaricare listone
+# Download con retry
 # ----------------------------
-listone_fantacalcio = None
-for attempt in range(1, MAX_RETRIES + 1):
-    try:
-        logger.info(f"Tentativo {attempt} di scaricare il listone...")
-        listone_fantacalcio = scarica_listone()
-        logger.info("✅ Listone scaricato e letto con successo.")
-        break
-    except Exception as e:
-        logger.error(f"❌ Errore al tentativo {attempt}: {e}")
-        if attempt < MAX_RETRIES:
-            logger.info(f"⏳ Riprovo tra {WAIT_SECONDS} secondi...")
-            time.sleep(WAIT_SECONDS)
-        else:
-            raise RuntimeError("❌ Impossibile scaricare il listone dopo vari tentativi.") from e
+def scarica_con_retry():
+    """1️⃣ Listone con MAX_RETRIES tentativi: (df o None se invariato, sha256)"""
+    for attempt in range(1, MAX_RETRIES + 1):
+        try:
+            logger.info(f"Tentativo {attempt} di scaricare il listone...")
+            risultato = scarica_listone()
+            logger.info("✅ Listone scaricato e letto con successo.")
+            return risultato
+        except Exception as e:
+            logger.error(f"❌ Errore al tentativo {attempt}: {e}")
+            if attempt < MAX_RETRIES:
+                logger.info(f"⏳ Riprovo tra {WAIT_SECONDS} secondi...")
+                time.sleep(WAIT_SECONDS)
+            else:
+                raise RuntimeError("❌ Impossibile scaricare il listone dopo vari tentativi.") from e
+
 
 # ----------------------------
 # Google Sheets
 # ----------------------------
-spreadsheet = gc.open("Test")
-worksheet = spreadsheet.worksheet("Appoggio_listone")
-worksheet_test = spreadsheet.worksheet("Supabase")
-worksheet_listone = spreadsheet.worksheet("Listone")
+def _griglia(worksheet):
+    """Righe del foglio dalla prima riga non vuota (l'intestazione) in poi"""
+    rows = worksheet.get_all_values()
+    header_row_index = next(i for i, row in enumerate(rows) if any(cell.strip() for cell in row))
+    return rows[header_row_index], rows[header_row_index + 1:]
+
+
+def leggi_fogli(listone):
+    """Spreadsheet, 'Appoggio_listone' e 'Listone' (None se il listone è invariato)"""
+    listone_fantacalcio, _ = listone
+    if listone_fantacalcio is None:
+        return None
+    spreadsheet = gc.open("Test")
+    header, data_rows = _griglia(spreadsheet.worksheet("Appoggio_listone"))
+    old_appoggio_listone = pd.DataFrame(data_rows, columns=header).dropna(axis=1, how='all')
+    logger.info("✅ Estratto 'Appoggio Listone' da Google.")
 
-rows = worksheet.get_all_values()
-header_row_index = next(i for i, row in enumerate(rows) if any(cell.strip() for cell in row))
-header = rows[header_row_index]
-data_rows = rows[header_row_index + 1:]
-old_appoggio_listone = pd.DataFrame(data_rows, columns=header).dropna(axis=1, how='all')
+    header, data_rows = _griglia(spreadsheet.worksheet("Listone"))
+    return spreadsheet, old_appoggio_listone, pd.DataFrame(data_rows, columns=header)
 
-logger.info("✅ Estratto 'Appoggio Listone' da Google.")
 
 # ----------------------------
 # Creazione nuova tabella
 # ----------------------------
-listone_fantacalcio.columns = listone_fantacalcio.iloc[0]
-listone_fantacalcio = listone_fantacalcio[1:]
-
-old_appoggio_listone['priorita'] = 0
-listone_fantacalcio['priorita'] = 1
-nuovo_appoggio_listone = pd.concat([old_appoggio_listone, listone_fantacalcio])
-nuovo_appoggio_listone.sort_values(by=['priorita'], inplace=True, ascending=False)
-nuovo_appoggio_listone.drop_duplicates(subset=['Nome'], inplace=True)
-appoggio = nuovo_appoggio_listone
-
-rows = worksheet_listone.get_all_values()
-header_row_index = next(i for i, row in enumerate(rows) if any(cell.strip() for cell in row))
-header = rows[header_row_index]
-data_rows = rows[header_row_index + 1:]
-listone = pd.DataFrame(data_rows, columns=header)
-
-new_test = appoggio.merge(listone, left_on="Nome", right_on="Calciatore", how="left")
-
-new_test.loc[:, ['Detentore Cartellino_y', 'Squadra Attuale_y', 'Tipo Contratto_y']] = \
-    new_test[['Detentore Cartellino_y', 'Squadra Attuale_y', 'Tipo Contratto_y']].fillna('Svincolato')
-new_test.loc[:, ['Detentore Cartellino_y', 'Squadra Attuale_y', 'Tipo Contratto_y']] = \
-    new_test[['Detentore Cartellino_y', 'Squadra Attuale_y', 'Tipo Contratto_y']].replace('/', 'Svincolato')
-new_test['Costo_y'].replace('', np.nan, inplace=True)
-new_test.loc[:, 'Costo_y'] = new_test['Costo_y'].fillna(0).replace('/', 0)
-
-
-new_test = new_test[['Nome', 'RM', 'Squadra', 'Detentore Cartellino_y', 'Squadra Attuale_y', 'Costo_y', 'Tipo Contratto_y', 'Qt.A M', 'priorita']]
-new_test = new_test.rename(columns={
-    'RM': 'ruolo',
-    'Nome': 'nome',
-    'Squadra': 'club',
-    'Detentore Cartellino_y': 'detentore_cartellino',
-    'Squadra Attuale_y': 'squadra_att',
-    'Costo_y': 'costo',
-    'Tipo Contratto_y': 'tipo_contratto',
-    'Qt.A M': 'quot_att_mantra',
-    "priotità": "priotità"
-})
-logger.info("✅ Modifiche implementate nella nuova tabella.")
+def trasforma(listone_scaricato, fogli):
+    """2️⃣ (new_test, nuovo_appoggio_listone), None se il listone è invariato"""
+    listone_fantacalcio, _ = listone_scaricato
+    if listone_fantacalcio is None:
+        return None
+    _, old_appoggio_listone, listone = fogli
+
+    old_appoggio_listone['priorita'] = 0
+    listone_fantacalcio['priorita'] = 1
+    nuovo_appoggio_listone = pd.concat([old_appoggio_listone, listone_fantacalcio])
+    nuovo_appoggio_listone.sort_values(by=['priorita'], inplace=True, ascending=False)
+    nuovo_appoggio_listone.drop_duplicates(subset=['Nome'], inplace=True)
+    appoggio = nuovo_appoggio_listone
+
+    new_test = appoggio.merge(listone, left_on="Nome", right_on="Calciatore", how="left")
+
+    new_test.loc[:, ['Detentore Cartellino_y', 'Squadra Attuale_y', 'Tipo Contratto_y']] = \
+        new_test[['Detentore Cartellino_y', 'Squadra Attuale_y', 'Tipo Contratto_y']].fillna('Svincolato')
+    new_test.loc[:, ['Detentore Cartellino_y', 'Squadra Attuale_y', 'Tipo Contratto_y']] = \
+        new_test[['Detentore Cartellino_y', 'Squadra Attuale_y', 'Tipo Contratto_y']].replace('/', 'Svincolato')
+    new_test['Costo_y'].replace('', np.nan, inplace=True)
+    new_test.loc[:, 'Costo_y'] = new_test['Costo_y'].fillna(0).replace('/', 0)
+
+
+    new_test = new_test[['Nome', 'RM', 'Squadra', 'Detentore Cartellino_y', 'Squadra Attuale_y', 'Costo_y', 'Tipo Contratto_y', 'Qt.A M', 'priorita']]
+    new_test = new_test.rename(columns={
+        'RM': 'ruolo',
+        'Nome': 'nome',
+        'Squadra': 'club',
+        'Detentore Cartellino_y': 'detentore_cartellino',
+        'Squadra Attuale_y': 'squadra_att',
+        'Costo_y': 'costo',
+        'Tipo Contratto_y': 'tipo_contratto',
+        'Qt.A M': 'quot_att_mantra',
+        "priotità": "priotità"
+    })
+    logger.info("✅ Modifiche implementate nella nuova tabella.")
+
+    # ----------------------------
+    # Pulizia downloads (la sessione Fantacalcio in cache resta per il prossimo run)
+    # ----------------------------
+    if os.path.exists(target_file):
+        os.remove(target_file)
+    return new_test, nuovo_appoggio_listone
 
-# ----------------------------
-# Upload su Google Sheets
-# ----------------------------
-worksheet_test.clear()
-set_with_dataframe(worksheet_test, new_test)
-worksheet.clear()
-set_with_dataframe(worksheet, nuovo_appoggio_listone)
-logger.info("✅ Modifiche caricate nel Google Sheet.")
 
 # ----------------------------
-# Pulizia downloads
+# Load: Supabase dal DataFrame in memoria, Google Sheets in parallelo
 # ----------------------------
-shutil.rmtree(download_dir, ignore_errors=True)
+def carica_supabase(tabelle):
+    """Carica new_test su giocatore (tipi Postgres, UPDATE che copia anche i NULL come prima)"""
+    if tabelle is None:
+        return None
+    new_test, _ = tabelle
+    with pool.connessione() as conn:
+        carica_giocatori_bulk(conn, new_test, sovrascrivi_null=True)
+    logger.info(f"✅ Dati reinseriti con successo in Supabase ({len(new_test)} giocatori).")
+
+
+def scrivi_sheets(fogli, tabelle):
+    if tabelle is None:
+        return None
+    new_test, nuovo_appoggio_listone = tabelle
+    sink = SheetsSink(fogli[0])
+    sink.scrivi("Supabase", new_test)
+    sink.scrivi("Appoggio_listone", nuovo_appoggio_listone)
+    riepilogo = sink.flush()
+    logger.info("✅ Modifiche caricate nel Google Sheet.")
+    return riepilogo
+
 
-# ----------------------------
-# Load in Supabase
-# ----------------------------
 db_password = os.environ.get("SUPABASE_PASSWORD")
 if not db_password:
     raise RuntimeError("❌ Variabile d'ambiente SUPABASE_PASSWORD non trovata")
 
-conn = psycopg2.connect(
-    host="aws-1-eu-central-1.pooler.supabase.com",
-    port=6543,
-    dbname="postgres",
-    user="postgres.vhowswomnwhbfdpslsep",
-    password=db_password
-)
-cur = conn.cursor()
-
-rows = worksheet_test.get_all_values()
-header_row_index = next(i for i, row in enumerate(rows) if any(cell.strip() for cell in row))
-header = rows[header_row_index]
-data_rows = rows[header_row_index + 1:]
-df = pd.DataFrame(data_rows, columns=header)
-df = df.map(lambda x: None if x is None or str(x).strip() == "" else x)
-
-for _, row in df.iterrows():
-    valore = row.get("ruolo")
-    if valore is None:
-        ruoli = None
-    else:
-        valore = valore.replace("\n", ";")
-        ruoli = [v.strip() for v in valore.split(";") if v.strip()]
-    
-    # Prova UPDATE prima
-    cur.execute(
-    """
-    UPDATE giocatore SET
-        squadra_att = %s,
-        detentore_cartellino = %s,
-        club = %s,
-        quot_att_mantra = %s,
-        tipo_contratto = %s,
-        ruolo = %s::ruolo_mantra[],
-        costo = %s,
-        priorita = %s
-    WHERE nome = %s;
-    """,
-    (
-        row.get("squadra_att"),
-        row.get("detentore_cartellino"),
-        row.get("club"),
-        row.get("quot_att_mantra"),
-        row.get("tipo_contratto"),
-        ruoli,
-        row.get("costo"),
-        row.get("priorita"),
-        row.get("nome"),
-    )
-    )
-    
-    # Se nessuna riga aggiornata, INSERT nuovo record
-    if cur.rowcount == 0:
-        cur.execute(
-        """
-        INSERT INTO giocatore (
-            nome,
-            squadra_att,
-            detentore_cartellino,
-            club,
-            quot_att_mantra,
-            tipo_contratto,
-            ruolo,
-            costo,
-            priorita
-        )
-        VALUES (%s, %s, %s, %s, %s, %s, %s::ruolo_mantra[], %s, %s);
-        """,
-        (
-            row.get("nome"),
-            row.get("squadra_att"),
-            row.get("detentore_cartellino"),
-            row.get("club"),
-            row.get("quot_att_mantra"),
-            row.get("tipo_contratto"),
-            ruoli,
-            row.get("costo"),
-            row.get("priorita")
-    )
-)
-conn.commit()
-cur.close()
-conn.close()
-logger.info("✅ Dati reinseriti con successo in Supabase.")
+pool = pool_supabase()
+
+# Tutto il run è una pipeline: anche download, letture dei fogli e trasformazione finiscono
+# nel report, che viene scritto pure quando il listone è invariato o il download fallisce
+etl = Pipeline(NOME_ETL)
+etl.stadio("listone", scarica_con_retry)
+etl.stadio("fogli_google", leggi_fogli, dipende_da=["listone"])
+etl.stadio("trasforma", trasforma, dipende_da=["listone", "fogli_google"])
+etl.stadio("supabase", carica_supabase, dipende_da=["trasforma"])
+if SCRIVI_SHEETS:
+    etl.stadio("sheets", scrivi_sheets, dipende_da=["fogli_google", "trasforma"])
+try:
+    risultati = etl.esegui()
+finally:
+    scrivi_report(etl.report())
+etl.stampa_timeline()
+
+listone_fantacalcio, sha_listone = risultati["listone"]
+if listone_fantacalcio is None:
+    logger.info("⏸️ STATO: invariato — listone identico all'ultimo run riuscito, nessuna elaborazione.")
+    pool.chiudi()
+    sys.exit(0)
+
+stampa_riepilogo_query(pool)
+pool.chiudi()
+segna_listone_caricato(target_file, sha_listone, NOME_ETL)
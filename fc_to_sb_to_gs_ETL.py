@@ -5,406 +5,254 @@ import os
 import time
 import warnings
 import logging
-import shutil
 import pandas as pd
-import psycopg2
-import requests
 import gspread
-from gspread_dataframe import set_with_dataframe
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
+from db import pool_supabase, stampa_riepilogo_query
+from giocatori import carica_giocatori_bulk
+from normalizzazione import normalizza_null
+from trasformazione import COLONNE_LISTONE, trasforma_listone, rileva_modifiche
+from lotti import DIMENSIONE_LOTTO, esegui_lotti
+from pipeline import Pipeline
+from metriche import annota, scrivi_report
+from listone import scarica_listone_file, listone_gia_caricato, segna_listone_caricato, leggi_listone
+from etl_listone import (
+    SUPABASE_TABLE,
+    SUPABASE_TABLE_CREDITI,
+    SUPABASE_TABLE_MOVIMENTI,
+    SUPABASE_TABLE_ASTE,
+    FANTACALCIO_USERNAME,
+    FANTACALCIO_PASSWORD,
+    GOOGLE_CREDENTIALS_PATH,
+    TARGET_FILE,
+    NOME_ETL,
+    FORZA_ELABORAZIONE,
+    prepara_ambiente,
+    login_selenium,
+    foglio_listone,
+    foglio_crediti,
+    foglio_mercato,
+    scrivi_fogli,
+)
+from transfermarket_project.ingest import ingest
+from transfermarket_project.arricchimento import arricchisci
 import sys
 sys.stdout.reconfigure(line_buffering=True)
 
 warnings.filterwarnings("ignore")
 
 # === CONFIGURAZIONE DA ENV / SECRETS ===
-SUPABASE_HOST = os.environ.get("SUPABASE_HOST", "aws-1-eu-central-1.pooler.supabase.com")
-SUPABASE_PORT = int(os.environ.get("SUPABASE_PORT", 6543))
-SUPABASE_DB = os.environ.get("SUPABASE_DB", "postgres")
-SUPABASE_USER = os.environ.get("SUPABASE_USER", "postgres.vhowswomnwhbfdpslsep")
-SUPABASE_PASSWORD = os.environ.get("SUPABASE_PASSWORD")  
-SUPABASE_TABLE = os.environ.get("SUPABASE_TABLE", "giocatore")
-SUPABASE_TABLE_CREDITI = os.environ.get("SUPABASE_TABLE_CREDITI", "squadra")
-SUPABASE_TABLE_MOVIMENTI = os.environ.get("SUPABASE_TABLE_MOVIMENTI", "movimenti_squadra")
-SUPABASE_TABLE_ASTE = os.environ.get("SUPABASE_TABLE_ASTE", "asta")
-
-FANTACALCIO_USERNAME = os.environ.get("FANTACALCIO_USERNAME", "mura88")
-FANTACALCIO_PASSWORD = os.environ.get("FANTACALCIO_PASSWORD")  # <- SECRET
-
-# Optional: JSON content for Google credentials (if needed by your pipeline)
-GOOGLE_CREDENTIALS_JSON = os.environ.get("GOOGLE_CREDENTIALS_JSON")  # <- SECRET (raw JSON string)
-GOOGLE_CREDENTIALS_PATH = os.path.join(os.getcwd(), "google_credentials.json")
-if GOOGLE_CREDENTIALS_JSON:
-    with open(GOOGLE_CREDENTIALS_PATH, "w", encoding="utf-8") as f:
-        f.write(GOOGLE_CREDENTIALS_JSON)
-    
-# Controlli minimi sui secrets
-if not SUPABASE_PASSWORD:
-    raise RuntimeError("Missing SUPABASE_PASSWORD environment variable (set as GitHub Secret)")
-if not FANTACALCIO_PASSWORD:
-    raise RuntimeError("Missing FANTACALCIO_PASSWORD environment variable (set as GitHub Secret)")
-
-# === PATHS ===
-DOWNLOAD_DIR = os.path.join(os.getcwd(), "downloads")
-os.makedirs(DOWNLOAD_DIR, exist_ok=True)
-TARGET_FILE = os.path.join(DOWNLOAD_DIR, "listone.xlsx")
-
-# === LOGGING ===
-log_file = os.path.join(os.getcwd(), "log.txt")
-logging.basicConfig(
-    filename=log_file,
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S"
-)
+# Tabelle, credenziali e percorsi condivisi con multi_lega.py: vedi etl_listone.py
+# Arricchimento con i dati Transfermarkt (tabella giocatore_transfermarkt)
+ARRICCHISCI_TRANSFERMARKT = os.environ.get("ARRICCHISCI_TRANSFERMARKT", "1") == "1"
 
 # === FUNZIONE DOWNLOAD LISTONE FANTACALCIO ===
 def scarica_listone():
-    """Scarica il listone Fantacalcio tramite Selenium e Requests"""
-    options = webdriver.ChromeOptions()
-    options.add_argument("--headless=new")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--disable-gpu")
-    options.add_argument("--window-size=1920,1080")
-
-    # Se Chromium è installato in CI, proviamo a usarlo
-    chromium_path = shutil.which("chromium") or shutil.which("chromium-browser") or shutil.which("google-chrome")
-    if chromium_path:
-        options.binary_location = chromium_path
-
-    service = Service(ChromeDriverManager().install())
-    driver = webdriver.Chrome(service=service, options=options)
+    """Scarica il listone Fantacalcio (sessione HTTP in cache, Selenium solo come fallback).
 
-    try:
-        driver.get("https://www.fantacalcio.it/login")
-
-        username_input = WebDriverWait(driver, 20).until(
-            EC.presence_of_element_located((By.NAME, "username"))
-        )
-        password_input = driver.find_element(By.NAME, "password")
-
-        username_input.send_keys(FANTACALCIO_USERNAME)
-        password_input.send_keys(FANTACALCIO_PASSWORD)
-        password_input.send_keys(Keys.RETURN)
-
-        WebDriverWait(driver, 20).until(EC.url_contains("fantacalcio.it"))
-        driver.get("https://www.fantacalcio.it/quotazioni-fantacalcio")
-
-        download_link = WebDriverWait(driver, 20).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "a.download-players-price-serie-a"))
-        )
-        href = download_link.get_attribute("href")
-
-        cookies = driver.get_cookies()
-        session = requests.Session()
-        for c in cookies:
-            session.cookies.set(c["name"], c["value"])
-
-        response = session.get(href)
-        response.raise_for_status()
-        with open(TARGET_FILE, "wb") as f:
-            f.write(response.content)
-    finally:
-        driver.quit()
+    Restituisce (df, sha256); df è None se il listone è identico all'ultimo run riuscito.
+    """
+    metodo, sha = scarica_listone_file(FANTACALCIO_USERNAME, FANTACALCIO_PASSWORD, TARGET_FILE, login_selenium)
+    print(f"✅ Listone scaricato via {metodo} (sha256 {sha[:12]})")
+    annota("metodo", metodo)
+    if listone_gia_caricato(TARGET_FILE, sha, NOME_ETL) and not FORZA_ELABORAZIONE:
+        return None, sha
 
-    df = pd.read_excel(TARGET_FILE, engine="openpyxl", header=1)
-    return df
+    df = leggi_listone(TARGET_FILE, COLONNE_LISTONE)
+    return df, sha
 
 
-# === ETL PROCESS ===
-if __name__ == '__main__':
-    print("📥 Estrazione e trasformazione dati in corso...")
+def scarica_listone_lotti():
+    """Come scarica_listone, ma senza leggerlo: (percorso o None, sha256) per la modalità a lotti"""
+    metodo, sha = scarica_listone_file(FANTACALCIO_USERNAME, FANTACALCIO_PASSWORD, TARGET_FILE, login_selenium)
+    print(f"✅ Listone scaricato via {metodo} (sha256 {sha[:12]})")
+    annota("metodo", metodo)
+    if listone_gia_caricato(TARGET_FILE, sha, NOME_ETL) and not FORZA_ELABORAZIONE:
+        return None, sha
+    return TARGET_FILE, sha
 
-    # 1️⃣ EXTRACT
-    fc = scarica_listone()
-    print(f"✅ Listone Fantacalcio scaricato ({len(fc)} record)")
 
-    conn = psycopg2.connect(
-        host=SUPABASE_HOST,
-        port=SUPABASE_PORT,
-        dbname=SUPABASE_DB,
-        user=SUPABASE_USER,
-        password=SUPABASE_PASSWORD
-    )
-    sb = pd.read_sql(f"SELECT * FROM {SUPABASE_TABLE};", conn)
-    print(f"✅ Tabella Supabase scaricata ({len(sb)} record)")
+# === STADI ETL ===
+def leggi_tabella(query):
+    """Esegue una SELECT su Supabase con una connessione del pool e restituisce il DataFrame"""
+    with pool_supabase().connessione() as conn:
+        return pd.read_sql(query, conn)
 
-    # 2️⃣ TRANSFORM
-    fc['priorita'] = 1
-    sb['priorita'] = 0
-    fc.rename(columns={'Nome': 'nome'}, inplace=True)
-    new_sb = pd.concat([sb[['id', 'nome', 'priorita']], fc[['nome', 'priorita']]])
-    new_sb.sort_values(by=['priorita'], inplace=True, ascending=False)
-    new_sb.drop_duplicates(subset=['nome'], inplace=True)
-    new_sb = new_sb.merge(sb, on='nome', how='left')
-    # Se la tabella sb non aveva priorita_y, proteggiamo
-    if 'priorita_y' in new_sb.columns:
-        new_sb = new_sb.drop('priorita_y', axis=1)
-    if 'priorita_x' in new_sb.columns:
-        new_sb.rename(columns={'priorita_x': 'priorita'}, inplace=True)
-    new_sb.reset_index(drop=True, inplace=True)
-
-    # Cerca colonne id_x/id_y e rimuovile se presenti
-    for col in ['id_x', 'id_y']:
-        if col in new_sb.columns:
-            new_sb = new_sb.drop(col, axis=1)
-
-    # Merge di colonne dal fc (se presenti)
-    merge_cols = [c for c in ['RM', 'Squadra', 'Qt.A M'] if c in fc.columns]
-    if merge_cols:
-        new_sb = new_sb.merge(fc[['nome'] + merge_cols], on='nome', how='left', suffixes=('_sb', '_fc'))
-        if 'RM' in merge_cols:
-            # 🔧 IMPORTANTE: Aggiorna SEMPRE il ruolo da Fantacalcio, non solo se mancante
-            new_sb['ruolo'] = new_sb['RM']
-        if 'Squadra' in merge_cols:
-            # 🔧 IMPORTANTE: Aggiorna SEMPRE il club da Fantacalcio, non solo se mancante
-            new_sb['club'] = new_sb['Squadra']
-        if 'Qt.A M' in merge_cols:
-            # 🔧 IMPORTANTE: Aggiorna la quotazione da Fantacalcio SOLO se presente
-            if 'quot_att_mantra' in new_sb.columns:
-                new_sb['quot_att_mantra'] = new_sb['quot_att_mantra'].where(
-                    new_sb['Qt.A M'].isna(),
-                    new_sb['Qt.A M']
-                )
-            else:
-                new_sb['quot_att_mantra'] = new_sb['Qt.A M']
-        for c in merge_cols:
-            if c in new_sb.columns:
-                new_sb = new_sb.drop(c, axis=1)
-
-    # Pulizia valori mancanti / default
-    for col, default in [
-        ('squadra_att', 'Svincolato'),
-        ('detentore_cartellino', 'Svincolato'),
-        ('tipo_contratto', 'Svincolato'),
-    ]:
-        if col in new_sb.columns:
-            new_sb[col] = new_sb[col].fillna(default)
-
-    if 'costo' in new_sb.columns:
-        new_sb['costo'] = new_sb['costo'].fillna(0)
-    
-    # 🔧 IMPORTANTE: Converti le quotazioni in numerico e gestisci i valori nulli
-    if 'quot_att_mantra' in new_sb.columns:
-        new_sb['quot_att_mantra'] = pd.to_numeric(new_sb['quot_att_mantra'], errors='coerce')
-
-    if 'ruolo' in new_sb.columns:
-        new_sb['ruolo'] = new_sb['ruolo'].astype(str).str.replace('{', '').str.replace('}', '')
 
+def apri_spreadsheet(nome="Test"):
+    """Apre il Google Sheet di destinazione"""
+    if GOOGLE_CREDENTIALS_PATH:
+        gc = gspread.service_account(GOOGLE_CREDENTIALS_PATH)
+    else:
+        # Aggiungi un messaggio di errore nel caso manchi la variabile d'ambiente
+        raise RuntimeError("GOOGLE_CREDENTIALS_JSON not found in environment or path not created.")
+    return gc.open(nome)
+
+
+def stadio_trasforma(listone, sb):
+    """2️⃣ TRANSFORM: None se il listone è invariato rispetto all'ultimo run riuscito"""
+    fc, _ = listone
+    if fc is None:
+        print("⏸️ STATO: invariato — listone identico all'ultimo run riuscito, salto parsing, trasformazione e caricamento")
+        return None
+    print(f"✅ Listone Fantacalcio scaricato ({len(fc)} record)")
+    print(f"✅ Tabella Supabase scaricata ({len(sb)} record)")
+
+    new_sb = trasforma_listone(fc, sb)
     print("✅ Trasformazione completata!")
 
     #=== OUTPUT LOCALE ===
     output_path = os.path.join(os.getcwd(), "output_new_sb.xlsx")
     new_sb.to_excel(output_path, index=False)
     print(f"📁 File salvato localmente in: {output_path}")
+    return new_sb
+
 
-    # 3️⃣ LOAD SU SUPABASE
+def stadio_carica(new_sb, sb):
+    """3️⃣ LOAD SU SUPABASE: solo giocatori nuovi o modificati. Restituisce il frame per il foglio Listone"""
+    if new_sb is None:
+        return None
     print("⬆️ Caricamento su Supabase in corso...")
-    cur = conn.cursor()
 
     # 🔧 Converte stringhe vuote in None (NULL in Postgres)
-    df = new_sb.copy()
-    df = df.map(lambda x: None if x is None or str(x).strip() == "" else x)
-
-    for _, row in df.iterrows():
-        valore = row.get("ruolo")
-
-        if not valore or pd.isna(valore):
-            ruoli = None
-        else:
-            valore = (
-                str(valore)
-                .replace("{", "")
-                .replace("}", "")
-                .replace(";", ",")
-                .replace("\n", ",")
-                .replace(" ", "")
-            )
-
-            ruoli = [v for v in valore.split(",") if v]
-
-        # Prova UPDATE prima (solo i campi con valori)
-        update_fields = []
-        update_values = []
-        
-        # Aggiungi solo i campi che hanno valori
-        if row.get("squadra_att") is not None and not pd.isna(row.get("squadra_att")):
-            update_fields.append("squadra_att = %s")
-            update_values.append(row.get("squadra_att"))
-        
-        if row.get("detentore_cartellino") is not None and not pd.isna(row.get("detentore_cartellino")):
-            update_fields.append("detentore_cartellino = %s")
-            update_values.append(row.get("detentore_cartellino"))
-        
-        if row.get("club") is not None and not pd.isna(row.get("club")):
-            update_fields.append("club = %s")
-            update_values.append(row.get("club"))
-        
-        if row.get("quot_att_mantra") is not None and not pd.isna(row.get("quot_att_mantra")):
-            update_fields.append("quot_att_mantra = %s")
-            update_values.append(row.get("quot_att_mantra"))
-        
-        if row.get("tipo_contratto") is not None and not pd.isna(row.get("tipo_contratto")):
-            update_fields.append("tipo_contratto = %s")
-            update_values.append(row.get("tipo_contratto"))
-        
-        if ruoli is not None:
-            update_fields.append("ruolo = %s::ruolo_mantra[]")
-            update_values.append(ruoli)
-        
-        if row.get("costo") is not None and not pd.isna(row.get("costo")):
-            update_fields.append("costo = %s")
-            update_values.append(row.get("costo"))
-        
-        if row.get("priorita") is not None and not pd.isna(row.get("priorita")):
-            update_fields.append("priorita = %s")
-            update_values.append(row.get("priorita"))
-        
-        # Esegui UPDATE solo se ci sono campi da aggiornare
-        if update_fields:
-            update_query = "UPDATE giocatore SET " + ", ".join(update_fields) + " WHERE nome = %s;"
-            update_values.append(row.get("nome"))
-            cur.execute(update_query, update_values)
-        
-        # Se nessuna riga aggiornata, INSERT nuovo record
-        if cur.rowcount == 0:
-            cur.execute(
-                """
-                INSERT INTO giocatore (
-                    nome,
-                    squadra_att,
-                    detentore_cartellino,
-                    club,
-                    quot_att_mantra,
-                    tipo_contratto,
-                    ruolo,
-                    costo,
-                    priorita
-                )
-                VALUES (%s, %s, %s, %s, %s, %s, %s::ruolo_mantra[], %s, %s);
-                """,
-                (
-                    row.get("nome"),
-                    row.get("squadra_att"),
-                    row.get("detentore_cartellino"),
-                    row.get("club"),
-                    row.get("quot_att_mantra"),
-                    row.get("tipo_contratto"),
-                    ruoli,
-                    row.get("costo"),
-                    row.get("priorita"),
-            )
-        )
-
-    conn.commit()
-    cur.close()
-    conn.close()
-    print("✅ Dati reinseriti con successo: ")
-    print(f"Totale giocatori caricati: {len(new_sb)}")
-
-    if GOOGLE_CREDENTIALS_PATH:
-        gc = gspread.service_account(GOOGLE_CREDENTIALS_PATH)
-    else:
-        # Aggiungi un messaggio di errore nel caso manchi la variabile d'ambiente
-        raise RuntimeError("GOOGLE_CREDENTIALS_JSON not found in environment or path not created.")
-        
-    rename_mapping = {
-        "nome": "Calciatore",
-        "ruolo": "Ruolo",
-        "club": "CSA",
-        "detentore_cartellino": "Detentore Cartellino",
-        "squadra_att": "Squadra Attuale",
-        "costo": "Costo",
-        "tipo_contratto": "Tipo Contratto",
-        "quot_att_mantra": "Quotazione Attuale",
-        "id": "ID Calciatore"
-    }
-    
-    spreadsheet = gc.open("Test")
-    worksheet = spreadsheet.worksheet("Listone")
-    
-    df.rename(columns=rename_mapping, inplace=True)
-    df['Ruolo'] = df['Ruolo'].astype(str).str.replace('{', '').str.replace('}', '')
-    df.drop(["priorita"], axis=1, inplace=True, errors='ignore')
-    df['ID Calciatore'] = 1
-    
-    worksheet.clear()
-    set_with_dataframe(worksheet, df)
-
-    print("✅ Listone aggiornato nel Google Sheet.")
-
-    # === Aggiorna crediti nel foglio Google Sheet ===
-    print("⬆️ Aggiornamento crediti squadre in Google Sheet...")
-    conn = psycopg2.connect(
-        host=SUPABASE_HOST,
-        port=SUPABASE_PORT,
-        dbname=SUPABASE_DB,
-        user=SUPABASE_USER,
-        password=SUPABASE_PASSWORD
+    df = normalizza_null(new_sb)
+
+    # 🔎 Rilevamento modifiche: su Supabase vanno solo inserimenti e aggiornamenti
+    da_caricare, riepilogo = rileva_modifiche(df, sb)
+    annota("riepilogo", riepilogo)
+    print(
+        f"🔎 Modifiche rilevate: {riepilogo['inserimenti']} nuovi, "
+        f"{riepilogo['aggiornamenti']} aggiornati, {riepilogo['invariati']} invariati"
     )
-    sbc = pd.read_sql(f"SELECT * FROM {SUPABASE_TABLE_CREDITI};", conn)
-    sbc = sbc[['nome', 'crediti']]
-    sbc.rename(columns={'nome': 'Squadra', 'crediti': 'Crediti'}, inplace=True)    
-    conn.close()
-    worksheet_crediti = spreadsheet.worksheet("Nuova_Crediti")    
-    worksheet_crediti.clear()
-    set_with_dataframe(worksheet_crediti, sbc)
-    print("✅ Crediti squadre aggiornati nel Google Sheet.")
-
-# === Aggiorna movimenti mercato nel foglio Google Sheet ===
-    print("⬆️ Aggiornamento movimenti mercato in Google Sheet...")
-    conn = psycopg2.connect(
-        host=SUPABASE_HOST,
-        port=SUPABASE_PORT,
-        dbname=SUPABASE_DB,
-        user=SUPABASE_USER,
-        password=SUPABASE_PASSWORD
-    )
-    sbm = pd.read_sql(f"SELECT * FROM {SUPABASE_TABLE_MOVIMENTI};", conn)
-    sbm = sbm[['data', 'evento', 'stagione']]
-    sbm.rename(columns={'data': 'Data', 'evento': 'Evento', 'stagione': 'Stagione'}, inplace=True)    
-    conn.close()
-    worksheet_movimenti = spreadsheet.worksheet("Mercato")    
-    worksheet_movimenti.clear()
-    set_with_dataframe(worksheet_movimenti, sbm)
-    print("✅ Movimenti mercato aggiornati nel Google Sheet.")
-    
-    # === Aggiorna movimenti mercato nel foglio Google Sheet ===
-    print("⬆️ Aggiornamento tabella aste in Google Sheet...")
-    conn = psycopg2.connect(
-        host=SUPABASE_HOST,
-        port=SUPABASE_PORT,
-        dbname=SUPABASE_DB,
-        user=SUPABASE_USER,
-        password=SUPABASE_PASSWORD
-    )
-    aste = pd.read_sql(f"""
-        SELECT a.*, g.nome as nome_giocatore
-        FROM {SUPABASE_TABLE_ASTE} a
-        LEFT JOIN giocatore g ON a.giocatore = g.id;
-    """, conn)
-    conn.close()
-    worksheet_aste = spreadsheet.worksheet("Durata_Aste")    
-    worksheet_aste.clear()
-    set_with_dataframe(worksheet_aste, aste)
-    print("✅ Durata_Aste aggiornata nel Google Sheet.")
-    
-    print("=== ETL completato con successo ===")
+    for col, n in riepilogo['colonne'].items():
+        print(f"   • {col}: {n} giocatori modificati")
 
+    if len(da_caricare):
+        with pool_supabase().connessione() as conn:
+            carica_giocatori_bulk(conn, da_caricare)
+    else:
+        print("✅ Nessuna modifica da caricare su Supabase")
+    print("✅ Dati reinseriti con successo: ")
+    print(f"Totale giocatori caricati: {len(da_caricare)} su {len(new_sb)}")
+    return df
 
 
+def stadio_lotti(listone, sb):
+    """2️⃣+3️⃣ TRANSFORM e LOAD a lotti di DIMENSIONE_LOTTO giocatori (ETL_LOTTO > 0).
+
+    Il foglio Listone non viene riscritto: richiederebbe il listone intero in memoria.
+    """
+    percorso, _ = listone
+    if percorso is None:
+        print("⏸️ STATO: invariato — listone identico all'ultimo run riuscito, salto trasformazione e caricamento")
+        return None
+    print(f"⬆️ Trasformazione e caricamento a lotti di {DIMENSIONE_LOTTO} giocatori...")
+    output_path = os.path.join(os.getcwd(), "output_new_sb.csv")
+    with pool_supabase().connessione() as conn:
+        riepilogo = esegui_lotti(conn, percorso, sb, DIMENSIONE_LOTTO, output_path)
+    annota("riepilogo", riepilogo)
+    print(
+        f"✅ {riepilogo['righe']} giocatori in {riepilogo['lotti']} lotti: {riepilogo['inseriti']} nuovi, "
+        f"{riepilogo['aggiornati']} aggiornati, {riepilogo['fuori_listone']} usciti dal listone"
+    )
+    print(f"📁 File salvato localmente in: {output_path}")
+    return riepilogo
 
 
+def stadio_transfermarkt():
+    """Ingest Transfermarkt (cache su disco, rigenerato solo se cambia): None se non disponibile"""
+    try:
+        return ingest()
+    except Exception as e:
+        # L'arricchimento è accessorio: senza dati Transfermarkt il resto dell'ETL va avanti
+        print(f"⚠️ Transfermarkt non disponibile, arricchimento saltato: {e}")
+        logging.warning(f"Ingest Transfermarkt fallito: {e}")
+        return None
+
+
+def stadio_arricchisci(new_sb, sb, meta_transfermarkt, _caricato=None):
+    """4️⃣ ENRICH: giocatore -> giocatore_transfermarkt (con il listone invariato usa lo snapshot di giocatore)"""
+    if meta_transfermarkt is None:
+        return None
+    try:
+        # I giocatori fuori dal listone hanno club NaN in new_sb: si parte da sb (club reali)
+        # e il club del listone vale solo dove è noto
+        giocatori = sb[["id", "nome", "club"]]
+        if new_sb is not None:
+            club_listone = new_sb.dropna(subset=["id", "club"]).drop_duplicates(subset="id", keep="last")
+            giocatori = giocatori.assign(
+                club=giocatori["id"].map(club_listone.set_index("id")["club"]).fillna(giocatori["club"])
+            )
+        return arricchisci(pool_supabase().connessione, giocatori, meta_transfermarkt)
+    except Exception as e:
+        print(f"⚠️ Arricchimento Transfermarkt non riuscito: {e}")
+        logging.warning(f"Arricchimento Transfermarkt fallito: {e}")
+        return None
 
 
+# === ETL PROCESS ===
+if __name__ == '__main__':
+    prepara_ambiente()
+    print("📥 Estrazione e trasformazione dati in corso...")
 
+    # Un solo pool condiviso da tutte le fasi su Supabase
+    pool = pool_supabase()
 
+    etl = Pipeline("fc_to_sb_to_gs")
 
+    # 1️⃣ EXTRACT: I/O indipendenti in parallelo (listone, letture Supabase, Google Sheet)
+    # A lotti il listone non viene letto qui e di giocatore servono solo id, nome e club
+    if DIMENSIONE_LOTTO:
+        etl.stadio("listone", scarica_listone_lotti)
+        etl.stadio("giocatori_db", lambda: leggi_tabella(f"SELECT id, nome, club FROM {SUPABASE_TABLE};"))
+    else:
+        etl.stadio("listone", scarica_listone)
+        etl.stadio("giocatori_db", lambda: leggi_tabella(f"SELECT * FROM {SUPABASE_TABLE};"))
+    etl.stadio("crediti_db", lambda: leggi_tabella(f"SELECT * FROM {SUPABASE_TABLE_CREDITI};"))
+    etl.stadio("movimenti_db", lambda: leggi_tabella(f"SELECT * FROM {SUPABASE_TABLE_MOVIMENTI};"))
+    etl.stadio("aste_db", lambda: leggi_tabella(f"""
+        SELECT a.*, g.nome as nome_giocatore
+        FROM {SUPABASE_TABLE_ASTE} a
+        LEFT JOIN giocatore g ON a.giocatore = g.id;
+    """))
+    etl.stadio("spreadsheet", apri_spreadsheet)
+    if ARRICCHISCI_TRANSFERMARKT:
+        etl.stadio("transfermarkt", stadio_transfermarkt)
+
+    if DIMENSIONE_LOTTO:
+        # 2️⃣+3️⃣ TRANSFORM e LOAD a lotti (memoria costante); il foglio Listone resta com'è
+        etl.stadio("trasforma", lambda: None)
+        etl.stadio("carica_supabase", stadio_lotti, dipende_da=["listone", "giocatori_db"])
+        etl.stadio("foglio_listone", lambda: None)
+    else:
+        # 2️⃣ TRANSFORM
+        etl.stadio("trasforma", stadio_trasforma, dipende_da=["listone", "giocatori_db"])
+
+        # 3️⃣ LOAD (Supabase, poi i fogli Google in un'unica scrittura)
+        etl.stadio("carica_supabase", stadio_carica, dipende_da=["trasforma", "giocatori_db"])
+        etl.stadio("foglio_listone", foglio_listone, dipende_da=["carica_supabase"])
+    etl.stadio("foglio_crediti", foglio_crediti, dipende_da=["crediti_db"])
+    etl.stadio("foglio_mercato", foglio_mercato, dipende_da=["movimenti_db"])
+    etl.stadio("sheets", scrivi_fogli, dipende_da=[
+        "spreadsheet", "foglio_listone", "foglio_crediti", "foglio_mercato", "aste_db"
+    ])
+
+    # 4️⃣ ENRICH: dopo il LOAD. Il DDL della tabella laterale (FK su giocatore) prende un lock
+    # SHARE ROW EXCLUSIVE su giocatore che si scontrerebbe con il caricamento; in parallelo
+    # restano i fogli Google
+    if ARRICCHISCI_TRANSFERMARKT:
+        etl.stadio("arricchisci", stadio_arricchisci, dipende_da=[
+            "trasforma", "giocatori_db", "transfermarkt", "carica_supabase"
+        ])
 
+    try:
+        risultati = etl.esegui()
+    finally:
+        scrivi_report(etl.report())
+    etl.stampa_timeline()
+
+    fc, sha_listone = risultati["listone"]
+    if fc is not None:
+        segna_listone_caricato(TARGET_FILE, sha_listone, NOME_ETL)
+    stampa_riepilogo_query(pool)
+    pool.chiudi()
+    print("=== ETL completato con successo ===")
@@ -0,0 +1,134 @@
+# Caricamento della tabella giocatore condiviso dai due ETL
+# Entrambi caricano dal DataFrame in memoria (niente passaggio da Google Sheets):
+# colonne tipizzate come in Postgres, staging in tabella temporanea e UPDATE/INSERT set-based.
+# Le righe sono abbinate a giocatore per id (vedi identita.py), non per nome grezzo.
+
+import os
+import time
+
+import pandas as pd
+from psycopg2.extras import execute_values
+
+from identita import RisolutoreGiocatori, chiave_riga
+from normalizzazione import normalizza_testo, normalizza_ruoli
+
+SUPABASE_TABLE = os.environ.get("SUPABASE_TABLE", "giocatore")
+
+COLONNE_LOAD = [
+    "nome",
+    "squadra_att",
+    "detentore_cartellino",
+    "club",
+    "quot_att_mantra",
+    "tipo_contratto",
+    "ruolo",
+    "costo",
+    "priorita",
+]
+
+# Colonne integer su giocatore
+COLONNE_NUMERICHE = ["quot_att_mantra", "costo", "priorita"]
+
+
+def parse_ruoli(valore):
+    """Converte la stringa ruolo (es. 'Dc;E') nella lista per il cast ruolo_mantra[] (un valore alla volta)"""
+    if not valore or pd.isna(valore):
+        return None
+    valore = (
+        str(valore)
+        .replace("{", "")
+        .replace("}", "")
+        .replace(";", ",")
+        .replace("\n", ",")
+        .replace(" ", "")
+    )
+    return [v for v in valore.split(",") if v]
+
+
+def tipizza_giocatori(df):
+    """Colonne di COLONNE_LOAD con i tipi di giocatore: Int64 per i numeri, testo senza spazi o None"""
+    out = df.reindex(columns=COLONNE_LOAD).copy()
+    for col in COLONNE_LOAD:
+        if col in COLONNE_NUMERICHE:
+            out[col] = pd.to_numeric(out[col], errors="coerce").round().astype("Int64")
+        elif col != "ruolo":
+            out[col] = normalizza_testo(out[col])
+    out = out.astype(object)
+    return out.where(out.notna(), None)
+
+
+def risolvi_id(cur, df, tabella=SUPABASE_TABLE):
+    """id di giocatore per le righe di df, dal risolutore costruito sulla tabella attuale"""
+    cur.execute(f"SELECT id, nome, club FROM {tabella};")
+    sb = pd.DataFrame(cur.fetchall(), columns=["id", "nome", "club"])
+    club = df["club"] if "club" in df.columns else None
+    return RisolutoreGiocatori(sb).risolvi(df["nome"], club)
+
+
+def carica_giocatori_bulk(conn, df, sovrascrivi_null=False, tabella=SUPABASE_TABLE):
+    """Carica il listone su giocatore in modo set-based: staging in tabella temporanea + UPDATE/INSERT.
+
+    Le righe con id aggiornano quel giocatore (nome compreso); se df non ha la colonna id
+    gli id vengono risolti qui per nome normalizzato + club. Le righe senza id sono giocatori
+    nuovi e vengono inserite. Di default i campi NULL non sovrascrivono i valori esistenti
+    (COALESCE); con sovrascrivi_null=True l'UPDATE copia anche i NULL. tabella permette di
+    caricare la tabella giocatore di un'altra lega.
+    """
+    with conn.cursor() as cur:
+        ids = df["id"] if "id" in df.columns else risolvi_id(cur, df, tabella)
+    righe = tipizza_giocatori(df)
+    righe.insert(0, "id", pd.array(ids, dtype="Int64"))
+    # A parità di giocatore (id, o nome normalizzato se nuovo) vale l'ultima riga
+    righe = righe[~chiave_riga(righe).duplicated(keep="last")]
+    righe["ruolo"] = normalizza_ruoli(righe["ruolo"])
+    righe = righe.astype(object)
+    valori = righe.where(righe.notna(), None).values.tolist()
+
+    colonne = ", ".join(COLONNE_LOAD)
+    if sovrascrivi_null:
+        set_clause = ",\n            ".join(f"{c} = s.{c}" for c in COLONNE_LOAD)
+    else:
+        set_clause = ",\n            ".join(f"{c} = COALESCE(s.{c}, g.{c})" for c in COLONNE_LOAD)
+
+    with conn.cursor() as cur:
+        # Staging: tabella temporanea con gli stessi tipi di giocatore (ruolo incluso)
+        t0 = time.perf_counter()
+        cur.execute(
+            f"CREATE TEMP TABLE giocatore_stage ON COMMIT DROP AS "
+            f"SELECT id, {colonne} FROM {tabella} WITH NO DATA;"
+        )
+        execute_values(
+            cur,
+            f"INSERT INTO giocatore_stage (id, {colonne}) VALUES %s",
+            valori,
+            template="(%s, %s, %s, %s, %s, %s, %s, %s::ruolo_mantra[], %s, %s)",
+            page_size=1000,
+        )
+        print(f"⏱️ Staging: {len(valori)} righe in {time.perf_counter() - t0:.2f}s")
+
+        # UPDATE set-based dei giocatori già presenti, per chiave primaria
+        t0 = time.perf_counter()
+        cur.execute(
+            f"""
+            UPDATE {tabella} g SET
+            {set_clause}
+            FROM giocatore_stage s
+            WHERE g.id = s.id;
+            """
+        )
+        print(f"⏱️ UPDATE: {cur.rowcount} righe in {time.perf_counter() - t0:.2f}s")
+
+        # INSERT dei giocatori nuovi (id dalla sequenza)
+        t0 = time.perf_counter()
+        cur.execute(
+            f"""
+            INSERT INTO {tabella} ({colonne})
+            SELECT {colonne} FROM giocatore_stage s
+            WHERE s.id IS NULL;
+            """
+        )
+        print(f"⏱️ INSERT: {cur.rowcount} righe in {time.perf_counter() - t0:.2f}s")
+
+    t0 = time.perf_counter()
+    conn.commit()
+    print(f"⏱️ COMMIT in {time.perf_counter() - t0:.2f}s")
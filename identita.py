@@ -0,0 +1,63 @@
+# Identità dei giocatori: nome normalizzato (+ club) -> giocatore.id
+# Il listone e i fogli scrivono i nomi con accenti e spazi non sempre uguali a quelli in
+# giocatore ("Kouamè" / "Kouamé", "Martinez  L."): confrontando le stringhe grezze ogni
+# variante diventava una riga nuova. Il risolutore indicizza lo snapshot di giocatore per
+# nome normalizzato (stessa pulizia del matching Transfermarkt) e club, così dedup e LOAD
+# lavorano per id.
+
+import pandas as pd
+
+from normalizzazione import pulisci_serie
+
+SEPARATORE = "\x1f"
+
+
+def chiave_nome(serie):
+    """Nome confrontabile: minuscolo, senza accenti, spazi interni compattati"""
+    return pulisci_serie(serie).str.split().str.join(" ")
+
+
+class RisolutoreGiocatori:
+    """Indice in memoria nome normalizzato + club -> id, costruito da uno snapshot di giocatore.
+
+    Un nome trova il suo id con la coppia (nome, club); se il club non torna (trasferimento)
+    basta il nome, purché in giocatore corrisponda a un solo id.
+    """
+
+    def __init__(self, sb):
+        righe = sb.dropna(subset=["id"])
+        ids = righe["id"].astype("int64").to_numpy()
+        nomi = chiave_nome(righe["nome"]).to_numpy()
+        club = chiave_nome(righe["club"]).to_numpy() if "club" in righe.columns else [""] * len(righe)
+        coppie = pd.DataFrame({"id": ids, "nome": nomi, "club": club})
+
+        # Varianti dello stesso giocatore già presenti in tabella: vince l'id più basso
+        per_coppia = coppie.groupby(["nome", "club"])["id"].agg(["min", "size"])
+        self.doppioni = per_coppia[per_coppia["size"] > 1]
+        self._per_coppia = {
+            f"{n}{SEPARATORE}{c}": i for (n, c), i in per_coppia["min"].items()
+        }
+        # Solo i nomi che identificano un unico giocatore
+        per_nome = coppie.drop_duplicates(subset=["nome", "club"]).groupby("nome")["id"].agg(["min", "size"])
+        self._per_nome = per_nome.loc[per_nome["size"] == 1, "min"].to_dict()
+
+        if len(self.doppioni):
+            print(f"⚠️ giocatore contiene {int(self.doppioni['size'].sum())} righe con nome+club ripetuto "
+                  f"({len(self.doppioni)} giocatori): uso l'id più basso")
+
+    def risolvi(self, nomi, club=None):
+        """id (Int64, <NA> se il giocatore è nuovo o ambiguo) per ogni nome, allineato all'indice di nomi"""
+        chiavi = chiave_nome(nomi)
+        per_nome = chiavi.map(self._per_nome)
+        if club is None:
+            return per_nome.astype("Int64")
+        coppie = chiavi + SEPARATORE + chiave_nome(club)
+        return coppie.map(self._per_coppia).fillna(per_nome).astype("Int64")
+
+    def __len__(self):
+        return len(self._per_coppia)
+
+
+def chiave_riga(df):
+    """Chiave di dedup: l'id se noto, altrimenti il nome normalizzato"""
+    return df["id"].astype("string").fillna("n:" + chiave_nome(df["nome"]))
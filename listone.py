@@ -0,0 +1,413 @@
+# Estrazione listone Fantacalcio condivisa dai due ETL
+# Percorso veloce: sessione HTTP (requests) con cookie salvati su disco e riusati tra i run.
+# Selenium resta solo come fallback quando la sessione in cache viene rifiutata.
+# Il file scaricato è tenuto in cache per hash (downloads/listone_cache) con GET condizionali.
+
+import os
+import re
+import json
+import time
+import html
+import shutil
+import hashlib
+from urllib.parse import urljoin
+
+import pandas as pd
+import requests
+
+import metriche
+
+LOGIN_URL = os.environ.get("FANTACALCIO_LOGIN_URL", "https://www.fantacalcio.it/login")
+QUOTAZIONI_URL = "https://www.fantacalcio.it/quotazioni-fantacalcio"
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+
+# Durata dei cookie in cache (secondi), oltre la quale si rifà il login
+SESSION_TTL = int(os.environ.get("FANTACALCIO_SESSION_TTL", 12 * 3600))
+
+_LINK_RE = re.compile(r"<a\b[^>]*\bdownload-players-price-serie-a\b[^>]*>", re.IGNORECASE)
+_HREF_RE = re.compile(r"""href\s*=\s*["']([^"']+)["']""", re.IGNORECASE)
+_INPUT_RE = re.compile(r"<input\b[^>]*>", re.IGNORECASE)
+_ATTR_RE = re.compile(r"""(\w[\w-]*)\s*=\s*["']([^"']*)["']""")
+
+
+class SessioneRifiutata(Exception):
+    """La sessione HTTP non è (più) autenticata su Fantacalcio"""
+
+
+# === CACHE SESSIONE ===
+def carica_sessione(cache_path):
+    """Ricostruisce una requests.Session dai cookie in cache, se presenti e non scaduti"""
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            dati = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if dati.get("scadenza", 0) < time.time():
+        return None
+
+    session = _nuova_sessione()
+    for c in dati.get("cookies", []):
+        session.cookies.set(c["name"], c["value"], domain=c.get("domain", ""), path=c.get("path", "/"))
+    return session
+
+
+def salva_sessione(session, cache_path, ttl=SESSION_TTL):
+    """Salva su disco i cookie della sessione con la relativa scadenza"""
+    dati = _leggi_cache(cache_path)
+    dati["scadenza"] = time.time() + ttl
+    dati["cookies"] = [
+        {"name": c.name, "value": c.value, "domain": c.domain, "path": c.path}
+        for c in session.cookies
+    ]
+    _scrivi_cache(cache_path, dati)
+
+
+def invalida_sessione(cache_path):
+    """Segna come scaduti i cookie in cache (mantiene lo storico dei tempi)"""
+    dati = _leggi_cache(cache_path)
+    if dati:
+        dati["scadenza"] = 0
+        _scrivi_cache(cache_path, dati)
+
+
+def _leggi_cache(cache_path):
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _scrivi_cache(cache_path, dati):
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+    tmp = cache_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(dati, f)
+    os.replace(tmp, cache_path)
+
+
+def _conta_risposta(risposta, *args, **kwargs):
+    """Hook requests: richieste e byte scaricati per le metriche dello stadio"""
+    metriche.conta("chiamate_http")
+    metriche.conta("byte_scaricati", len(risposta.content))
+
+
+def _nuova_sessione():
+    session = requests.Session()
+    session.headers.update({"User-Agent": USER_AGENT})
+    session.hooks["response"].append(_conta_risposta)
+    return session
+
+
+def sessione_da_cookies(cookies):
+    """Crea una requests.Session dai cookie di Selenium (driver.get_cookies())"""
+    session = _nuova_sessione()
+    for c in cookies:
+        session.cookies.set(c["name"], c["value"], domain=c.get("domain", ""), path=c.get("path", "/"))
+    return session
+
+
+# === PERCORSO HTTP ===
+def login_http(username, password, timeout=20):
+    """Login su Fantacalcio con una semplice POST del form (campi username/password + hidden)"""
+    session = _nuova_sessione()
+    pagina = session.get(LOGIN_URL, timeout=timeout)
+    pagina.raise_for_status()
+
+    payload = {}
+    for tag in _INPUT_RE.findall(pagina.text):
+        attr = dict(_ATTR_RE.findall(tag))
+        if attr.get("type", "").lower() == "hidden" and attr.get("name"):
+            payload[attr["name"]] = html.unescape(attr.get("value", ""))
+    payload["username"] = username
+    payload["password"] = password
+
+    risposta = session.post(LOGIN_URL, data=payload, timeout=timeout, allow_redirects=True)
+    risposta.raise_for_status()
+    return session
+
+
+def trova_link_download(session, timeout=20):
+    """Legge l'href di a.download-players-price-serie-a dalla pagina quotazioni"""
+    risposta = session.get(QUOTAZIONI_URL, timeout=timeout)
+    risposta.raise_for_status()
+    tag = _LINK_RE.search(risposta.text)
+    href = _HREF_RE.search(tag.group(0)) if tag else None
+    if not href:
+        raise SessioneRifiutata("Link di download del listone non trovato")
+    return urljoin(QUOTAZIONI_URL, html.unescape(href.group(1)))
+
+
+def scarica_file(session, href, target_file, verifica_xlsx=True, timeout=60):
+    """Download condizionale del listone (ETag / Last-Modified) con cache per hash del contenuto.
+
+    Con verifica_xlsx controlla che sia davvero un file Excel (xlsx = archivio zip).
+    Restituisce lo sha256 del contenuto scritto in target_file.
+    """
+    cache_dir = _cache_dir(target_file)
+    meta = _leggi_cache(os.path.join(cache_dir, "meta.json"))
+    in_cache = os.path.join(cache_dir, f"{meta.get('sha256')}.xlsx")
+
+    headers = {}
+    if meta.get("sha256") and os.path.exists(in_cache):
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    risposta = session.get(href, headers=headers, timeout=timeout)
+    if risposta.status_code == 304:
+        print("📦 Listone non modificato (304): uso la copia in cache")
+        shutil.copyfile(in_cache, target_file)
+        return meta["sha256"]
+    risposta.raise_for_status()
+    if verifica_xlsx and not risposta.content.startswith(b"PK"):
+        raise SessioneRifiutata("Il download non è un file Excel (sessione non autenticata?)")
+
+    sha = hashlib.sha256(risposta.content).hexdigest()
+    with open(target_file, "wb") as f:
+        f.write(risposta.content)
+    _salva_in_cache(cache_dir, sha, target_file)
+
+    meta.update({
+        "sha256": sha,
+        "etag": risposta.headers.get("ETag"),
+        "last_modified": risposta.headers.get("Last-Modified"),
+        "scaricato": time.time(),
+    })
+    _scrivi_cache(os.path.join(cache_dir, "meta.json"), meta)
+    return sha
+
+
+def _cache_dir(target_file):
+    return os.path.join(os.path.dirname(target_file), "listone_cache")
+
+
+def _salva_in_cache(cache_dir, sha, target_file, da_tenere=3):
+    """Copia il file nella cache per hash e tiene solo le versioni più recenti"""
+    os.makedirs(cache_dir, exist_ok=True)
+    destinazione = os.path.join(cache_dir, f"{sha}.xlsx")
+    if not os.path.exists(destinazione):
+        shutil.copyfile(target_file, destinazione)
+    os.utime(destinazione)
+    versioni = sorted(
+        (os.path.join(cache_dir, f) for f in os.listdir(cache_dir) if f.endswith(".xlsx")),
+        key=os.path.getmtime,
+        reverse=True,
+    )
+    for vecchia in versioni[da_tenere:]:
+        os.remove(vecchia)
+
+
+def listone_gia_caricato(target_file, sha, nome_etl):
+    """True se il listone con questo hash è lo stesso dell'ultimo run riuscito dell'ETL"""
+    meta = _leggi_cache(os.path.join(_cache_dir(target_file), "meta.json"))
+    return meta.get("caricati", {}).get(nome_etl) == sha
+
+
+def segna_listone_caricato(target_file, sha, nome_etl):
+    """Registra l'hash del listone elaborato con successo dall'ETL"""
+    meta_path = os.path.join(_cache_dir(target_file), "meta.json")
+    meta = _leggi_cache(meta_path)
+    meta.setdefault("caricati", {})[nome_etl] = sha
+    _scrivi_cache(meta_path, meta)
+
+
+# === ORCHESTRAZIONE ===
+def scarica_listone_file(username, password, target_file, login_selenium, cache_path=None):
+    """Scarica il listone in target_file provando, in ordine:
+
+    1. i cookie in cache su disco;
+    2. un login HTTP puro con requests;
+    3. il login Selenium (``login_selenium()`` deve restituire ``(cookies, href)``).
+
+    I cookie della sessione riuscita vengono salvati in cache.
+    Restituisce ``(metodo, sha256)`` del contenuto scaricato.
+    """
+    cache_path = cache_path or os.path.join(os.path.dirname(target_file), "fc_session.json")
+    tempi = {}
+
+    tentativi = [
+        ("cache", lambda: carica_sessione(cache_path)),
+        ("http", lambda: login_http(username, password)),
+    ]
+    for metodo, crea_sessione in tentativi:
+        t0 = time.perf_counter()
+        try:
+            session = crea_sessione()
+            if session is None:
+                print("ℹ️ Nessuna sessione Fantacalcio valida in cache")
+                continue
+            href = trova_link_download(session)
+            sha = scarica_file(session, href, target_file)
+        except (SessioneRifiutata, requests.RequestException) as e:
+            tempi[metodo] = time.perf_counter() - t0
+            print(f"⚠️ Estrazione via {metodo} non riuscita: {e}")
+            if metodo == "cache":
+                invalida_sessione(cache_path)
+            continue
+        tempi[metodo] = time.perf_counter() - t0
+        salva_sessione(session, cache_path)
+        _registra_tempi(cache_path, metodo, tempi)
+        return metodo, sha
+
+    # Fallback: browser headless
+    t0 = time.perf_counter()
+    cookies, href = login_selenium()
+    session = sessione_da_cookies(cookies)
+    sha = scarica_file(session, href, target_file, verifica_xlsx=False)
+    tempi["selenium"] = time.perf_counter() - t0
+    salva_sessione(session, cache_path)
+    _registra_tempi(cache_path, "selenium", tempi)
+    return "selenium", sha
+
+
+def _registra_tempi(cache_path, metodo, tempi):
+    """Stampa i tempi di questo run e li confronta con l'ultimo run di ciascun percorso"""
+    dati = _leggi_cache(cache_path)
+    storico = dati.get("tempi", {})
+    for m, t in tempi.items():
+        print(f"⏱️ Estrazione via {m}: {t:.2f}s")
+    storico.update({m: round(t, 3) for m, t in tempi.items() if m == metodo})
+    confronto = ", ".join(f"{m} {t:.2f}s" for m, t in sorted(storico.items()))
+    print(f"⏱️ Ultimo tempo riuscito per percorso: {confronto} (usato: {metodo})")
+    dati["tempi"] = storico
+    _scrivi_cache(cache_path, dati)
+
+
+# === LETTURA LISTONE ===
+# Schema del foglio quotazioni: colonna -> dtype pandas
+SCHEMA_LISTONE = {
+    "Id": "Int64",
+    "R": "object",
+    "RM": "object",
+    "Nome": "object",
+    "Squadra": "object",
+    "Qt.A": "Int64",
+    "Qt.I": "Int64",
+    "Diff.": "Int64",
+    "Qt.A M": "Int64",
+    "Qt.I M": "Int64",
+    "Diff.M": "Int64",
+    "FVM": "Int64",
+    "FVM M": "Int64",
+}
+
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:  # backend opzionale, si ripiega su openpyxl in sola lettura
+    CalamineWorkbook = None
+
+
+def _righe_foglio(percorso, streaming=False):
+    """Itera le righe (tuple di valori) del primo foglio.
+
+    calamine è molto più veloce ma carica il foglio intero in memoria; con streaming=True
+    si usa openpyxl read_only, che legge l'XML man mano (memoria costante, più lento).
+    """
+    if CalamineWorkbook is not None and not streaming:
+        wb = CalamineWorkbook.from_path(percorso)
+        yield from wb.get_sheet_by_index(0).iter_rows()
+        return
+
+    from openpyxl import load_workbook
+
+    wb = load_workbook(percorso, read_only=True, data_only=True)
+    try:
+        yield from wb.worksheets[0].iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def _intestazione(righe, colonne):
+    """Consuma le righe fino all'intestazione (la prima con "Nome"): colonne richieste e loro indici"""
+    for riga in righe:
+        intestazione = [str(v).strip() if v is not None else "" for v in riga]
+        if "Nome" in intestazione:
+            break
+    else:
+        raise ValueError("Intestazione del listone (colonna 'Nome') non trovata")
+    richieste = [c for c in (colonne or intestazione) if c and c in intestazione]
+    return richieste, [intestazione.index(c) for c in richieste]
+
+
+def _tipizza(dati, richieste):
+    df = pd.DataFrame(dati, columns=richieste)
+    for c in richieste:
+        dtype = SCHEMA_LISTONE.get(c, "object")
+        if dtype == "object":
+            df[c] = df[c].map(lambda v: None if v == "" else v)
+        else:
+            df[c] = pd.to_numeric(df[c], errors="coerce").round().astype(dtype)
+    return df
+
+
+def lotti_listone(percorso, colonne=None, dimensione=5000):
+    """Come leggi_listone, ma un DataFrame di al più `dimensione` righe alla volta (generatore).
+
+    Il foglio è letto in streaming: la memoria dipende da `dimensione`, non dal listone.
+    """
+    righe = _righe_foglio(percorso, streaming=True)
+    richieste, indici = _intestazione(righe, colonne)
+    dati = {c: [] for c in richieste}
+    n = 0
+    for riga in righe:
+        if not any(v not in (None, "") for v in riga):
+            continue
+        for c, i in zip(richieste, indici):
+            dati[c].append(riga[i] if i < len(riga) else None)
+        n += 1
+        if n == dimensione:
+            yield _tipizza(dati, richieste)
+            dati = {c: [] for c in richieste}
+            n = 0
+    if n:
+        yield _tipizza(dati, richieste)
+
+
+def leggi_listone(percorso, colonne=None):
+    """Legge il listone quotazioni con lo schema dichiarato, estraendo solo le colonne richieste.
+
+    La riga di intestazione è la prima che contiene "Nome" (sopra c'è il titolo del foglio).
+    Con colonne=None restituisce tutte le colonne del file (tipizzate secondo lo schema se note).
+    """
+    righe = _righe_foglio(percorso)
+    richieste, indici = _intestazione(righe, colonne)
+    dati = {c: [] for c in richieste}
+    for riga in righe:
+        if not any(v not in (None, "") for v in riga):
+            continue
+        for c, i in zip(richieste, indici):
+            dati[c].append(riga[i] if i < len(riga) else None)
+    return _tipizza(dati, richieste)
+
+
+# === MICRO-BENCHMARK ===
+if __name__ == "__main__":
+    import sys
+    import timeit
+
+    percorso = sys.argv[1] if len(sys.argv) > 1 else os.path.join("downloads", "listone.xlsx")
+    usate = ["Nome", "RM", "Squadra", "Qt.A M"]
+    ripetizioni = 5
+
+    attuale = lambda: pd.read_excel(percorso, engine="openpyxl", header=1)
+    veloce = lambda: leggi_listone(percorso, usate)
+
+    t_attuale = min(timeit.repeat(attuale, number=1, repeat=ripetizioni))
+    t_veloce = min(timeit.repeat(veloce, number=1, repeat=ripetizioni))
+
+    atteso = attuale()[usate]
+    ottenuto = veloce()
+    identici = (
+        len(atteso) == len(ottenuto)
+        and atteso["Nome"].tolist() == ottenuto["Nome"].tolist()
+        and (pd.to_numeric(atteso["Qt.A M"]).fillna(-1) == ottenuto["Qt.A M"].astype(float).fillna(-1)).all()
+    )
+    backend = "calamine" if CalamineWorkbook is not None else "openpyxl read_only"
+    print(f"📊 Listone: {percorso} ({len(ottenuto)} righe)")
+    print(f"⏱️ pd.read_excel(openpyxl): {t_attuale * 1000:.1f} ms")
+    print(f"⏱️ leggi_listone ({backend}): {t_veloce * 1000:.1f} ms  (x{t_attuale / t_veloce:.1f})")
+    print(f"✅ Risultati identici: {identici}")
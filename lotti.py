@@ -0,0 +1,277 @@
+# Modalità a lotti dell'ETL listone: memoria costante al crescere dei dati
+# La modalità classica (trasformazione.py) materializza listone, snapshot di giocatore e
+# new_sb interi e li copia più volte (concat, merge, output Excel). Qui il listone arriva a
+# lotti da un generatore (listone.lotti_listone) e ogni lotto viene trasformato e caricato
+# prima di leggere il successivo:
+#   - al posto dei merge con lo snapshot c'è l'indice id <- nome+club (RisolutoreGiocatori),
+#     costruito su id/nome/club soltanto;
+#   - i valori correnti di giocatore non servono in memoria: i NULL del lotto restano NULL e
+#     l'UPDATE li risolve con COALESCE sulla riga per chiave primaria, scrivendo solo le righe
+#     che cambiano davvero (IS DISTINCT FROM);
+#   - i giocatori fuori dal listone (priorita 0) si aggiornano alla fine con un solo UPDATE,
+#     confrontando giocatore con gli id visti, tenuti in una tabella temporanea.
+# Tutti i lotti stanno nella stessa transazione: o si carica tutto il listone o niente.
+#
+# Uso:
+#   python lotti.py benchmark --dsn "host=... dbname=fmm_restore" [--scale 1 10 100]
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+
+import pandas as pd
+from psycopg2.extras import execute_values
+
+from giocatori import SUPABASE_TABLE, COLONNE_LOAD, tipizza_giocatori
+from identita import RisolutoreGiocatori, chiave_riga
+from listone import lotti_listone
+from normalizzazione import normalizza_ruoli
+from trasformazione import COLONNE_LISTONE
+
+# Righe del listone per lotto (0 = modalità classica nell'ETL)
+DIMENSIONE_LOTTO = int(os.environ.get("ETL_LOTTO", 0))
+
+# Default dei giocatori nuovi, come in trasforma_listone
+DEFAULT_NUOVI = {
+    "squadra_att": "Svincolato",
+    "detentore_cartellino": "Svincolato",
+    "tipo_contratto": "Svincolato",
+    "costo": 0,
+}
+
+
+# === TRANSFORM ===
+def trasforma_lotto(fc, risolutore, visti):
+    """Un lotto del listone -> righe di giocatore (id + COLONNE_LOAD), stessa semantica di trasforma_listone.
+
+    visti raccoglie le chiavi (chiave_riga) dei lotti precedenti: un giocatore ripetuto nel
+    listone viene caricato una volta sola. Per i giocatori già in tabella le colonne che il
+    listone non porta restano NULL (l'UPDATE tiene il valore attuale).
+    """
+    fc = fc.rename(columns={"Nome": "nome", "RM": "ruolo", "Squadra": "club", "Qt.A M": "quot_att_mantra"})
+    fc["id"] = risolutore.risolvi(fc["nome"], fc["club"] if "club" in fc.columns else None)
+    chiavi = chiave_riga(fc)
+    nuove = (~chiavi.duplicated() & ~chiavi.isin(visti)).to_numpy()
+    fc = fc[nuove]
+    visti.update(chiavi[nuove])
+
+    righe = tipizza_giocatori(fc.assign(priorita=1))
+    nuovi = fc["id"].isna().to_numpy()
+    for col, default in DEFAULT_NUOVI.items():
+        righe.loc[nuovi, col] = default
+    righe["ruolo"] = normalizza_ruoli(fc["ruolo"])
+    righe.insert(0, "id", fc["id"].astype(object).where(fc["id"].notna(), None))
+    return righe
+
+
+def lotti_trasformati(percorso, risolutore, dimensione):
+    """Generatore: righe di giocatore pronte per il LOAD, un lotto del listone alla volta"""
+    visti = set()
+    for fc in lotti_listone(percorso, COLONNE_LISTONE, dimensione):
+        yield trasforma_lotto(fc, risolutore, visti)
+
+
+def salva_lotti(lotti, percorso):
+    """Inoltra i lotti scrivendoli anche in un CSV (in append: nessun file intero in memoria)"""
+    if os.path.exists(percorso):
+        os.remove(percorso)
+    for i, righe in enumerate(lotti):
+        righe.to_csv(percorso, mode="a", header=i == 0, index=False)
+        yield righe
+
+
+# === LOAD ===
+def carica_lotti(conn, lotti, tabella=SUPABASE_TABLE):
+    """Carica i lotti su giocatore in un'unica transazione e azzera la priorità di chi non è nel listone.
+
+    Restituisce il riepilogo: lotti, righe, aggiornati (solo quelli cambiati), inseriti, fuori_listone.
+    """
+    colonne = ", ".join(COLONNE_LOAD)
+    effettivo = ", ".join(f"COALESCE(s.{c}, g.{c})" for c in COLONNE_LOAD)
+    riepilogo = {"lotti": 0, "righe": 0, "aggiornati": 0, "inseriti": 0, "fuori_listone": 0}
+    with conn.cursor() as cur:
+        cur.execute(
+            f"CREATE TEMP TABLE lotto_stage ON COMMIT DROP AS "
+            f"SELECT id, {colonne} FROM {tabella} WITH NO DATA;"
+        )
+        cur.execute("CREATE TEMP TABLE lotto_visti (id integer PRIMARY KEY) ON COMMIT DROP;")
+        for righe in lotti:
+            t0 = time.perf_counter()
+            cur.execute("TRUNCATE lotto_stage;")
+            execute_values(
+                cur,
+                f"INSERT INTO lotto_stage (id, {colonne}) VALUES %s",
+                righe.values.tolist(),
+                template="(%s, %s, %s, %s, %s, %s, %s, %s::ruolo_mantra[], %s, %s)",
+                page_size=1000,
+            )
+            cur.execute(
+                f"""
+                UPDATE {tabella} g SET ({colonne}) = ({effettivo})
+                FROM lotto_stage s
+                WHERE g.id = s.id
+                  AND ({effettivo}) IS DISTINCT FROM ({", ".join(f"g.{c}" for c in COLONNE_LOAD)});
+                """
+            )
+            aggiornati = cur.rowcount
+            cur.execute(
+                f"""
+                WITH nuovi AS (
+                    INSERT INTO {tabella} ({colonne})
+                    SELECT {colonne} FROM lotto_stage WHERE id IS NULL
+                    RETURNING id
+                )
+                INSERT INTO lotto_visti SELECT id FROM nuovi;
+                """
+            )
+            inseriti = cur.rowcount
+            cur.execute(
+                "INSERT INTO lotto_visti SELECT id FROM lotto_stage WHERE id IS NOT NULL ON CONFLICT DO NOTHING;"
+            )
+            riepilogo["lotti"] += 1
+            riepilogo["righe"] += len(righe)
+            riepilogo["aggiornati"] += aggiornati
+            riepilogo["inseriti"] += inseriti
+            print(
+                f"⏱️ Lotto {riepilogo['lotti']}: {len(righe)} righe, {aggiornati} aggiornate, "
+                f"{inseriti} inserite in {time.perf_counter() - t0:.2f}s"
+            )
+
+        cur.execute(
+            f"""
+            UPDATE {tabella} g SET priorita = 0
+            WHERE g.priorita IS DISTINCT FROM 0
+              AND NOT EXISTS (SELECT 1 FROM lotto_visti v WHERE v.id = g.id);
+            """
+        )
+        riepilogo["fuori_listone"] = cur.rowcount
+    conn.commit()
+    return riepilogo
+
+
+def esegui_lotti(conn, percorso, sb, dimensione, output=None, tabella=SUPABASE_TABLE):
+    """TRANSFORM + LOAD a lotti del listone in percorso; sb serve solo per id, nome e club"""
+    risolutore = RisolutoreGiocatori(sb)
+    lotti = lotti_trasformati(percorso, risolutore, dimensione)
+    if output:
+        lotti = salva_lotti(lotti, output)
+    return carica_lotti(conn, lotti, tabella)
+
+
+# === BENCHMARK ===
+def listone_sintetico(percorso, base, scala):
+    """Listone xlsx con scala volte i giocatori di base (le copie hanno il nome con un suffisso)"""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Tutti")
+    ws.append(["Quotazioni Fantacalcio Stagione (sintetico)"])
+    ws.append(["Id", "R", "RM", "Nome", "Squadra", "Qt.A", "Qt.I", "Diff.", "Qt.A M", "Qt.I M", "Diff.M", "FVM", "FVM M"])
+    righe = base.to_dict("records")
+    n = 0
+    for copia in range(scala):
+        suffisso = f" {copia}" if copia else ""
+        for r in righe:
+            n += 1
+            quot = r["quot_att_mantra"]
+            ws.append([n, "C", r["ruolo"], f"{r['nome']}{suffisso}", r["club"], quot, quot, 0, quot, quot, 0, 1, 1])
+    wb.save(percorso)
+    return n
+
+
+def _misura(modo, percorso, dsn, dimensione):
+    """Esegue TRANSFORM + LOAD in questo processo e restituisce tempo e picco di RSS"""
+    import psycopg2
+
+    rss_iniziale = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t0 = time.perf_counter()
+    conn = psycopg2.connect(dsn)
+    if modo == "classico":
+        from listone import leggi_listone
+        from giocatori import carica_giocatori_bulk
+        from normalizzazione import normalizza_null
+        from trasformazione import trasforma_listone, rileva_modifiche
+
+        sb = pd.read_sql(f"SELECT * FROM {SUPABASE_TABLE};", conn)
+        new_sb = trasforma_listone(leggi_listone(percorso, COLONNE_LISTONE), sb)
+        new_sb.to_excel(os.path.join(os.path.dirname(percorso), "output_new_sb.xlsx"), index=False)
+        df = normalizza_null(new_sb)
+        da_caricare, _ = rileva_modifiche(df, sb)
+        carica_giocatori_bulk(conn, da_caricare)
+        righe = len(new_sb)
+    else:
+        sb = pd.read_sql(f"SELECT id, nome, club FROM {SUPABASE_TABLE};", conn)
+        output = os.path.join(os.path.dirname(percorso), "output_new_sb.csv")
+        righe = esegui_lotti(conn, percorso, sb, dimensione, output)["righe"]
+    conn.close()
+    return {
+        "secondi": time.perf_counter() - t0,
+        "righe": righe,
+        "rss_iniziale_mb": rss_iniziale / 1024,
+        "rss_picco_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def benchmark(dsn, data, scale, dimensione, cartella):
+    """Picco di RSS e tempo delle due modalità su listoni sintetici; il database viene ripristinato ogni volta"""
+    from contextlib import redirect_stdout
+    from backup_store import tabelle_del_giorno
+    from restore_backup import ripristina_in_db
+    from storico import snapshot_giocatori
+
+    os.makedirs(cartella, exist_ok=True)
+    base = snapshot_giocatori(tabelle_del_giorno(data)["giocatore"]).reset_index()
+    base["quot_att_mantra"] = base["quot_att_mantra"].fillna(1)
+    risultati = []
+    for scala in scale:
+        percorso = os.path.join(cartella, f"listone_x{scala}.xlsx")
+        if not os.path.exists(percorso):
+            listone_sintetico(percorso, base, scala)
+        for modo in ("classico", "lotti"):
+            with open(os.devnull, "w") as nulla, redirect_stdout(nulla):
+                ripristina_in_db(data, dsn)
+            uscita = subprocess.run(
+                [sys.executable, __file__, "_misura", modo, percorso, "--dsn", dsn, "--lotto", str(dimensione)],
+                capture_output=True, text=True, check=True,
+            )
+            misura = json.loads(uscita.stdout.strip().splitlines()[-1])
+            risultati.append({"scala": scala, "modo": modo, **misura})
+            print(
+                f"📊 x{scala:<4} {modo:<9} {misura['righe']:>7} righe  "
+                f"RSS picco {misura['rss_picco_mb']:7.1f} MB (+{misura['rss_picco_mb'] - misura['rss_iniziale_mb']:6.1f})  "
+                f"{misura['secondi']:6.2f}s"
+            )
+    return risultati
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Modalità a lotti dell'ETL listone")
+    comandi = parser.add_subparsers(dest="comando", required=True)
+    ben = comandi.add_parser("benchmark", help="memoria e tempo: classico contro lotti")
+    ben.add_argument("--dsn", required=True, help="database di prova (viene sovrascritto dal backup)")
+    ben.add_argument("--data", help="backup da ripristinare (YYYY_MM_DD, default l'ultimo)")
+    ben.add_argument("--scale", type=int, nargs="+", default=[1, 10, 100])
+    ben.add_argument("--lotto", type=int, default=DIMENSIONE_LOTTO or 5000)
+    ben.add_argument("--cartella", default=os.path.join(os.getcwd(), "downloads", "benchmark_lotti"))
+    mis = comandi.add_parser("_misura")
+    mis.add_argument("modo", choices=["classico", "lotti"])
+    mis.add_argument("percorso")
+    mis.add_argument("--dsn", required=True)
+    mis.add_argument("--lotto", type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    if args.comando == "benchmark":
+        from backup_store import date_disponibili
+
+        benchmark(args.dsn, args.data or date_disponibili()[-1], args.scale, args.lotto, args.cartella)
+    elif args.comando == "_misura":
+        misura = _misura(args.modo, args.percorso, args.dsn, args.lotto)
+        print(json.dumps(misura))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+# Metriche per stadio e report JSON dei run degli ETL
+# Pipeline apre un contesto di misura per ogni stadio: nel thread dello stadio db.py conta le
+# query (round trip, righe, tempo), SheetsSink le chiamate API e le sessioni HTTP del listone
+# richieste e byte scaricati. Il report del run (tempi, righe e byte in ingresso/uscita e
+# contatori di ogni stadio) viene scritto in report/<etl>_ultimo.json e aggiunto in coda a
+# report/<etl>_storico.jsonl; ogni stadio è confrontato con la mediana degli ultimi run, così
+# una regressione si vede subito nel log.
+# pandas non si importa qui: db.py usa questo modulo anche nei job di sync, che non lo installano.
+#
+# Uso:
+#   python metriche.py fc_to_sb_to_gs [--ultimi 20]     # andamento degli ultimi run
+
+import os
+import sys
+import json
+import argparse
+import threading
+import statistics
+from contextlib import contextmanager
+
+REPORT_DIR = os.environ.get("RUN_REPORT_DIR", os.path.join(os.getcwd(), "report"))
+# Run precedenti usati per la mediana e soglia oltre cui uno stadio è una regressione
+RUN_CONFRONTO = int(os.environ.get("RUN_REPORT_CONFRONTO", 10))
+SOGLIA_REGRESSIONE = float(os.environ.get("RUN_REPORT_SOGLIA", 2.0))
+# Sotto questo scarto (in secondi) le differenze sono rumore
+SCARTO_MINIMO = 0.5
+
+_locale = threading.local()
+
+
+# === CONTATORI PER STADIO ===
+@contextmanager
+def misura():
+    """Contatori dello stadio che gira in questo thread (conta/annota scrivono qui)"""
+    precedenti = getattr(_locale, "contatori", None)
+    contatori = {}
+    _locale.contatori = contatori
+    try:
+        yield contatori
+    finally:
+        _locale.contatori = precedenti
+
+
+def conta(chiave, n=1):
+    """Incrementa un contatore dello stadio corrente (fuori da uno stadio non fa nulla)"""
+    contatori = getattr(_locale, "contatori", None)
+    if contatori is not None:
+        contatori[chiave] = contatori.get(chiave, 0) + n
+
+
+def annota(chiave, valore):
+    """Aggiunge un'informazione libera allo stadio corrente (es. il metodo di download)"""
+    contatori = getattr(_locale, "contatori", None)
+    if contatori is not None:
+        contatori.setdefault("note", {})[chiave] = valore
+
+
+def dimensioni(oggetto):
+    """(righe, byte) dei DataFrame contenuti in oggetto, anche dentro tuple, liste e dict"""
+    # Senza pandas già importato non possono esserci DataFrame
+    pd = sys.modules.get("pandas")
+    if pd is not None and isinstance(oggetto, (pd.DataFrame, pd.Series)):
+        byte = oggetto.memory_usage(deep=True)
+        return len(oggetto), int(byte.sum() if isinstance(byte, pd.Series) else byte)
+    if isinstance(oggetto, dict):
+        oggetto = list(oggetto.values())
+    if isinstance(oggetto, (list, tuple)):
+        righe = byte = 0
+        for elemento in oggetto:
+            r, b = dimensioni(elemento)
+            righe += r
+            byte += b
+        return righe, byte
+    return 0, 0
+
+
+# === REPORT ===
+def _percorsi(nome_etl, cartella):
+    return os.path.join(cartella, f"{nome_etl}_ultimo.json"), os.path.join(cartella, f"{nome_etl}_storico.jsonl")
+
+
+def leggi_storico(nome_etl, cartella=REPORT_DIR):
+    """Report dei run precedenti, dal più vecchio"""
+    _, storico = _percorsi(nome_etl, cartella)
+    if not os.path.exists(storico):
+        return []
+    with open(storico, encoding="utf-8") as f:
+        return [json.loads(riga) for riga in f if riga.strip()]
+
+
+def regressioni(report, storico, ultimi=RUN_CONFRONTO):
+    """Stadi (e durata totale) più lenti di SOGLIA_REGRESSIONE volte la mediana degli ultimi run.
+
+    Per ogni stadio contano solo i run in cui quello stadio è riuscito, per il totale solo i run
+    riusciti: un errore che tronca il run non abbassa la mediana.
+    """
+    precedenti = storico[-ultimi:]
+    misure = {}
+    totali = [r["durata"] for r in precedenti if r.get("esito") == "ok"]
+    if totali and report["esito"] == "ok":
+        misure["(totale)"] = (report["durata"], totali)
+    for nome, stadio in report["stadi"].items():
+        passati = [
+            r["stadi"][nome]["secondi"] for r in precedenti
+            if nome in r.get("stadi", {}) and not r["stadi"][nome].get("errore")
+        ]
+        if passati and not stadio.get("errore"):
+            misure[nome] = (stadio["secondi"], passati)
+    trovate = []
+    for nome, (secondi, passati) in misure.items():
+        mediana = statistics.median(passati)
+        if secondi > mediana * SOGLIA_REGRESSIONE and secondi - mediana > SCARTO_MINIMO:
+            trovate.append({"stadio": nome, "secondi": round(secondi, 3), "mediana": round(mediana, 3)})
+    return trovate
+
+
+def scrivi_report(report, cartella=REPORT_DIR):
+    """Scrive il report del run, lo aggiunge allo storico e segnala le regressioni"""
+    os.makedirs(cartella, exist_ok=True)
+    ultimo, storico_path = _percorsi(report["etl"], cartella)
+    report["regressioni"] = regressioni(report, leggi_storico(report["etl"], cartella))
+    with open(ultimo, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False, default=str)
+        f.write("\n")
+    with open(storico_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(report, ensure_ascii=False, default=str) + "\n")
+    print(f"🧾 Report del run in {ultimo}")
+    for r in report["regressioni"]:
+        print(f"🐌 Regressione: {r['stadio']} {r['secondi']:.2f}s contro una mediana di {r['mediana']:.2f}s")
+    return report
+
+
+def stampa_andamento(nome_etl, ultimi=20, cartella=REPORT_DIR):
+    """Tabella degli ultimi run: durata totale e secondi per stadio"""
+    import pandas as pd
+
+    storico = leggi_storico(nome_etl, cartella)[-ultimi:]
+    if not storico:
+        print(f"ℹ️ Nessun report per {nome_etl} in {cartella}")
+        return
+    righe = {
+        r["inizio"][:16]: {"esito": r["esito"], "totale": r["durata"], **{n: s["secondi"] for n, s in r["stadi"].items()}}
+        for r in storico
+    }
+    with pd.option_context("display.width", 250, "display.max_columns", None, "display.float_format", "{:.2f}".format):
+        print(pd.DataFrame.from_dict(righe, orient="index").to_string())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Andamento dei run di un ETL dai report JSON")
+    parser.add_argument("etl", help="nome dell'ETL (es. fc_to_sb_to_gs)")
+    parser.add_argument("--ultimi", type=int, default=20)
+    parser.add_argument("--cartella", default=REPORT_DIR)
+    args = parser.parse_args(argv)
+    stampa_andamento(args.etl, args.ultimi, args.cartella)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
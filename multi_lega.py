@@ -0,0 +1,296 @@
+# ETL listone per più leghe (config in leghe.json)
+# Le quotazioni della Serie A sono le stesse per tutte le leghe: il listone viene scaricato
+# (una sessione Fantacalcio, Selenium solo se serve) e letto una volta sola. Poi ogni lega,
+# con le sue tabelle e il suo Google Sheet, esegue TRANSFORM, LOAD e scrittura dei fogli in
+# parallelo alle altre, al più PARALLELISMO leghe alla volta. Le leghe sullo stesso database
+# condividono un pool di connessioni (una connessione alla volta per lega); un errore in una
+# lega viene registrato e non ferma le altre. A fine run: tempi ed esito per lega.
+#
+# leghe.json:
+#   {"parallelismo": 2,
+#    "leghe": [{"nome": "fmm", "spreadsheet": "Test",
+#               "tabelle": {"giocatore": "giocatore", "squadra": "squadra",
+#                           "movimenti": "movimenti_squadra", "aste": "asta"},
+#               "dsn_env": "DSN_ALTRA_LEGA"}]}        # dsn_env facoltativo: altro database
+#
+# Uso:
+#   python multi_lega.py [--config leghe.json] [--solo fmm altra_lega]
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import gspread
+
+from db import Pool, pool_supabase, stampa_riepilogo_query
+from etl_listone import (
+    FANTACALCIO_USERNAME,
+    FANTACALCIO_PASSWORD,
+    GOOGLE_CREDENTIALS_PATH,
+    FORZA_ELABORAZIONE,
+    NOME_ETL,
+    TARGET_FILE,
+    SUPABASE_TABLE,
+    SUPABASE_TABLE_CREDITI,
+    SUPABASE_TABLE_MOVIMENTI,
+    SUPABASE_TABLE_ASTE,
+    login_selenium,
+    foglio_listone,
+    foglio_crediti,
+    foglio_mercato,
+    prepara_ambiente,
+    scrivi_fogli,
+)
+from giocatori import carica_giocatori_bulk
+from listone import scarica_listone_file, listone_gia_caricato, segna_listone_caricato, leggi_listone
+from lotti import DIMENSIONE_LOTTO, esegui_lotti
+from metriche import misura, dimensioni, annota, scrivi_report
+from normalizzazione import normalizza_null
+from pipeline import Pipeline
+from trasformazione import COLONNE_LISTONE, trasforma_listone, rileva_modifiche
+
+CONFIG_PATH = os.environ.get("LEGHE_CONFIG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "leghe.json"))
+PARALLELISMO = int(os.environ.get("LEGHE_PARALLELISMO", 2))
+
+TABELLE_DEFAULT = {
+    "giocatore": SUPABASE_TABLE,
+    "squadra": SUPABASE_TABLE_CREDITI,
+    "movimenti": SUPABASE_TABLE_MOVIMENTI,
+    "aste": SUPABASE_TABLE_ASTE,
+}
+
+
+# === CONFIGURAZIONE ===
+def leggi_config(percorso=CONFIG_PATH):
+    """Leghe dal file di config, con le tabelle di default dove non specificate"""
+    with open(percorso, encoding="utf-8") as f:
+        config = json.load(f)
+    leghe = []
+    for lega in config.get("leghe", []):
+        if "nome" not in lega or "spreadsheet" not in lega:
+            raise ValueError(f"❌ Lega senza 'nome' o 'spreadsheet' in {percorso}: {lega}")
+        leghe.append({**lega, "tabelle": {**TABELLE_DEFAULT, **lega.get("tabelle", {})}})
+    nomi = [l["nome"] for l in leghe]
+    doppi = sorted({n for n in nomi if nomi.count(n) > 1})
+    if doppi:
+        raise ValueError(f"❌ Leghe ripetute in {percorso}: {', '.join(doppi)}")
+    return leghe, int(config.get("parallelismo", PARALLELISMO))
+
+
+# === POOL CONDIVISI ===
+_pool = {}
+_pool_lock = threading.Lock()
+
+
+def pool_della_lega(lega, parallelismo):
+    """Pool del database della lega: Supabase di default, altrimenti uno per dsn_env"""
+    env = lega.get("dsn_env")
+    if not env:
+        return pool_supabase(maxconn=parallelismo)
+    with _pool_lock:
+        if env not in _pool:
+            dsn = os.environ.get(env)
+            if not dsn:
+                raise RuntimeError(f"Missing {env} environment variable (DSN della lega {lega['nome']})")
+            _pool[env] = Pool(dsn, maxconn=parallelismo, nome=env.lower())
+        return _pool[env]
+
+
+# === STADI DI UNA LEGA ===
+def leggi_tabelle(pool, tabelle, solo_identita):
+    """Le quattro letture della lega su una sola connessione del pool"""
+    colonne_giocatore = "id, nome, club" if solo_identita else "*"
+    query = {
+        "giocatori": f"SELECT {colonne_giocatore} FROM {tabelle['giocatore']};",
+        "crediti": f"SELECT * FROM {tabelle['squadra']};",
+        "movimenti": f"SELECT * FROM {tabelle['movimenti']};",
+        "aste": f"""
+            SELECT a.*, g.nome as nome_giocatore
+            FROM {tabelle['aste']} a
+            LEFT JOIN {tabelle['giocatore']} g ON a.giocatore = g.id;
+        """,
+    }
+    with pool.connessione() as conn:
+        return {nome: pd.read_sql(sql, conn) for nome, sql in query.items()}
+
+
+def carica_lega(pool, tabella, fc, sb):
+    """TRANSFORM + LOAD del listone sul giocatore della lega. Restituisce (frame per il foglio, riepilogo)"""
+    if DIMENSIONE_LOTTO:
+        with pool.connessione() as conn:
+            riepilogo = esegui_lotti(conn, TARGET_FILE, sb, DIMENSIONE_LOTTO, tabella=tabella)
+        return None, riepilogo
+
+    # trasforma_listone modifica il frame che riceve: ogni lega lavora sulla sua copia
+    df = normalizza_null(trasforma_listone(fc.copy(), sb))
+    da_caricare, riepilogo = rileva_modifiche(df, sb)
+    if len(da_caricare):
+        with pool.connessione() as conn:
+            carica_giocatori_bulk(conn, da_caricare, tabella=tabella)
+    return df, riepilogo
+
+
+def esegui_lega(lega, fc, elabora, gc, parallelismo):
+    """Pipeline di una lega: letture, Google Sheet, LOAD e fogli"""
+    pool = pool_della_lega(lega, parallelismo)
+    tabelle = lega["tabelle"]
+    etl = Pipeline(f"lega_{lega['nome']}", max_workers=3)
+    etl.stadio("db", lambda: leggi_tabelle(pool, tabelle, bool(DIMENSIONE_LOTTO) and elabora))
+    etl.stadio("spreadsheet", lambda: gc.open(lega["spreadsheet"]))
+    etl.stadio(
+        "carica",
+        lambda db: carica_lega(pool, tabelle["giocatore"], fc, db["giocatori"]) if elabora else (None, None),
+        dipende_da=["db"],
+    )
+    etl.stadio(
+        "sheets",
+        lambda spreadsheet, db, caricato: scrivi_fogli(
+            spreadsheet,
+            foglio_listone(caricato[0]),
+            foglio_crediti(db["crediti"]),
+            foglio_mercato(db["movimenti"]),
+            db["aste"],
+        ),
+        dipende_da=["spreadsheet", "db", "carica"],
+    )
+    return etl
+
+
+def scarica_listone_condiviso(leghe):
+    """Download (e lettura, se serve) del listone comune. Restituisce (fc, sha, elabora per lega)"""
+    metodo, sha = scarica_listone_file(FANTACALCIO_USERNAME, FANTACALCIO_PASSWORD, TARGET_FILE, login_selenium)
+    print(f"✅ Listone scaricato via {metodo} (sha256 {sha[:12]})")
+    annota("metodo", metodo)
+    elabora = {
+        l["nome"]: FORZA_ELABORAZIONE or not listone_gia_caricato(TARGET_FILE, sha, f"{NOME_ETL}:{l['nome']}")
+        for l in leghe
+    }
+    # Il listone si legge una volta sola (a lotti lo legge ogni lega in streaming)
+    fc = None
+    if any(elabora.values()) and not DIMENSIONE_LOTTO:
+        fc = leggi_listone(TARGET_FILE, COLONNE_LISTONE)
+        print(f"✅ Listone letto ({len(fc)} record)")
+    return fc, sha, elabora
+
+
+def esegui_leghe(leghe, parallelismo):
+    """Scarica il listone una volta, poi le leghe in parallelo.
+
+    Restituisce il report per lega e le metriche del download del listone.
+    """
+    t0 = time.perf_counter()
+    with misura() as listone:
+        fc, sha, elabora = scarica_listone_condiviso(leghe)
+    listone.update(secondi=round(time.perf_counter() - t0, 3))
+    listone["righe_out"], listone["byte_out"] = dimensioni(fc)
+    gc = gspread.service_account(GOOGLE_CREDENTIALS_PATH)
+
+    def una_lega(lega):
+        nome = lega["nome"]
+        t0 = time.perf_counter()
+        voce = {"lega": nome, "elaborata": elabora[nome], "pipeline": None}
+        try:
+            voce["pipeline"] = esegui_lega(lega, fc, elabora[nome], gc, parallelismo)
+            risultati = voce["pipeline"].esegui()
+            _, riepilogo = risultati["carica"]
+            voce.update(esito="ok", riepilogo=riepilogo, fogli=risultati["sheets"])
+        except Exception as e:
+            # Isolamento: la lega fallita finisce nel report, le altre proseguono
+            voce.update(esito="errore", errore=f"{type(e).__name__}: {(str(e).strip().splitlines() or [''])[0]}")
+            logging.exception(f"Lega {nome} fallita")
+        voce["secondi"] = time.perf_counter() - t0
+        print(f"{'✅' if voce['esito'] == 'ok' else '❌'} Lega {nome}: {voce['esito']} in {voce['secondi']:.2f}s")
+        return voce
+
+    with ThreadPoolExecutor(max_workers=parallelismo, thread_name_prefix="lega") as executor:
+        report = list(executor.map(una_lega, leghe))
+
+    # Il listone è segnato come caricato solo per le leghe riuscite (meta.json scritto da un solo thread)
+    for voce in report:
+        if voce["esito"] == "ok" and voce["elaborata"]:
+            segna_listone_caricato(TARGET_FILE, sha, f"{NOME_ETL}:{voce['lega']}")
+    return report, listone
+
+
+def report_run(report, listone, inizio, durata):
+    """Report JSON del run: il listone più gli stadi di ogni lega (chiave 'lega/stadio')"""
+    stadi = {"listone": {"inizio": 0.0, **listone}}
+    for voce in report:
+        if voce["pipeline"] is not None:
+            for nome, stadio in voce["pipeline"].report()["stadi"].items():
+                stadi[f"{voce['lega']}/{nome}"] = stadio
+    fallite = [v["lega"] for v in report if v["esito"] != "ok"]
+    return {
+        "etl": "multi_lega",
+        "inizio": inizio.isoformat(timespec="seconds"),
+        "esito": "errore" if fallite else "ok",
+        "errore": f"leghe fallite: {', '.join(fallite)}" if fallite else None,
+        "durata": round(durata, 3),
+        "stadi": stadi,
+        "leghe": {
+            v["lega"]: {k: v.get(k) for k in ("esito", "elaborata", "secondi", "errore", "riepilogo")}
+            for v in report
+        },
+    }
+
+
+def stampa_report(report):
+    """Timeline per lega e tabella riassuntiva"""
+    for voce in report:
+        if voce["pipeline"] is not None:
+            voce["pipeline"].stampa_timeline()
+    print(f"📋 Leghe: {sum(v['esito'] == 'ok' for v in report)} riuscite su {len(report)}")
+    for voce in report:
+        riepilogo = voce.get("riepilogo") or {}
+        if not voce["elaborata"]:
+            dettaglio = "listone invariato"
+        elif "errore" in voce:
+            dettaglio = voce["errore"]
+        elif "lotti" in riepilogo:
+            dettaglio = f"{riepilogo['inseriti']} nuovi, {riepilogo['aggiornati']} aggiornati"
+        else:
+            dettaglio = f"{riepilogo.get('inserimenti', 0)} nuovi, {riepilogo.get('aggiornamenti', 0)} aggiornati"
+        print(f"   {'✅' if voce['esito'] == 'ok' else '❌'} {voce['lega']:<20} {voce['secondi']:7.2f}s  {dettaglio}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ETL listone per più leghe")
+    parser.add_argument("--config", default=CONFIG_PATH)
+    parser.add_argument("--solo", nargs="+", help="esegue solo le leghe indicate")
+    args = parser.parse_args(argv)
+
+    leghe, parallelismo = leggi_config(args.config)
+    if args.solo:
+        sconosciute = set(args.solo) - {l["nome"] for l in leghe}
+        if sconosciute:
+            raise ValueError(f"❌ Leghe non presenti in {args.config}: {', '.join(sorted(sconosciute))}")
+        leghe = [l for l in leghe if l["nome"] in args.solo]
+    prepara_ambiente(richiedi_supabase=any(not l.get("dsn_env") for l in leghe))
+    print(f"🏆 {len(leghe)} leghe, {parallelismo} alla volta")
+
+    # Il pool Supabase nasce qui, prima dei thread delle leghe, con la dimensione del parallelismo
+    if any(not l.get("dsn_env") for l in leghe):
+        pool_supabase(maxconn=parallelismo)
+
+    inizio = datetime.now(timezone.utc)
+    t0 = time.perf_counter()
+    report, listone = esegui_leghe(leghe, parallelismo)
+    stampa_report(report)
+    scrivi_report(report_run(report, listone, inizio, time.perf_counter() - t0))
+    stampa_riepilogo_query()
+    pool_usati = ([pool_supabase()] if any(not l.get("dsn_env") for l in leghe) else []) + list(_pool.values())
+    for pool in pool_usati:
+        print(f"🔌 Pool {pool.nome}: {pool.handshake} connessioni aperte")
+        pool.chiudi()
+    return 0 if all(v["esito"] == "ok" for v in report) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+# Normalizzazione vettoriale condivisa dai due ETL
+# Stesso risultato del vecchio percorso cella per cella (df.map per i NULL, parse_ruoli per
+# riga), ma con maschere per colonna e operazioni .str su tutto il frame in una volta.
+
+import os
+import glob
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+# Caratteri che la decomposizione NFD non riporta a lettere latine semplici
+SOSTITUZIONI = str.maketrans({"ı": "i", "ş": "s", "ç": "c", "ğ": "g", "ö": "o", "ü": "u", "ø": "o", "å": "a", "æ": "ae"})
+
+
+def normalizza_null(df):
+    """Stringhe vuote o di soli spazi -> None, colonna per colonna.
+
+    Equivale a df.map(lambda x: None if x is None or str(x).strip() == "" else x):
+    solo le colonne di testo (object/str) vengono toccate, le numeriche restano come sono.
+    """
+    out = df.copy()
+    for col in out.columns:
+        serie = out[col]
+        if not (pd.api.types.is_object_dtype(serie) or pd.api.types.is_string_dtype(serie)):
+            continue
+        try:
+            vuote = serie.str.strip().eq("").fillna(False).astype(bool)
+        except AttributeError:
+            # colonna object senza stringhe (tutti None, liste...): niente da svuotare
+            continue
+        if vuote.any():
+            out[col] = serie.where(~vuote, None)
+    return out
+
+
+def normalizza_testo(serie):
+    """Testo senza spazi ai bordi, None per mancanti e stringhe vuote"""
+    testo = serie.astype("string").str.strip()
+    testo = testo.mask(testo.eq("")).astype(object)
+    return testo.where(testo.notna(), None)
+
+
+def pulisci_testo(testo):
+    """Minuscolo, senza spazi ai bordi e senza accenti ('' per i mancanti), un valore alla volta"""
+    if pd.isna(testo):
+        return ""
+    testo = str(testo).lower().strip().translate(SOSTITUZIONI)
+    return "".join(c for c in unicodedata.normalize("NFD", testo) if unicodedata.category(c) != "Mn")
+
+
+def pulisci_serie(serie):
+    """pulisci_testo sui soli valori distinti, ridistribuito sulle righe"""
+    codici, unici = pd.factorize(serie)
+    puliti = np.array([pulisci_testo(v) for v in unici] + [""], dtype=object)
+    # factorize marca i mancanti con -1: l'ultimo elemento ("") li copre
+    return pd.Series(puliti[codici], index=serie.index, dtype=object)
+
+
+def normalizza_ruoli(serie):
+    """Stringhe ruolo ('Dc;E', '{Dc,E}', 'Dc\\nE') -> liste per il cast ruolo_mantra[].
+
+    Versione vettoriale di giocatori.parse_ruoli: None per valori mancanti o vuoti.
+    Le combinazioni di ruoli distinte sono poche, quindi il parsing .str gira solo sui
+    valori unici e il risultato viene ridistribuito sulle righe con i codici di factorize.
+    """
+    codici, unici = pd.factorize(serie)
+    unici = pd.Series(unici, dtype=object)
+    ruoli = (
+        unici.astype(str)
+        .str.replace(r"[{} ]", "", regex=True)
+        .str.findall(r"[^,;\n]+")
+        .astype(object)
+        .where(unici.ne(""), None)
+    )
+    # factorize marca i mancanti con -1: l'ultimo elemento aggiunto (None) li copre
+    valori = np.empty(len(ruoli) + 1, dtype=object)
+    for i, ruolo in enumerate(ruoli.tolist() + [None]):
+        valori[i] = ruolo
+    return pd.Series(valori[codici], index=serie.index, dtype=object)
+
+
+def ruoli_come_testo(serie):
+    """Ruoli normalizzati come 'Dc,E' (None se assenti), per i confronti tra snapshot"""
+    testo = normalizza_ruoli(serie).str.join(",")
+    return testo.where(testo.notna() & testo.ne(""), None)
+
+
+# === BENCHMARK ===
+if __name__ == "__main__":
+    import sys
+    import timeit
+
+    from giocatori import parse_ruoli
+
+    if len(sys.argv) > 1:
+        percorso = sys.argv[1]
+    else:
+        percorso = sorted(glob.glob(os.path.join("backup", "20*", "giocatore.csv")))[-1]
+    ripetizioni = 5
+    base = pd.read_csv(percorso)
+
+    def attuale(df):
+        out = df.map(lambda x: None if x is None or str(x).strip() == "" else x)
+        out["ruolo"] = out["ruolo"].map(parse_ruoli)
+        return out
+
+    def veloce(df):
+        out = normalizza_null(df)
+        out["ruolo"] = normalizza_ruoli(out["ruolo"])
+        return out
+
+    atteso, ottenuto = attuale(base), veloce(base)
+    identici = atteso.astype(str).equals(ottenuto.astype(str))
+    print(f"📊 {percorso} ({len(base)} righe x {len(base.columns)} colonne)")
+    print(f"✅ Risultati identici: {identici}")
+
+    # Il backup è piccolo: lo replico per vedere come scalano i due percorsi
+    for scala in (1, 10, 100):
+        df = pd.concat([base] * scala, ignore_index=True)
+        t_attuale = min(timeit.repeat(lambda: attuale(df), number=1, repeat=ripetizioni))
+        t_veloce = min(timeit.repeat(lambda: veloce(df), number=1, repeat=ripetizioni))
+        print(
+            f"⏱️ x{scala:<3} ({len(df)} righe): cella per cella {t_attuale * 1000:.1f} ms, "
+            f"vettoriale {t_veloce * 1000:.1f} ms  (x{t_attuale / t_veloce:.1f})"
+        )
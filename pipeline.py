@@ -0,0 +1,140 @@
+# Scheduler minimale a stadi per gli ETL
+# Ogni stadio dichiara da quali stadi dipende; quelli indipendenti (download, letture
+# Postgres, apertura Google Sheet) girano in parallelo su un thread pool.
+# A fine run stampa la timeline per stadio e il percorso critico; report() restituisce le
+# metriche di ogni stadio (vedi metriche.py) per il report JSON del run.
+
+import time
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import metriche
+
+
+class Pipeline:
+    """Grafo di stadi eseguito con un ThreadPoolExecutor.
+
+    La funzione di uno stadio riceve come argomenti posizionali i risultati
+    degli stadi da cui dipende, nell'ordine in cui sono dichiarati.
+    """
+
+    def __init__(self, nome="ETL", max_workers=6):
+        self.nome = nome
+        self.max_workers = max_workers
+        self._stadi = {}
+        self.risultati = {}
+        self.tempi = {}
+        self.metriche = {}
+        self.errore = None
+        self.inizio = None
+        self._lock = threading.Lock()
+
+    def stadio(self, nome, funzione, dipende_da=()):
+        if nome in self._stadi:
+            raise ValueError(f"Stadio '{nome}' già definito")
+        for dip in dipende_da:
+            if dip not in self._stadi:
+                raise ValueError(f"Stadio '{nome}': dipendenza sconosciuta '{dip}'")
+        self._stadi[nome] = (funzione, tuple(dipende_da))
+        return self
+
+    def _esegui_stadio(self, nome, t_zero):
+        funzione, dipende_da = self._stadi[nome]
+        argomenti = [self.risultati[d] for d in dipende_da]
+        righe_in, byte_in = metriche.dimensioni(argomenti)
+        inizio = time.perf_counter() - t_zero
+        with metriche.misura() as contatori:
+            try:
+                risultato = funzione(*argomenti)
+                contatori["righe_out"], contatori["byte_out"] = metriche.dimensioni(risultato)
+                return risultato
+            except Exception as e:
+                contatori["errore"] = f"{type(e).__name__}: {e}"
+                raise
+            finally:
+                fine = time.perf_counter() - t_zero
+                with self._lock:
+                    self.tempi[nome] = (inizio, fine)
+                    self.metriche[nome] = {"righe_in": righe_in, "byte_in": byte_in, **contatori}
+
+    def esegui(self):
+        """Esegue tutti gli stadi rispettando le dipendenze; al primo errore annulla i pendenti e rilancia"""
+        t_zero = time.perf_counter()
+        self.inizio = datetime.now(timezone.utc)
+        in_attesa = dict(self._stadi)
+        in_corso = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.nome) as executor:
+            while in_attesa or in_corso:
+                pronti = [
+                    nome for nome, (_, dip) in in_attesa.items()
+                    if all(d in self.risultati for d in dip)
+                ]
+                for nome in pronti:
+                    del in_attesa[nome]
+                    in_corso[executor.submit(self._esegui_stadio, nome, t_zero)] = nome
+
+                completati, _ = wait(in_corso, return_when=FIRST_COMPLETED)
+                for future in completati:
+                    nome = in_corso.pop(future)
+                    try:
+                        self.risultati[nome] = future.result()
+                    except Exception as e:
+                        for altro in in_corso:
+                            altro.cancel()
+                        self.errore = f"{nome}: {type(e).__name__}: {e}"
+                        print(f"❌ Stadio '{nome}' fallito")
+                        self.stampa_timeline()
+                        raise
+
+        self.durata = time.perf_counter() - t_zero
+        return self.risultati
+
+    def report(self):
+        """Report del run per metriche.scrivi_report: esito, durata e metriche per stadio"""
+        stadi = {}
+        for nome, (inizio, fine) in sorted(self.tempi.items(), key=lambda x: x[1][0]):
+            stadi[nome] = {
+                "inizio": round(inizio, 3),
+                "secondi": round(fine - inizio, 3),
+                **{k: round(v, 3) if isinstance(v, float) else v for k, v in self.metriche.get(nome, {}).items()},
+            }
+        return {
+            "etl": self.nome,
+            "inizio": (self.inizio or datetime.now(timezone.utc)).isoformat(timespec="seconds"),
+            "esito": "errore" if self.errore else "ok",
+            "errore": self.errore,
+            "durata": round(max((f for _, f in self.tempi.values()), default=0.0), 3),
+            "stadi": stadi,
+            "percorso_critico": self.percorso_critico(),
+        }
+
+    def percorso_critico(self):
+        """Catena di stadi che ha determinato la durata totale (a ritroso dall'ultimo finito)"""
+        if not self.tempi:
+            return []
+        nome = max(self.tempi, key=lambda n: self.tempi[n][1])
+        percorso = [nome]
+        while True:
+            dipendenze = [d for d in self._stadi[nome][1] if d in self.tempi]
+            if not dipendenze:
+                break
+            nome = max(dipendenze, key=lambda d: self.tempi[d][1])
+            percorso.append(nome)
+        return list(reversed(percorso))
+
+    def stampa_timeline(self, larghezza=40):
+        """Stampa inizio/fine di ogni stadio con una barra proporzionale e il percorso critico"""
+        if not self.tempi:
+            return
+        totale = max(fine for _, fine in self.tempi.values()) or 1e-9
+        critico = set(self.percorso_critico())
+        print(f"🕒 Timeline {self.nome} ({totale:.2f}s):")
+        for nome, (inizio, fine) in sorted(self.tempi.items(), key=lambda x: x[1][0]):
+            da = int(inizio / totale * larghezza)
+            a = max(da + 1, int(fine / totale * larghezza))
+            barra = " " * da + "█" * (a - da) + " " * (larghezza - a)
+            segno = "★" if nome in critico else " "
+            print(f"  {segno} {nome:<18} |{barra}| {inizio:6.2f}s → {fine:6.2f}s ({fine - inizio:.2f}s)")
+        print(f"  ★ percorso critico: {' → '.join(self.percorso_critico())}")
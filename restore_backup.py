@@ -0,0 +1,347 @@
+# Ripristino di un backup datato in un Postgres qualsiasi (dev, locale, test)
+# Legge i CSV del giorno dallo store (o dalla cartella legacy), svuota le tabelle di
+# destinazione e le ricarica con COPY in ordine di FK, in un'unica transazione:
+# FK disattivate durante il load (replica role, altrimenti vincoli differiti), indici
+# secondari eliminati prima e ricostruiti dopo, sequenze riallineate e ANALYZE finale.
+# Il TRUNCATE ... CASCADE svuoterebbe anche le tabelle che referenziano quelle del backup
+# senza farne parte (es. giocatore_transfermarkt): se ce ne sono il restore si ferma e le
+# elenca, a meno di --svuota-collegate.
+#
+# Uso:
+#   python restore_backup.py 2026_08_08 --dsn "host=localhost dbname=fmm_dev user=postgres"
+#   python restore_backup.py 2026_08_08 --dsn ... --svuota-collegate
+#   (senza --dsn usa la variabile RESTORE_DSN)
+
+import io
+import os
+import re
+import csv
+import ast
+import sys
+import json
+import time
+import argparse
+
+import psycopg2
+from psycopg2 import sql
+
+from db import Pool, stampa_riepilogo_query
+from backup_store import leggi_manifest, tabelle_del_giorno
+from sync_dev_db import get_foreign_keys, pianifica_sync
+
+INTERO_FLOAT = re.compile(r"^-?\d+\.0+$")
+TIPI_INTERI = {"smallint", "integer", "bigint"}
+
+
+# === CSV LEGACY (pandas.to_csv) ===
+def _letterale_array(valori):
+    """Lista Python -> letterale array Postgres ('{1,2}', '{"a","b"}')"""
+    elementi = []
+    for v in valori:
+        if v is None:
+            elementi.append("NULL")
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            elementi.append(str(v))
+        else:
+            testo = str(v).replace("\\", "\\\\").replace('"', '\\"')
+            elementi.append(f'"{testo}"')
+    return "{" + ",".join(elementi) + "}"
+
+
+def correggi_valore(valore, tipo):
+    """Sistema un valore scritto da pandas per il tipo della colonna di destinazione.
+
+    - vuoto -> NULL (pandas scriveva così sia None sia NaN)
+    - array scritti come lista Python ("[454, 27]", "['a', 'b']") -> letterale array
+    - interi nullable diventati float ("12.0") -> "12"
+    - bytea scritto come "<memory at 0x...>" -> NULL (il contenuto non è recuperabile)
+    - json scritto come dict Python ("{'a': 1}") -> JSON
+    """
+    if valore == "":
+        return None
+    data_type, udt_name = tipo
+    if data_type == "ARRAY" and valore.startswith("["):
+        return _letterale_array(ast.literal_eval(valore))
+    if data_type in TIPI_INTERI and INTERO_FLOAT.match(valore):
+        return valore.split(".")[0]
+    if data_type == "bytea" and valore.startswith("<memory at"):
+        return None
+    if data_type in ("json", "jsonb"):
+        try:
+            json.loads(valore)
+        except ValueError:
+            return json.dumps(ast.literal_eval(valore), ensure_ascii=False)
+    return valore
+
+
+def converti_legacy(contenuto, colonne_target):
+    """CSV pandas -> CSV per COPY con le sole colonne presenti nella tabella di destinazione"""
+    lettore = csv.reader(io.StringIO(contenuto.decode("utf-8")))
+    intestazione = next(lettore, None)
+    if intestazione is None:
+        return [], io.StringIO(), 0, 0
+    usate = [(i, c) for i, c in enumerate(intestazione) if c in colonne_target]
+    uscita = io.StringIO()
+    # Con \r\n come fine riga il modulo csv quota anche i campi che contengono \r (COPY li rifiuta)
+    scrittore = csv.writer(uscita, lineterminator="\r\n")
+    righe = persi = 0
+    for riga in lettore:
+        valori = []
+        for i, c in usate:
+            v = correggi_valore(riga[i], colonne_target[c])
+            if v is None and riga[i].startswith("<memory at"):
+                persi += 1
+            valori.append(v)
+        # None -> campo vuoto non quotato = NULL per COPY CSV
+        scrittore.writerow(["" if v is None else v for v in valori])
+        righe += 1
+    uscita.seek(0)
+    return [c for _, c in usate], uscita, righe, persi
+
+
+# === DESTINAZIONE ===
+def colonne_tabella(cur, tabella):
+    cur.execute(
+        """
+        SELECT column_name, data_type, udt_name
+        FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = %s
+        ORDER BY ordinal_position;
+        """,
+        (tabella,),
+    )
+    return {nome: (data_type, udt_name) for nome, data_type, udt_name in cur.fetchall()}
+
+
+def indici_secondari(cur, tabelle):
+    """(nome, definizione) degli indici non legati a vincoli (PK/UNIQUE restano al loro posto)"""
+    cur.execute(
+        """
+        SELECT ic.relname, pg_get_indexdef(i.indexrelid)
+        FROM pg_index i
+        JOIN pg_class ic ON ic.oid = i.indexrelid
+        JOIN pg_class t ON t.oid = i.indrelid
+        JOIN pg_namespace n ON n.oid = t.relnamespace
+        WHERE n.nspname = 'public' AND t.relname = ANY(%s)
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint k WHERE k.conindid = i.indexrelid);
+        """,
+        (list(tabelle),),
+    )
+    return cur.fetchall()
+
+
+def riallinea_sequenze(cur, tabella):
+    """setval delle sequenze (serial/identity) al massimo caricato"""
+    cur.execute(
+        """
+        SELECT a.attname, pg_get_serial_sequence(format('%%I', c.relname), a.attname)
+        FROM pg_attribute a
+        JOIN pg_class c ON c.oid = a.attrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND c.relname = %s AND a.attnum > 0 AND NOT a.attisdropped;
+        """,
+        (tabella,),
+    )
+    for colonna, sequenza in cur.fetchall():
+        if sequenza:
+            cur.execute(
+                sql.SQL("SELECT setval(%s, coalesce(max({c}), 1), max({c}) IS NOT NULL) FROM {t}").format(
+                    c=sql.Identifier(colonna), t=sql.Identifier(tabella)
+                ),
+                (sequenza,),
+            )
+
+
+def tabelle_in_cascata(cur, tabelle):
+    """Tabelle fuori da tabelle che un TRUNCATE ... CASCADE svuoterebbe (FK che le referenziano, ricorsivo)"""
+    cur.execute(
+        """
+        WITH RECURSIVE cascata(oid) AS (
+            SELECT c.oid FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = 'public' AND c.relname = ANY(%s)
+            UNION
+            SELECT k.conrelid FROM pg_constraint k
+            JOIN cascata ON k.confrelid = cascata.oid
+            WHERE k.contype = 'f'
+        )
+        SELECT DISTINCT c.oid::regclass::text FROM cascata
+        JOIN pg_class c ON c.oid = cascata.oid
+        WHERE NOT (c.relname = ANY(%s) AND c.relnamespace = 'public'::regnamespace)
+        ORDER BY 1;
+        """,
+        (list(tabelle), list(tabelle)),
+    )
+    return [r[0] for r in cur.fetchall()]
+
+
+def vincoli_non_differibili(cur, tabelle):
+    """FK NOT DEFERRABLE delle tabelle: (vincolo, figlia, padre)"""
+    cur.execute(
+        """
+        SELECT k.conname, c.relname, p.relname
+        FROM pg_constraint k
+        JOIN pg_class c ON c.oid = k.conrelid
+        JOIN pg_class p ON p.oid = k.confrelid
+        WHERE k.contype = 'f' AND NOT k.condeferrable
+          AND c.relnamespace = 'public'::regnamespace AND c.relname = ANY(%s)
+        ORDER BY 2, 1;
+        """,
+        (list(tabelle),),
+    )
+    return cur.fetchall()
+
+
+def disattiva_vincoli(conn, ordine, collegate=()):
+    """Replica role (niente trigger FK) se permesso, altrimenti vincoli differiti a fine transazione.
+
+    SET CONSTRAINTS ALL DEFERRED vale solo per le FK DEFERRABLE: quelle NOT DEFERRABLE restano
+    verificate a fine di ogni COPY, quindi bastano l'ordine FK e le FK verso sé stessa. Se una
+    punta a una tabella caricata dopo (ciclo) o svuotata in cascata il restore fallirebbe a metà:
+    meglio fermarsi subito.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SAVEPOINT ruolo")
+        try:
+            cur.execute("SET LOCAL session_replication_role = 'replica'")
+            cur.execute("RELEASE SAVEPOINT ruolo")
+            return "replica role"
+        except psycopg2.Error:
+            cur.execute("ROLLBACK TO SAVEPOINT ruolo")
+
+        posizione = {t: i for i, t in enumerate(ordine)}
+        rigide = vincoli_non_differibili(cur, ordine)
+        bloccanti = [
+            (nome, figlia, padre) for nome, figlia, padre in rigide
+            if padre in collegate or (padre != figlia and posizione.get(padre, -1) > posizione[figlia])
+        ]
+        if bloccanti:
+            elenco = ", ".join(f"{nome} ({figlia} → {padre})" for nome, figlia, padre in bloccanti)
+            raise RuntimeError(
+                f"senza replica role servono FK DEFERRABLE, queste non lo sono: {elenco} "
+                "(rendile DEFERRABLE o esegui il restore con un ruolo che può usare session_replication_role)"
+            )
+        cur.execute("SET CONSTRAINTS ALL DEFERRED")
+        if rigide:
+            print(
+                f"⚠️ Replica role non disponibile: differite solo le FK DEFERRABLE, "
+                f"{len(rigide)} NOT DEFERRABLE verificate nell'ordine FK"
+            )
+        return "vincoli differiti"
+
+
+# === RESTORE ===
+def ripristina_in_db(data, dsn, svuota_collegate=False):
+    t_inizio = time.perf_counter()
+    tempi = {}
+
+    t0 = time.perf_counter()
+    manifest = leggi_manifest(data)
+    origini = {t: v.get("origine", "pandas") for t, v in manifest["tabelle"].items()} if manifest else {}
+    tabelle_backup = tabelle_del_giorno(data)
+    tempi["lettura backup"] = time.perf_counter() - t0
+
+    pool = Pool(dsn, maxconn=1, nome="restore")
+    report = {}
+    with pool.connessione() as conn:
+        with conn.cursor() as cur:
+            colonne = {t: colonne_tabella(cur, t) for t in tabelle_backup}
+        mancanti = [t for t, c in colonne.items() if not c]
+        for t in mancanti:
+            print(f"⚠️ {t}: tabella assente nella destinazione, salto")
+        presenti = [t for t in tabelle_backup if colonne[t]]
+
+        ordine, _ = pianifica_sync(presenti, get_foreign_keys(conn, presenti))
+        print(f"📋 Ordine FK: {' → '.join(ordine)}")
+
+        with conn.cursor() as cur:
+            collegate = tabelle_in_cascata(cur, ordine)
+        if collegate:
+            elenco = ", ".join(collegate)
+            if not svuota_collegate:
+                raise RuntimeError(
+                    f"il TRUNCATE CASCADE svuoterebbe tabelle fuori dal backup: {elenco} "
+                    "(usa --svuota-collegate per procedere)"
+                )
+            print(f"⚠️ Svuotate in cascata anche tabelle fuori dal backup: {elenco}")
+
+        t0 = time.perf_counter()
+        modo = disattiva_vincoli(conn, ordine, collegate)
+        with conn.cursor() as cur:
+            cur.execute(
+                sql.SQL("TRUNCATE TABLE {} CASCADE").format(sql.SQL(", ").join(sql.Identifier(t) for t in ordine))
+            )
+            indici = indici_secondari(cur, ordine)
+            for nome, _ in indici:
+                cur.execute(sql.SQL("DROP INDEX {}").format(sql.Identifier(nome)))
+        tempi[f"truncate + drop {len(indici)} indici ({modo})"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        with conn.cursor() as cur:
+            for tabella in ordine:
+                t_tab = time.perf_counter()
+                contenuto = tabelle_backup[tabella]
+                intestazione = contenuto.split(b"\n", 1)[0].decode("utf-8")
+                campi = next(csv.reader([intestazione]), [])
+                persi = 0
+                if origini.get(tabella) == "copy" and set(campi) <= set(colonne[tabella]):
+                    # CSV scritto da COPY: va in destinazione così com'è
+                    copia = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv, HEADER true)")
+                    sorgente = io.BytesIO(contenuto)
+                else:
+                    campi, sorgente, _, persi = converti_legacy(contenuto, colonne[tabella])
+                    copia = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)")
+                if not campi:
+                    continue
+                query = copia.format(sql.Identifier(tabella), sql.SQL(", ").join(sql.Identifier(c) for c in campi))
+                cur.copy_expert(query.as_string(conn), sorgente)
+                report[tabella] = (cur.rowcount, time.perf_counter() - t_tab)
+                if persi:
+                    print(f"⚠️ {tabella}: {persi} valori bytea non recuperabili dal backup pandas → NULL")
+        tempi["COPY"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        with conn.cursor() as cur:
+            for _, definizione in indici:
+                cur.execute(definizione)
+        tempi[f"ricostruzione {len(indici)} indici"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        with conn.cursor() as cur:
+            for tabella in ordine:
+                riallinea_sequenze(cur, tabella)
+                cur.execute(sql.SQL("ANALYZE {}").format(sql.Identifier(tabella)))
+        tempi["sequenze + ANALYZE"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        conn.commit()
+        tempi["commit"] = time.perf_counter() - t0
+
+    totale = time.perf_counter() - t_inizio
+    print(f"\n=== Restore {data} ===")
+    for tabella, (righe, secondi) in report.items():
+        print(f"  {tabella:<30} {righe:>8} righe {secondi * 1000:>8.1f} ms")
+    for fase, secondi in tempi.items():
+        print(f"  ⏱️ {fase:<40} {secondi * 1000:>8.1f} ms")
+    print(f"✅ Ripristinate {len(report)} tabelle in {totale:.2f}s")
+    stampa_riepilogo_query(pool)
+    pool.chiudi()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ripristina un backup datato in un database Postgres")
+    parser.add_argument("data", help="YYYY_MM_DD")
+    parser.add_argument("--dsn", default=os.environ.get("RESTORE_DSN"), help="DSN di destinazione (default RESTORE_DSN)")
+    parser.add_argument(
+        "--svuota-collegate", action="store_true",
+        help="svuota anche le tabelle fuori dal backup che le FK raggiungono in cascata",
+    )
+    args = parser.parse_args(argv)
+    if not args.dsn:
+        parser.error("serve --dsn o la variabile RESTORE_DSN")
+    ripristina_in_db(args.data, args.dsn, args.svuota_collegate)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
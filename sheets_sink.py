@@ -0,0 +1,212 @@
+# Scrittura su Google Sheets a differenze
+# Invece di clear() + set_with_dataframe su ogni foglio, la griglia attuale viene letta
+# una volta sola, confrontata con i nuovi DataFrame e le celle cambiate (a blocchi di
+# righe contigue) partono in un'unica values_batch_update per spreadsheet.
+# Backoff esponenziale sui 429 / 5xx e conteggio di celle scritte e chiamate API.
+# Date e orari si scrivono come testo (USER_ENTERED li converte) e si rileggono come numero
+# di serie: il confronto avviene sul numero, indipendente dal formato e dalla locale del foglio.
+
+import os
+import math
+import time
+import random
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from gspread.exceptions import APIError
+from gspread.utils import rowcol_to_a1, absolute_range_name
+
+import metriche
+
+MAX_TENTATIVI = int(os.environ.get("SHEETS_MAX_RETRIES", 5))
+
+# Quota superata o errore temporaneo lato Google: ha senso riprovare
+STATUS_TRANSITORI = (429, 500, 502, 503)
+
+# Giorno zero dei numeri di serie di Google Sheets; un secondo di tolleranza nel confronto
+EPOCA_SHEETS = datetime(1899, 12, 30)
+TOLLERANZA_SERIALE = 1 / 86400
+
+
+class _Data(str):
+    """Data o data/ora come la scrive il DataFrame, con il numero di serie per il confronto"""
+
+    def __new__(cls, testo, seriale):
+        cella = super().__new__(cls, testo)
+        cella.seriale = seriale
+        return cella
+
+
+def _cella(valore):
+    """Valore di cella normalizzato a stringa, uguale sia per la griglia letta sia per il DataFrame"""
+    if valore is None:
+        return ""
+    if isinstance(valore, _Data):
+        return valore
+    if pd.api.types.is_scalar(valore) and pd.isna(valore):
+        return ""
+    if isinstance(valore, bool):
+        return "TRUE" if valore else "FALSE"
+    # Le date con fuso orario restano testo anche sul foglio: confronto come stringa
+    if isinstance(valore, datetime) and valore.tzinfo is None:
+        return _Data(str(valore), (valore - EPOCA_SHEETS) / timedelta(days=1))
+    if isinstance(valore, date) and not isinstance(valore, datetime):
+        return _Data(str(valore), (valore - EPOCA_SHEETS.date()).days)
+    if isinstance(valore, float) and math.isfinite(valore) and valore.is_integer():
+        return str(int(valore))
+    if isinstance(valore, (np.integer, np.floating, np.bool_)):
+        # numpy scalari -> tipi Python (np.float64(3.0) -> "3")
+        return _cella(valore.item())
+    return str(valore)
+
+
+def _uguali(vecchia, nuova):
+    """Confronto tra cella letta e cella nuova (le date per numero di serie)"""
+    if isinstance(nuova, _Data):
+        try:
+            return abs(float(vecchia) - nuova.seriale) < TOLLERANZA_SERIALE
+        except ValueError:
+            return vecchia == nuova
+    return vecchia == nuova
+
+
+def griglia_da_dataframe(df):
+    """Intestazione + righe come le scrive set_with_dataframe (senza indice)"""
+    righe = [[str(c) for c in df.columns]]
+    righe += [[_cella(v) for v in riga] for riga in df.itertuples(index=False, name=None)]
+    return righe
+
+
+def _blocchi_modificati(vecchia, nuova):
+    """Blocchi (riga_inizio, riga_fine, col_inizio, col_fine), 0-based inclusivi, di celle cambiate.
+
+    Le celle che esistono solo nella vecchia griglia vengono svuotate (come faceva clear()).
+    """
+    n_righe = max(len(vecchia), len(nuova))
+    n_col = max([len(r) for r in vecchia] + [len(r) for r in nuova] + [0])
+
+    def riga(griglia, i):
+        r = griglia[i] if i < len(griglia) else []
+        return [_cella(v) for v in r] + [""] * (n_col - len(r))
+
+    blocchi = []
+    corrente = None
+    for i in range(n_righe):
+        vecchia_riga, nuova_riga = riga(vecchia, i), riga(nuova, i)
+        diverse = [j for j in range(n_col) if not _uguali(vecchia_riga[j], nuova_riga[j])]
+        if not diverse:
+            if corrente:
+                blocchi.append(corrente)
+                corrente = None
+            continue
+        if corrente:
+            corrente = (corrente[0], i, min(corrente[2], diverse[0]), max(corrente[3], diverse[-1]))
+        else:
+            corrente = (i, i, diverse[0], diverse[-1])
+    if corrente:
+        blocchi.append(corrente)
+    return blocchi, n_col
+
+
+class SheetsSink:
+    """Raccoglie i DataFrame da scrivere per foglio e li invia tutti insieme con flush()"""
+
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+        self._fogli = {}
+        self.celle_scritte = 0
+        self.chiamate_api = 0
+
+    def scrivi(self, nome_foglio, df):
+        self._fogli[nome_foglio] = griglia_da_dataframe(df)
+        return self
+
+    def _chiama(self, funzione, descrizione, tentativi=MAX_TENTATIVI):
+        """Chiamata API con backoff esponenziale (più jitter) su quota superata ed errori 5xx"""
+        for tentativo in range(1, tentativi + 1):
+            self.chiamate_api += 1
+            metriche.conta("chiamate_api")
+            try:
+                return funzione()
+            except APIError as e:
+                status = getattr(e.response, "status_code", None)
+                if status not in STATUS_TRANSITORI or tentativo == tentativi:
+                    raise
+                attesa = 2 ** (tentativo - 1) + random.uniform(0, 1)
+                print(f"⚠️ {descrizione}: Google Sheets ha risposto {status}. Riprovo tra {attesa:.1f}s...")
+                time.sleep(attesa)
+
+    def flush(self):
+        """Legge le griglie attuali, calcola le differenze e scrive con una sola batch update"""
+        # Contatori del singolo flush
+        self.celle_scritte = 0
+        self.chiamate_api = 0
+        if not self._fogli:
+            return {"celle": 0, "chiamate": 0}
+        nomi = list(self._fogli)
+
+        proprieta = {
+            ws.title: ws
+            for ws in self._chiama(self.spreadsheet.worksheets, "lettura metadati")
+        }
+        mancanti = [n for n in nomi if n not in proprieta]
+        if mancanti:
+            raise RuntimeError(f"❌ Fogli non trovati nello spreadsheet: {', '.join(mancanti)}")
+
+        letture = self._chiama(
+            lambda: self.spreadsheet.values_batch_get(
+                [absolute_range_name(n) for n in nomi],
+                params={"valueRenderOption": "UNFORMATTED_VALUE", "dateTimeRenderOption": "SERIAL_NUMBER"},
+            ),
+            "lettura griglie",
+        )
+        attuali = {n: r.get("values", []) for n, r in zip(nomi, letture.get("valueRanges", []))}
+
+        dati = []
+        ridimensiona = []
+        for nome in nomi:
+            nuova = self._fogli[nome]
+            blocchi, n_col = _blocchi_modificati(attuali.get(nome, []), nuova)
+            celle_foglio = 0
+            for r0, r1, c0, c1 in blocchi:
+                valori = [
+                    [(nuova[i][j] if i < len(nuova) and j < len(nuova[i]) else "") for j in range(c0, c1 + 1)]
+                    for i in range(r0, r1 + 1)
+                ]
+                intervallo = f"{rowcol_to_a1(r0 + 1, c0 + 1)}:{rowcol_to_a1(r1 + 1, c1 + 1)}"
+                dati.append({"range": absolute_range_name(nome, intervallo), "values": valori})
+                celle_foglio += (r1 - r0 + 1) * (c1 - c0 + 1)
+            self.celle_scritte += celle_foglio
+
+            # La griglia deve contenere il nuovo DataFrame (set_with_dataframe la ridimensionava)
+            ws = proprieta[nome]
+            righe_min, col_min = len(nuova), n_col
+            if ws.row_count < righe_min or ws.col_count < col_min:
+                ridimensiona.append({
+                    "updateSheetProperties": {
+                        "properties": {
+                            "sheetId": ws.id,
+                            "gridProperties": {
+                                "rowCount": max(ws.row_count, righe_min),
+                                "columnCount": max(ws.col_count, col_min),
+                            },
+                        },
+                        "fields": "gridProperties(rowCount,columnCount)",
+                    }
+                })
+            print(f"   • {nome}: {len(blocchi)} blocchi, {celle_foglio} celle da scrivere")
+
+        if ridimensiona:
+            self._chiama(lambda: self.spreadsheet.batch_update({"requests": ridimensiona}), "ridimensionamento fogli")
+        if dati:
+            self._chiama(
+                lambda: self.spreadsheet.values_batch_update({"valueInputOption": "USER_ENTERED", "data": dati}),
+                "scrittura celle",
+            )
+
+        self._fogli.clear()
+        riepilogo = {"celle": self.celle_scritte, "chiamate": self.chiamate_api}
+        metriche.conta("celle_scritte", self.celle_scritte)
+        print(f"📝 Google Sheets: {riepilogo['celle']} celle scritte con {riepilogo['chiamate']} chiamate API")
+        return riepilogo
@@ -0,0 +1,252 @@
+# Storico delle quotazioni costruito dai backup giornalieri di giocatore
+# Invece di rileggere centinaia di CSV si tiene un registro delle sole variazioni: per ogni
+# giorno di backup le righe di giocatore nuove, rimosse o con nome/club/quotazione/ruolo/
+# detentore diversi dal giorno prima. Il registro è in Parquet (backup/storico/parte_*.parquet,
+# una parte per aggiornamento, compattate quando diventano troppe) più l'ultimo snapshot da cui
+# ripartire; in memoria è indicizzato per (id, data), quindi "giocatore X nel tempo" e
+# "variazioni tra A e B" sono slice sull'indice.
+#
+# Uso:
+#   python storico.py aggiorna [--ricostruisci]
+#   python storico.py giocatore 87
+#   python storico.py variazioni 2026_01_01 2026_02_01
+#   python storico.py benchmark
+
+import io
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+
+import pandas as pd
+
+from backup_store import BASE_DIR, date_disponibili, tabelle_del_giorno
+from normalizzazione import ruoli_come_testo
+
+STORICO_DIR = os.path.join(BASE_DIR, "storico")
+INDICE_PATH = os.path.join(STORICO_DIR, "indice.json")
+ULTIMO_PATH = os.path.join(STORICO_DIR, "ultimo.parquet")
+
+CAMPI = ["nome", "club", "quot_att_mantra", "ruolo", "detentore_cartellino"]
+# Oltre questo numero di parti il registro viene riscritto in un unico file
+MAX_PARTI = int(os.environ.get("STORICO_MAX_PARTI", 20))
+
+
+# === SNAPSHOT E VARIAZIONI ===
+def _data(giorno):
+    return pd.Timestamp(giorno.replace("_", "-"))
+
+
+def snapshot_giocatori(contenuto):
+    """CSV di giocatore (bytes, pandas o COPY) -> id + CAMPI con tipi compatti"""
+    df = pd.read_csv(io.BytesIO(contenuto), usecols=["id"] + CAMPI, dtype={"nome": object, "club": object})
+    df = df.dropna(subset=["id"]).drop_duplicates(subset="id", keep="last")
+    df["id"] = df["id"].astype("int32")
+    df["quot_att_mantra"] = pd.to_numeric(df["quot_att_mantra"], errors="coerce").round().astype("Int16")
+    df["ruolo"] = ruoli_come_testo(df["ruolo"])
+    for col in ("nome", "club", "detentore_cartellino"):
+        df[col] = df[col].astype(object).where(df[col].notna(), None)
+    return df.set_index("id").sort_index()
+
+
+def variazioni(precedente, attuale, data):
+    """Righe di attuale nuove o cambiate rispetto a precedente, più le righe sparite (evento 'rimosso')"""
+    nuovi = attuale.index.difference(precedente.index)
+    rimossi = precedente.index.difference(attuale.index)
+    comuni = attuale.index.intersection(precedente.index)
+
+    prima = precedente.loc[comuni, CAMPI].astype(object)
+    dopo = attuale.loc[comuni, CAMPI].astype(object)
+    diversi = (prima.ne(dopo) & ~(prima.isna() & dopo.isna())).any(axis=1)
+
+    parti = [
+        attuale.loc[nuovi].assign(evento="nuovo"),
+        attuale.loc[comuni[diversi.to_numpy()]].assign(evento="modifica"),
+        precedente.loc[rimossi].assign(evento="rimosso"),
+    ]
+    out = pd.concat([p for p in parti if len(p)]) if any(len(p) for p in parti) else attuale.iloc[:0].assign(evento="")
+    out = out.reset_index()
+    out.insert(0, "data", data)
+    return out
+
+
+def _tipizza_registro(df):
+    df = df.astype({"id": "int32", "quot_att_mantra": "Int16"})
+    for col in ("club", "detentore_cartellino", "evento"):
+        df[col] = df[col].astype("category")
+    return df
+
+
+# === REGISTRO SU DISCO ===
+def leggi_indice():
+    if not os.path.exists(INDICE_PATH):
+        return {"date": [], "parti": []}
+    with open(INDICE_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _scrivi_indice(indice):
+    with open(INDICE_PATH, "w", encoding="utf-8") as f:
+        json.dump(indice, f, indent=2)
+        f.write("\n")
+
+
+def aggiorna_storico(ricostruisci=False):
+    """Aggiunge al registro le date di backup successive all'ultima elaborata"""
+    t0 = time.perf_counter()
+    if ricostruisci:
+        for percorso in glob.glob(os.path.join(STORICO_DIR, "*")):
+            os.remove(percorso)
+    os.makedirs(STORICO_DIR, exist_ok=True)
+    indice = leggi_indice()
+    ultima = indice["date"][-1] if indice["date"] else ""
+    da_fare = [d for d in date_disponibili() if d > ultima]
+    if not da_fare:
+        print(f"📈 Storico già aggiornato al {ultima or '-'}")
+        return indice
+
+    precedente = pd.read_parquet(ULTIMO_PATH) if os.path.exists(ULTIMO_PATH) else None
+    eventi = []
+    elaborate = []
+    for giorno in da_fare:
+        try:
+            contenuto = tabelle_del_giorno(giorno).get("giocatore")
+        except FileNotFoundError:
+            contenuto = None
+        if contenuto is None:
+            continue
+        attuale = snapshot_giocatori(contenuto)
+        base = precedente if precedente is not None else attuale.iloc[:0]
+        eventi.append(variazioni(base, attuale, _data(giorno)))
+        precedente = attuale
+        elaborate.append(giorno)
+
+    if not elaborate:
+        return indice
+    registro = _tipizza_registro(pd.concat(eventi, ignore_index=True))
+    nome_parte = f"parte_{elaborate[0]}_{elaborate[-1]}.parquet"
+    registro.to_parquet(os.path.join(STORICO_DIR, nome_parte), index=False)
+    precedente.to_parquet(ULTIMO_PATH)
+    indice["date"] += elaborate
+    indice["parti"].append(nome_parte)
+    if len(indice["parti"]) > MAX_PARTI:
+        indice = _compatta(indice)
+    _scrivi_indice(indice)
+    print(
+        f"📈 Storico: {len(elaborate)} giorni aggiunti ({elaborate[0]} → {elaborate[-1]}), "
+        f"{len(registro)} variazioni in {time.perf_counter() - t0:.2f}s"
+    )
+    return indice
+
+
+def _compatta(indice):
+    """Riscrive tutte le parti in un unico file"""
+    registro = pd.concat([pd.read_parquet(os.path.join(STORICO_DIR, p)) for p in indice["parti"]], ignore_index=True)
+    nome_parte = f"parte_{indice['date'][0]}_{indice['date'][-1]}.parquet"
+    _tipizza_registro(registro).to_parquet(os.path.join(STORICO_DIR, f"{nome_parte}.tmp"), index=False)
+    for parte in indice["parti"]:
+        os.remove(os.path.join(STORICO_DIR, parte))
+    os.replace(os.path.join(STORICO_DIR, f"{nome_parte}.tmp"), os.path.join(STORICO_DIR, nome_parte))
+    indice["parti"] = [nome_parte]
+    print(f"🗜️ Storico compattato in {nome_parte}")
+    return indice
+
+
+def carica_storico():
+    """Registro completo indicizzato per (id, data)"""
+    indice = leggi_indice()
+    parti = [pd.read_parquet(os.path.join(STORICO_DIR, p)) for p in indice["parti"]]
+    if not parti:
+        raise FileNotFoundError("❌ Storico vuoto: esegui prima 'python storico.py aggiorna'")
+    registro = pd.concat(parti, ignore_index=True) if len(parti) > 1 else parti[0]
+    return registro.set_index(["id", "data"]).sort_index()
+
+
+# === QUERY ===
+def storico_giocatore(registro, id_giocatore):
+    """Valori di un giocatore nel tempo: una riga per ogni giorno in cui è cambiato qualcosa"""
+    if id_giocatore not in registro.index.get_level_values("id"):
+        return registro.iloc[:0].droplevel("id")
+    return registro.xs(id_giocatore, level="id")
+
+
+def variazioni_tra(registro, data_a, data_b):
+    """Eventi con data in (data_a, data_b], per id e data"""
+    date = registro.index.get_level_values("data")
+    return registro[(date > _data(data_a)) & (date <= _data(data_b))]
+
+
+def stato_al(registro, giorno):
+    """Snapshot ricostruito di giocatore (id + CAMPI) alla data indicata"""
+    fino = registro[registro.index.get_level_values("data") <= _data(giorno)]
+    ultimi = fino.groupby(level="id", observed=True).tail(1).droplevel("data")
+    return ultimi[ultimi["evento"] != "rimosso"][CAMPI]
+
+
+def benchmark():
+    """Crawl dei CSV legacy con pandas contro le stesse domande sul registro"""
+    t0 = time.perf_counter()
+    frame = []
+    for percorso in sorted(glob.glob(os.path.join(BASE_DIR, "20*", "giocatore.csv"))):
+        df = pd.read_csv(percorso)
+        df["data"] = _data(os.path.basename(os.path.dirname(percorso)))
+        frame.append(df)
+    tutto = pd.concat(frame, ignore_index=True)
+    t_csv = time.perf_counter() - t0
+    id_esempio = int(tutto["id"].mode().iloc[0])
+    t0 = time.perf_counter()
+    tutto[tutto["id"] == id_esempio][["data"] + CAMPI].drop_duplicates(subset=CAMPI)
+    t_csv += time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    registro = carica_storico()
+    t_carica = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    storia = storico_giocatore(registro, id_esempio)
+    t_giocatore = time.perf_counter() - t0
+    date = leggi_indice()["date"]
+    t0 = time.perf_counter()
+    finestra = variazioni_tra(registro, date[len(date) // 2], date[-1])
+    t_variazioni = time.perf_counter() - t0
+
+    # Verifica: lo stato ricostruito coincide con l'ultimo backup
+    ultimo = snapshot_giocatori(tabelle_del_giorno(date[-1])["giocatore"])
+    ricostruito = stato_al(registro, date[-1]).sort_index()
+    uguali = ricostruito.astype(object).fillna("").equals(ultimo[CAMPI].astype(object).fillna(""))
+
+    print(f"📊 {len(tutto)} righe in {len(frame)} CSV, registro di {len(registro)} variazioni")
+    print(f"⏱️ Crawl CSV + storia di un giocatore: {t_csv * 1000:.0f} ms")
+    print(f"⏱️ Caricamento registro: {t_carica * 1000:.1f} ms")
+    print(f"⏱️ Giocatore {id_esempio} nel tempo ({len(storia)} righe): {t_giocatore * 1000:.2f} ms")
+    print(f"⏱️ Variazioni {date[len(date) // 2]} → {date[-1]} ({len(finestra)} righe): {t_variazioni * 1000:.2f} ms")
+    print(f"✅ Stato ricostruito al {date[-1]} identico al backup: {uguali}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Storico quotazioni dai backup di giocatore")
+    comandi = parser.add_subparsers(dest="comando", required=True)
+    agg = comandi.add_parser("aggiorna", help="aggiunge le date di backup non ancora elaborate")
+    agg.add_argument("--ricostruisci", action="store_true", help="riparte da zero")
+    gio = comandi.add_parser("giocatore", help="un giocatore nel tempo")
+    gio.add_argument("id", type=int)
+    var = comandi.add_parser("variazioni", help="variazioni tra due date (YYYY_MM_DD)")
+    var.add_argument("data_a")
+    var.add_argument("data_b")
+    comandi.add_parser("benchmark", help="registro contro crawl dei CSV")
+    args = parser.parse_args(argv)
+
+    pd.set_option("display.width", 200)
+    if args.comando == "aggiorna":
+        aggiorna_storico(ricostruisci=args.ricostruisci)
+    elif args.comando == "giocatore":
+        print(storico_giocatore(carica_storico(), args.id).to_string())
+    elif args.comando == "variazioni":
+        print(variazioni_tra(carica_storico(), args.data_a, args.data_b).to_string())
+    elif args.comando == "benchmark":
+        benchmark()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
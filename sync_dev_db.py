@@ -1,18 +1,31 @@
 import os
-import psycopg2
+import time
+import threading
 from psycopg2 import sql
 from psycopg2.extras import execute_values
 
+from db import Pool, stampa_riepilogo_query
+from pipeline import Pipeline
+from metriche import scrivi_report
+
 # Conn string dirette (sovrascrivibili via env). Metti qui i DSN completi.
 SRC_DSN = os.environ.get("SUPABASE_PASSWORD_PROD")
 DST_DSN = os.environ.get("SUPABASE_PASSWORD_DEV")
 
-if "<dest-connection-string>" in DST_DSN:
-    raise RuntimeError("Imposta DST_SUPABASE_DSN o sostituisci il DSN di destinazione nel file.")
-
-BATCH_SIZE = 1000
+# Righe per batch nella paginazione keyset / byte per blocco nel pipe COPY
+BATCH_SIZE = int(os.environ.get("SYNC_BATCH_SIZE", 1000))
+COPY_BUFFER = int(os.environ.get("SYNC_COPY_BUFFER", 1 << 20))
+# "copy": pipe COPY TO STDOUT (prod) -> COPY FROM STDIN (dev); "keyset": SELECT per PK + upsert
+METODO = os.environ.get("SYNC_METODO", "copy")
+# Tabelle copiate in parallelo (una connessione prod + una dev per worker)
+WORKERS = int(os.environ.get("SYNC_WORKERS", 4))
+# "incrementale": solo righe inserite/modificate/cancellate (impronte md5 per riga);
+# "completa": TRUNCATE + copia di tutto
+MODALITA = os.environ.get("SYNC_MODALITA", "incrementale")
+# Righe per bucket di PK: si confrontano prima gli hash dei bucket, poi le righe dei soli bucket diversi
+RIGHE_BUCKET = int(os.environ.get("SYNC_RIGHE_BUCKET", 256))
 
-# Ordine più sicuro rispetto alle FK più comuni (es. asta/ scambio puntano a giocatore/squadra).
+# Tabelle da allineare; l'ordine di copia viene dal grafo delle FK (vedi pianifica_sync)
 TABLES = [
     "stadio",
     "giocatore",
@@ -42,13 +55,28 @@ def get_pk_columns(conn, table):
         return [row[0] for row in cur.fetchall()]
 
 
-def fetch_rows(cur, table, offset, limit):
-    query = sql.SQL("SELECT * FROM {} OFFSET %s LIMIT %s").format(sql.Identifier(table))
-    cur.execute(query, (offset, limit))
+def fetch_rows(cur, table, pk_cols, last_key, limit):
+    """Batch successivo in ordine di PK (paginazione keyset: costo costante per batch)"""
+    pk = sql.SQL(", ").join(sql.Identifier(c) for c in pk_cols)
+    if last_key is None:
+        query = sql.SQL("SELECT * FROM {} ORDER BY {} LIMIT %s").format(sql.Identifier(table), pk)
+        params = (limit,)
+    else:
+        query = sql.SQL("SELECT * FROM {} WHERE ({}) > ({}) ORDER BY {} LIMIT %s").format(
+            sql.Identifier(table), pk, sql.SQL(", ").join(sql.Placeholder() * len(pk_cols)), pk
+        )
+        params = (*last_key, limit)
+    cur.execute(query, params)
     cols = [desc.name for desc in cur.description]
     return cols, cur.fetchall()
 
 
+def get_columns(conn, table):
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("SELECT * FROM {} LIMIT 0").format(sql.Identifier(table)))
+        return [desc.name for desc in cur.description]
+
+
 def upsert_rows(cur, table, cols, rows, pk_cols):
     cols_list = ",".join(f'"{c}"' for c in cols)
     placeholders = "(" + ",".join(["%s"] * len(cols)) + ")"
@@ -72,43 +100,378 @@ def upsert_rows(cur, table, cols, rows, pk_cols):
     execute_values(cur, insert_sql, rows, template=placeholders, page_size=BATCH_SIZE)
 
 
+def get_foreign_keys(conn, tables):
+    """Archi (figlia, padre) delle FK tra le tabelle indicate, letti da pg_constraint"""
+    query = """
+        SELECT figlia.relname, padre.relname
+        FROM pg_constraint c
+        JOIN pg_class figlia ON figlia.oid = c.conrelid
+        JOIN pg_class padre ON padre.oid = c.confrelid
+        JOIN pg_namespace n ON n.oid = figlia.relnamespace
+        WHERE c.contype = 'f' AND n.nspname = 'public'
+          AND figlia.relname = ANY(%s) AND padre.relname = ANY(%s);
+    """
+    with conn.cursor() as cur:
+        cur.execute(query, (list(tables), list(tables)))
+        return sorted(set(cur.fetchall()))
+
+
+def pianifica_sync(tables, foreign_keys):
+    """Ordine topologico (padri prima delle figlie) e dipendenze di ogni tabella.
+
+    Le FK verso sé stessa non contano; se c'è un ciclo le tabelle coinvolte vengono
+    accodate dipendendo solo da quelle già pianificate (con replica role le FK non
+    vengono comunque verificate durante la copia).
+    """
+    padri = {t: set() for t in tables}
+    for figlia, padre in foreign_keys:
+        if figlia != padre:
+            padri[figlia].add(padre)
+
+    ordine = []
+    dipendenze = {}
+    rimaste = list(tables)
+    while rimaste:
+        pronte = [t for t in rimaste if padri[t] <= set(ordine)]
+        if not pronte:
+            print(f"⚠️ Ciclo di FK tra {rimaste}: le copio senza vincolo d'ordine")
+            pronte = rimaste[:]
+        for t in pronte:
+            dipendenze[t] = sorted(padri[t] & set(ordine))
+            ordine.append(t)
+            rimaste.remove(t)
+    return ordine, dipendenze
+
+
 def truncate_tables(dst_conn, tables):
-    """Truncate tutte le tabelle nel DB di destinazione."""
+    """Truncate di tutte le tabelle in un'unica istruzione (e transazione)"""
     with dst_conn.cursor() as cur:
-        for table in reversed(tables):  # Ordine inverso per gestire le FK
-            cur.execute(sql.SQL("TRUNCATE TABLE {} CASCADE").format(sql.Identifier(table)))
-            dst_conn.commit()
-            print(f"{table}: truncated")
+        cur.execute(
+            sql.SQL("TRUNCATE TABLE {} CASCADE").format(
+                sql.SQL(", ").join(sql.Identifier(t) for t in tables)
+            )
+        )
+    dst_conn.commit()
+    print(f"{len(tables)} tabelle troncate: {', '.join(tables)}")
 
 
-def copy_table(src_conn, dst_conn, table, batch_size=BATCH_SIZE):
-    pk_cols = get_pk_columns(dst_conn, table)
+def copy_pipe(src_conn, dst_conn, table, cols, buffer_size=COPY_BUFFER):
+    """COPY TO STDOUT dalla sorgente direttamente in COPY FROM STDIN sulla destinazione.
+
+    Un thread scrive l'output della sorgente in un pipe che la destinazione legge a blocchi:
+    nessuna riga passa da Python come tupla e la memoria resta quella del buffer.
+    """
+    cols_sql = sql.SQL(", ").join(sql.Identifier(c) for c in cols)
+    copy_out = sql.SQL("COPY (SELECT {} FROM {}) TO STDOUT").format(cols_sql, sql.Identifier(table))
+    copy_in = sql.SQL("COPY {} ({}) FROM STDIN").format(sql.Identifier(table), cols_sql)
+
+    fd_lettura, fd_scrittura = os.pipe()
+    lettore = os.fdopen(fd_lettura, "rb")
+    scrittore = os.fdopen(fd_scrittura, "wb")
+    errori = []
+
+    def produci():
+        try:
+            with src_conn.cursor() as cur:
+                cur.copy_expert(copy_out.as_string(src_conn), scrittore, size=buffer_size)
+        except Exception as e:
+            errori.append(e)
+        finally:
+            scrittore.close()
+
+    produttore = threading.Thread(target=produci, name=f"copy-{table}")
+    produttore.start()
+    try:
+        with dst_conn.cursor() as cur:
+            cur.copy_expert(copy_in.as_string(dst_conn), lettore, size=buffer_size)
+            righe = cur.rowcount
+    finally:
+        lettore.close()
+        produttore.join()
+    if errori:
+        # La sorgente si è fermata a metà: la destinazione ha letto un EOF anticipato
+        raise errori[0]
+    return righe
+
+
+def copy_keyset(src_conn, dst_conn, table, pk_cols, batch_size=BATCH_SIZE):
+    """Copia a batch in ordine di PK con upsert (utile se la destinazione non è vuota)"""
+    totale = 0
+    last_key = None
     with src_conn.cursor() as src_cur, dst_conn.cursor() as dst_cur:
-        offset = 0
         while True:
-            cols, rows = fetch_rows(src_cur, table, offset, batch_size)
+            cols, rows = fetch_rows(src_cur, table, pk_cols, last_key, batch_size)
             if not rows:
                 break
             upsert_rows(dst_cur, table, cols, rows, pk_cols)
-            dst_conn.commit()
-            offset += len(rows)
-            print(f"{table}: copiati {len(rows)} record (tot {offset})")
+            totale += len(rows)
+            indici = [cols.index(c) for c in pk_cols]
+            last_key = tuple(rows[-1][i] for i in indici)
+            print(f"{table}: copiati {len(rows)} record (tot {totale})")
+    return totale
 
 
-def main():
-    with psycopg2.connect(SRC_DSN) as src_conn, psycopg2.connect(DST_DSN) as dst_conn:
+def copy_table(src_conn, dst_conn, table, batch_size=BATCH_SIZE, metodo=METODO, colonne=None):
+    """Copia una tabella in un'unica transazione sulla destinazione (solo colonne, se indicate)"""
+    t0 = time.perf_counter()
+    pk_cols = get_pk_columns(dst_conn, table)
+    if metodo == "keyset" and pk_cols and colonne is None:
+        righe = copy_keyset(src_conn, dst_conn, table, pk_cols, batch_size)
+    else:
+        # COPY anche per le tabelle senza PK, che non si possono paginare per chiave
+        righe = copy_pipe(src_conn, dst_conn, table, colonne or get_columns(src_conn, table))
+    dst_conn.commit()
+    secondi = time.perf_counter() - t0
+    velocita = righe / secondi if secondi > 0 else 0
+    print(f"{table}: {righe} record in {secondi:.2f}s ({velocita:,.0f} righe/s)")
+    return righe, secondi
+
+
+# === SYNC INCREMENTALE ===
+def get_schema(conn, table):
+    """Colonne (nome, tipo) nell'ordine della tabella: se differiscono niente sync incrementale"""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT column_name, data_type, udt_name
+            FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name = %s
+            ORDER BY ordinal_position;
+            """,
+            (table,),
+        )
+        return cur.fetchall()
+
+
+def _bucket_sql(pk_cols, n_bucket):
+    """Bucket di una riga calcolato dalla sola PK: uguale su prod e dev"""
+    pk = sql.SQL(", ").join(sql.Identifier(c) for c in pk_cols)
+    # & 2147483647 e non abs(): abs(hashtext(...)) va in overflow quando l'hash vale INT_MIN
+    return sql.SQL("mod(hashtext(ROW({})::text) & 2147483647, {})").format(pk, sql.Literal(n_bucket))
+
+
+def get_bucket_fingerprints(conn, table, pk_cols, n_bucket):
+    """bucket -> (md5 delle impronte di riga del bucket, righe, byte), tutto calcolato in SQL"""
+    query = sql.SQL("""
+        SELECT bucket, md5(string_agg(impronta, '' ORDER BY impronta)), count(*), sum(byte)
+        FROM (SELECT {} AS bucket, md5(t::text) AS impronta, octet_length(t::text) AS byte FROM {} t) r
+        GROUP BY bucket
+    """).format(_bucket_sql(pk_cols, n_bucket), sql.Identifier(table))
+    with conn.cursor() as cur:
+        cur.execute(query)
+        return {r[0]: (r[1], r[2], int(r[3])) for r in cur.fetchall()}
+
+
+def get_fingerprints(conn, table, pk_cols, n_bucket, buckets):
+    """PK -> (md5 della riga, byte della riga) per le righe dei bucket indicati"""
+    pk = sql.SQL(", ").join(sql.Identifier(c) for c in pk_cols)
+    query = sql.SQL("SELECT {}, md5(t::text), octet_length(t::text) FROM {} t WHERE {} = ANY(%s)").format(
+        pk, sql.Identifier(table), _bucket_sql(pk_cols, n_bucket)
+    )
+    n = len(pk_cols)
+    with conn.cursor() as cur:
+        cur.execute(query, (list(buckets),))
+        return {tuple(r[:n]): (r[n], r[n + 1]) for r in cur.fetchall()}
+
+
+def fetch_rows_by_pk(cur, table, pk_cols, keys, batch_size=BATCH_SIZE):
+    """Righe complete della sorgente per le PK indicate, a batch"""
+    pk = sql.SQL(", ").join(sql.Identifier(c) for c in pk_cols)
+    query = sql.SQL("SELECT * FROM {} WHERE ({}) IN (VALUES %s)").format(sql.Identifier(table), pk)
+    cols, rows = None, []
+    for i in range(0, len(keys), batch_size):
+        rows += execute_values(cur, query.as_string(cur), keys[i:i + batch_size], page_size=batch_size, fetch=True)
+        cols = [desc.name for desc in cur.description]
+    return cols, rows
+
+
+def delete_rows(cur, table, pk_cols, keys, batch_size=BATCH_SIZE):
+    pk = sql.SQL(", ").join(sql.Identifier(c) for c in pk_cols)
+    query = sql.SQL("DELETE FROM {} WHERE ({}) IN (VALUES %s)").format(sql.Identifier(table), pk)
+    execute_values(cur, query.as_string(cur), keys, page_size=batch_size)
+
+
+def sync_incrementale(src_conn, dst_conn, table, pk_cols):
+    """Confronta le impronte (prima per bucket di PK, poi per riga) e trasferisce solo le differenze"""
+    with src_conn.cursor() as cur:
+        cur.execute(sql.SQL("SELECT count(*) FROM {}").format(sql.Identifier(table)))
+        n_bucket = max(1, cur.fetchone()[0] // RIGHE_BUCKET)
+    bucket_src = get_bucket_fingerprints(src_conn, table, pk_cols, n_bucket)
+    bucket_dst = get_bucket_fingerprints(dst_conn, table, pk_cols, n_bucket)
+    diversi = [
+        b for b in set(bucket_src) | set(bucket_dst)
+        if bucket_src.get(b, (None,))[0] != bucket_dst.get(b, (None,))[0]
+    ]
+
+    sorgente, destinazione = {}, {}
+    if diversi:
+        sorgente = get_fingerprints(src_conn, table, pk_cols, n_bucket, diversi)
+        destinazione = get_fingerprints(dst_conn, table, pk_cols, n_bucket, diversi)
+
+    nuove = [k for k in sorgente if k not in destinazione]
+    modificate = [k for k, (md5, _) in sorgente.items() if k in destinazione and destinazione[k][0] != md5]
+    cancellate = [k for k in destinazione if k not in sorgente]
+
+    with src_conn.cursor() as src_cur, dst_conn.cursor() as dst_cur:
+        if cancellate:
+            delete_rows(dst_cur, table, pk_cols, cancellate)
+        da_copiare = nuove + modificate
+        if da_copiare:
+            cols, rows = fetch_rows_by_pk(src_cur, table, pk_cols, da_copiare)
+            upsert_rows(dst_cur, table, cols, rows, pk_cols)
+
+    # Byte trasferiti: hash dei bucket e impronte di riga (md5 + PK) dai due lati più le
+    # righe cambiate; una sync completa avrebbe spostato tutte le righe della sorgente
+    byte_bucket = 40 * (len(bucket_src) + len(bucket_dst))
+    byte_impronte = lambda impronte: sum(32 + sum(len(str(v)) for v in k) for k in impronte)
+    return {
+        "modalita": "incrementale",
+        "nuove": len(nuove),
+        "modificate": len(modificate),
+        "cancellate": len(cancellate),
+        "righe": len(nuove) + len(modificate) + len(cancellate),
+        "righe_totali": sum(r for _, r, _ in bucket_src.values()),
+        "byte": (
+            byte_bucket + byte_impronte(sorgente) + byte_impronte(destinazione)
+            + sum(sorgente[k][1] for k in da_copiare)
+        ),
+        "byte_totali": sum(b for _, _, b in bucket_src.values()),
+        "bucket_diversi": f"{len(diversi)}/{n_bucket}",
+    }
+
+
+def sync_completa(src_conn, dst_conn, table, svuota=True):
+    """Ripiego: svuota la tabella (DELETE, niente CASCADE sulle altre) e la copia tutta.
+
+    Con schemi diversi copia solo le colonne presenti in entrambi i database.
+    """
+    colonne_src = get_columns(src_conn, table)
+    colonne_dst = get_columns(dst_conn, table)
+    colonne = None
+    if set(colonne_src) != set(colonne_dst):
+        colonne = [c for c in colonne_src if c in colonne_dst]
+        solo_prod = [c for c in colonne_src if c not in colonne_dst]
+        solo_dev = [c for c in colonne_dst if c not in colonne_src]
+        if not colonne:
+            print(f"⚠️ {table}: nessuna colonna in comune tra prod e dev, salto la tabella")
+            return {
+                "modalita": "saltata",
+                "nuove": 0, "modificate": 0, "cancellate": 0,
+                "righe": 0, "righe_totali": 0, "byte": 0, "byte_totali": 0,
+            }
+        print(
+            f"⚠️ {table}: copio solo le {len(colonne)} colonne comuni "
+            f"(solo prod: {', '.join(solo_prod) or '-'}; solo dev: {', '.join(solo_dev) or '-'})"
+        )
+    if svuota:
         with dst_conn.cursor() as cur:
-            cur.execute("SET session_replication_role = 'replica';")
-        try:
-            print("=== Truncating destination tables ===")
-            truncate_tables(dst_conn, TABLES)
-            print("\n=== Copying data from source ===")
-            for table in TABLES:
-                copy_table(src_conn, dst_conn, table)
-        finally:
-            with dst_conn.cursor() as cur:
-                cur.execute("SET session_replication_role = 'origin';")
-            dst_conn.commit()
+            cur.execute(sql.SQL("DELETE FROM {}").format(sql.Identifier(table)))
+    with src_conn.cursor() as cur:
+        cur.execute(
+            sql.SQL("SELECT coalesce(sum(octet_length(t::text)), 0) FROM {} t").format(sql.Identifier(table))
+        )
+        byte = int(cur.fetchone()[0])
+    righe, _ = copy_table(src_conn, dst_conn, table, colonne=colonne)
+    return {
+        "modalita": "completa",
+        "nuove": righe, "modificate": 0, "cancellate": 0,
+        "righe": righe, "righe_totali": righe,
+        "byte": byte, "byte_totali": byte,
+    }
+
+
+def sincronizza_tabella(src_pool, dst_pool, table, modalita=MODALITA):
+    """Worker: connessioni proprie, FK disattivate solo per la transazione della tabella"""
+    t0 = time.perf_counter()
+    with src_pool.connessione() as src_conn, dst_pool.connessione() as dst_conn:
+        with dst_conn.cursor() as cur:
+            cur.execute("SET LOCAL session_replication_role = 'replica';")
+
+        if modalita == "completa":
+            # Destinazione già troncata da main()
+            esito = sync_completa(src_conn, dst_conn, table, svuota=False)
+        else:
+            pk_cols = get_pk_columns(dst_conn, table)
+            motivo = None
+            if not pk_cols:
+                motivo = "nessuna PK"
+            elif get_schema(src_conn, table) != get_schema(dst_conn, table):
+                motivo = "schema diverso tra prod e dev"
+            if motivo:
+                print(f"⚠️ {table}: {motivo}, copia completa")
+                esito = sync_completa(src_conn, dst_conn, table)
+            else:
+                esito = sync_incrementale(src_conn, dst_conn, table, pk_cols)
+                dst_conn.commit()
+                print(
+                    f"{table}: +{esito['nuove']} ~{esito['modificate']} -{esito['cancellate']} "
+                    f"su {esito['righe_totali']} righe (bucket diversi {esito['bucket_diversi']})"
+                )
+    esito["secondi"] = time.perf_counter() - t0
+    return esito
+
+
+def stampa_riepilogo_sync(pipeline, risultati):
+    print("\n=== Riepilogo sync ===")
+    # Durata di ogni stadio (connessioni comprese): la loro somma è il tempo in sequenza
+    durate = {t: fine - inizio for t, (inizio, fine) in pipeline.tempi.items()}
+    sequenziale = sum(durate.values())
+    righe = righe_totali = byte = byte_totali = 0
+    for table, secondi in sorted(durate.items(), key=lambda x: -x[1]):
+        esito = risultati[table]
+        righe += esito["righe"]
+        righe_totali += esito["righe_totali"]
+        byte += esito["byte"]
+        byte_totali += esito["byte_totali"]
+        print(
+            f"  {table:<30} {esito['modalita']:<12} {esito['righe']:>8}/{esito['righe_totali']:<8} righe "
+            f"{esito['byte'] / 1024:>9.1f}/{esito['byte_totali'] / 1024:<9.1f} KB {secondi:>7.2f}s"
+        )
+    speedup = sequenziale / pipeline.durata if pipeline.durata else 1.0
+    print(
+        f"📦 Trasferite {righe}/{righe_totali} righe, {byte / 1024:.1f}/{byte_totali / 1024:.1f} KB "
+        f"rispetto a una sync completa"
+    )
+    print(
+        f"⏱️ Totale {pipeline.durata:.2f}s con {pipeline.max_workers} worker "
+        f"(in sequenza {sequenziale:.2f}s, speedup x{speedup:.1f})"
+    )
+
+
+def main():
+    # Controllo qui e non all'import: restore_backup.py riusa la pianificazione FK di questo modulo
+    if not DST_DSN or "<dest-connection-string>" in DST_DSN:
+        raise RuntimeError("Imposta DST_SUPABASE_DSN o sostituisci il DSN di destinazione nel file.")
+    src_pool = Pool(SRC_DSN, maxconn=WORKERS, nome="prod")
+    dst_pool = Pool(DST_DSN, maxconn=WORKERS, nome="dev")
+
+    with dst_pool.connessione() as dst_conn:
+        ordine, dipendenze = pianifica_sync(TABLES, get_foreign_keys(dst_conn, TABLES))
+        print("=== Piano (FK) ===")
+        for table in ordine:
+            print(f"  {table} ← {', '.join(dipendenze[table]) or '-'}")
+        if MODALITA == "completa":
+            print("\n=== Truncating destination tables ===")
+            truncate_tables(dst_conn, ordine)
+
+    print(f"\n=== Copying data from source ({MODALITA}) ===")
+    pipeline = Pipeline("sync_dev_db", max_workers=WORKERS)
+    for table in ordine:
+        pipeline.stadio(
+            table,
+            lambda *_, table=table: sincronizza_tabella(src_pool, dst_pool, table),
+            dipende_da=dipendenze[table],
+        )
+    try:
+        risultati = pipeline.esegui()
+    finally:
+        scrivi_report(pipeline.report())
+    pipeline.stampa_timeline()
+    stampa_riepilogo_sync(pipeline, risultati)
+
+    stampa_riepilogo_query()
+    src_pool.chiudi()
+    dst_pool.chiudi()
 
 
 if __name__ == "__main__":
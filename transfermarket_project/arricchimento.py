@@ -0,0 +1,122 @@
+# Arricchimento di giocatore con i dati Transfermarkt (valore di mercato, contratto, ruolo...)
+# Stadio dell'ETL dopo il TRANSFORM: mappa persistente id -> player_code (cache_match), un solo
+# merge con transfermarket_ds e upsert set-based nella tabella laterale giocatore_transfermarkt.
+# Se né il dataset Transfermarkt né la mappa sono cambiati dall'ultimo caricamento riuscito,
+# lo stadio non tocca il database.
+
+import os
+import time
+import hashlib
+
+import pandas as pd
+from psycopg2.extras import execute_values
+
+from transfermarket_project.cache_match import aggiorna_mappa
+from transfermarket_project.ingest import CACHE_DIR, leggi_json, scrivi_json, leggi_transfermarket
+
+TABELLA = os.environ.get("SUPABASE_TABLE_TRANSFERMARKT", "giocatore_transfermarkt")
+STATO_PATH = os.path.join(CACHE_DIR, "arricchimento.json")
+
+# Colonne di transfermarket_ds portate sul database, con il tipo Postgres
+COLONNE_TM = {
+    "name": "text",
+    "market_value_in_eur": "bigint",
+    "highest_market_value_in_eur": "bigint",
+    "contract_expiration_date": "date",
+    "position": "text",
+    "sub_position": "text",
+    "foot": "text",
+    "height_in_cm": "smallint",
+    "date_of_birth": "date",
+    "country_of_birth": "text",
+    "url": "text",
+    "image_url": "text",
+}
+COLONNE = ["giocatore_id", "player_code", "bridge_player_key", "confidenza", "metodo"] + list(COLONNE_TM)
+
+DDL = f"""
+CREATE TABLE IF NOT EXISTS {TABELLA} (
+    giocatore_id integer PRIMARY KEY REFERENCES giocatore(id) ON DELETE CASCADE,
+    player_code text NOT NULL,
+    bridge_player_key integer NOT NULL,
+    confidenza real,
+    metodo text,
+    {", ".join(f"{c} {t}" for c, t in COLONNE_TM.items())},
+    aggiornato timestamptz NOT NULL DEFAULT now()
+);
+"""
+
+
+def prepara_arricchimento(giocatori, transfermarket):
+    """Una riga per giocatore collegato a Transfermarkt, con le colonne di COLONNE (merge vettoriale)"""
+    giocatori = giocatori.dropna(subset=["id"]).astype({"id": "int64"})
+    bridge = aggiorna_mappa(giocatori[["id", "nome", "club"]], transfermarket)
+    tm = transfermarket[["player_code"] + list(COLONNE_TM)].drop_duplicates(subset="player_code")
+    df = (
+        bridge.dropna(subset=["tm_player_code"])
+        .merge(tm, left_on="tm_player_code", right_on="player_code", how="inner", validate="many_to_one")
+        .rename(columns={"id": "giocatore_id"})
+    )
+    return df[COLONNE].sort_values("giocatore_id").reset_index(drop=True)
+
+
+def firma_arricchimento(df, firma_transfermarkt):
+    """Hash del contenuto da caricare: cambia con il dataset Transfermarkt o con la mappa"""
+    sha = hashlib.sha256((firma_transfermarkt or "").encode("utf-8"))
+    sha.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return sha.hexdigest()
+
+
+def carica_arricchimento(conn, df):
+    """Upsert di df su TABELLA via staging temporaneo; toglie i giocatori non più collegati"""
+    valori = df.astype(object).where(df.notna(), None).values.tolist()
+    colonne = ", ".join(COLONNE)
+    aggiornabili = [c for c in COLONNE if c != "giocatore_id"]
+    with conn.cursor() as cur:
+        cur.execute(DDL)
+        cur.execute(
+            f"CREATE TEMP TABLE tm_stage ON COMMIT DROP AS SELECT {colonne} FROM {TABELLA} WITH NO DATA;"
+        )
+        execute_values(cur, f"INSERT INTO tm_stage ({colonne}) VALUES %s", valori, page_size=1000)
+        cur.execute(
+            f"""
+            INSERT INTO {TABELLA} AS t ({colonne})
+            SELECT {colonne} FROM tm_stage
+            ON CONFLICT (giocatore_id) DO UPDATE SET
+            {", ".join(f"{c} = EXCLUDED.{c}" for c in aggiornabili)},
+            aggiornato = now()
+            WHERE ({", ".join(f"t.{c}" for c in aggiornabili)})
+               IS DISTINCT FROM ({", ".join(f"EXCLUDED.{c}" for c in aggiornabili)});
+            """
+        )
+        scritti = cur.rowcount
+        cur.execute(
+            f"DELETE FROM {TABELLA} t WHERE NOT EXISTS (SELECT 1 FROM tm_stage s WHERE s.giocatore_id = t.giocatore_id);"
+        )
+        rimossi = cur.rowcount
+    conn.commit()
+    return scritti, rimossi
+
+
+def arricchisci(conn_factory, giocatori, meta_transfermarkt=None, forza=False):
+    """Stadio di arricchimento: prepara, confronta la firma con l'ultimo caricamento e carica.
+
+    conn_factory è un context manager che restituisce una connessione (es. pool.connessione);
+    viene aperto solo se c'è qualcosa da scrivere. Restituisce un riepilogo del caricamento.
+    """
+    t0 = time.perf_counter()
+    df = prepara_arricchimento(giocatori, leggi_transfermarket())
+    firma = firma_arricchimento(df, (meta_transfermarkt or {}).get("firma"))
+    stato = leggi_json(STATO_PATH)
+    if not forza and stato.get("firma") == firma:
+        print(f"📦 Arricchimento Transfermarkt invariato ({len(df)} giocatori), salto il caricamento")
+        return {"giocatori": len(df), "scritti": 0, "rimossi": 0, "saltato": True}
+
+    with conn_factory() as conn:
+        scritti, rimossi = carica_arricchimento(conn, df)
+    scrivi_json(STATO_PATH, {"firma": firma, "giocatori": len(df), "caricato": time.time()})
+    print(
+        f"✅ Arricchimento Transfermarkt: {len(df)} giocatori collegati, {scritti} scritti, "
+        f"{rimossi} rimossi in {time.perf_counter() - t0:.2f}s"
+    )
+    return {"giocatori": len(df), "scritti": scritti, "rimossi": rimossi, "saltato": False}
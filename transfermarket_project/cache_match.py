@@ -0,0 +1,192 @@
+# Mappa persistente giocatore Supabase <-> Transfermarkt
+# mappa_giocatori.csv tiene per ogni giocatore.id il player_code scelto, la bridge_player_key
+# (stabile tra un run e l'altro) e il nome/club con cui è stato fatto il match. Ad ogni
+# aggiornamento il fuzzy matching gira solo per i giocatori nuovi, per quelli con nome o club
+# cambiato e per quelli il cui player_code non c'è più nei dati Transfermarkt.
+# override_match.csv vince su tutto: id -> player_code scelto a mano (vuoto = nessun match).
+#
+# Uso (dalla root del repo):
+#   python -m transfermarket_project.cache_match aggiorna [--riprova-falliti]
+#   python -m transfermarket_project.cache_match override 907 lautaro-martinez --nota "verificato"
+#   python -m transfermarket_project.cache_match override 902 -          # nessun match
+#   python -m transfermarket_project.cache_match candidati               # proposte per i falliti
+
+import os
+import sys
+import time
+import argparse
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from transfermarket_project.matching import PROJECT_DIR, match_giocatori
+
+MAPPA_PATH = os.path.join(PROJECT_DIR, "mappa_giocatori.csv")
+OVERRIDE_PATH = os.path.join(PROJECT_DIR, "override_match.csv")
+
+COLONNE_MAPPA = ["id", "nome", "club", "tm_player_code", "bridge_player_key", "confidenza", "metodo", "aggiornato"]
+COLONNE_OVERRIDE = ["id", "tm_player_code", "nota"]
+
+
+def _leggi_csv(percorso, colonne):
+    if not os.path.exists(percorso):
+        return pd.DataFrame(columns=colonne)
+    return pd.read_csv(percorso, dtype={"nome": object, "club": object, "tm_player_code": object, "nota": object})
+
+
+def leggi_mappa():
+    return _leggi_csv(MAPPA_PATH, COLONNE_MAPPA)
+
+
+def leggi_override():
+    return _leggi_csv(OVERRIDE_PATH, COLONNE_OVERRIDE)
+
+
+def scrivi_mappa(mappa):
+    """Ordinata per id: stesso contenuto -> stesso file, diff leggibili in git"""
+    mappa = mappa[COLONNE_MAPPA].sort_values("id").reset_index(drop=True)
+    mappa["bridge_player_key"] = mappa["bridge_player_key"].astype(int)
+    mappa.to_csv(MAPPA_PATH, index=False)
+
+
+def _da_ricalcolare(supabase, mappa, codici_tm, riprova_falliti):
+    """Maschera sui giocatori Supabase che richiedono un nuovo match"""
+    noti = mappa.set_index("id").reindex(supabase["id"])
+    nuovi = noti["bridge_player_key"].isna().to_numpy()
+    cambiati = (
+        noti["nome"].fillna("").to_numpy() != supabase["nome"].fillna("").astype(str).to_numpy()
+    ) | (noti["club"].fillna("").to_numpy() != supabase["club"].fillna("").astype(str).to_numpy())
+    codice = noti["tm_player_code"]
+    # Il giocatore scelto non è più nei dati Transfermarkt (i manuali restano come sono)
+    spariti = (codice.notna() & ~codice.isin(codici_tm) & noti["metodo"].ne("manuale")).to_numpy()
+    falliti = codice.isna().to_numpy() & riprova_falliti
+    return nuovi | cambiati | spariti | falliti
+
+
+def aggiorna_mappa(supabase, transfermarket, riprova_falliti=False, salva=True):
+    """Bridge per i giocatori di supabase (stesse colonne di match_giocatori) usando la mappa salvata.
+
+    Il matching gira solo sui giocatori da ricalcolare; le bridge_player_key esistenti non
+    cambiano e i giocatori nuovi prendono le successive. Gli override manuali vincono sempre.
+    """
+    t0 = time.perf_counter()
+    mappa = leggi_mappa()
+    override = leggi_override()
+    oggi = date.today().isoformat()
+
+    supabase = supabase.drop_duplicates(subset="id", keep="last").reset_index(drop=True)
+    # Club mancante = non noto, non "cambiato": resta quello con cui era stato fatto il match
+    supabase["club"] = supabase["club"].fillna(supabase["id"].map(mappa.set_index("id")["club"]))
+    manuali = supabase["id"].isin(override["id"]).to_numpy()
+    ricalcola = _da_ricalcolare(supabase, mappa, transfermarket["player_code"], riprova_falliti) & ~manuali
+
+    nuove = []
+    if ricalcola.any():
+        trovati = match_giocatori(supabase[ricalcola], transfermarket)
+        nuove.append(trovati.drop(columns=["bridge_player_key"]).assign(aggiornato=oggi))
+    if manuali.any():
+        scelte = override.drop_duplicates(subset="id", keep="last").set_index("id")["tm_player_code"]
+        ids = supabase.loc[manuali, "id"]
+        nuove.append(
+            pd.DataFrame(
+                {
+                    "id": ids.to_numpy(),
+                    "tm_player_code": ids.map(scelte).to_numpy(),
+                    "confidenza": 100.0,
+                    "metodo": "manuale",
+                    "aggiornato": oggi,
+                }
+            )
+        )
+
+    if nuove:
+        nuove = pd.concat(nuove, ignore_index=True).merge(supabase[["id", "nome", "club"]], on="id")
+        # Un override invariato non va riscritto (la data di aggiornamento resta quella vera)
+        precedenti = mappa.set_index("id").reindex(nuove["id"])
+        invariati = (
+            nuove["metodo"].eq("manuale").to_numpy()
+            & precedenti["metodo"].eq("manuale").to_numpy()
+            & (precedenti["tm_player_code"].fillna("").to_numpy() == nuove["tm_player_code"].fillna("").to_numpy())
+            & (precedenti["nome"].fillna("").to_numpy() == nuove["nome"].fillna("").astype(str).to_numpy())
+            & (precedenti["club"].fillna("").to_numpy() == nuove["club"].fillna("").astype(str).to_numpy())
+        )
+        nuove = nuove[~invariati]
+
+    if len(nuove):
+        chiavi = mappa.set_index("id")["bridge_player_key"]
+        nuove["bridge_player_key"] = nuove["id"].map(chiavi)
+        senza_chiave = nuove["bridge_player_key"].isna()
+        prossima = int(chiavi.max()) + 1 if len(chiavi) else 1
+        nuove.loc[senza_chiave, "bridge_player_key"] = np.arange(prossima, prossima + senza_chiave.sum())
+        mappa = pd.concat([mappa[~mappa["id"].isin(nuove["id"])], nuove[COLONNE_MAPPA]], ignore_index=True)
+        if salva:
+            scrivi_mappa(mappa)
+
+    ricalcolati = int(ricalcola.sum())
+    print(
+        f"🔗 Mappa giocatori: {len(supabase) - ricalcolati - int(manuali.sum())} riusati, "
+        f"{ricalcolati} ricalcolati, {int(manuali.sum())} manuali, "
+        f"{len(nuove)} righe aggiornate in {(time.perf_counter() - t0) * 1000:.0f} ms"
+    )
+    bridge = supabase[["id"]].merge(mappa, on="id", how="left")
+    bridge["bridge_player_key"] = bridge["bridge_player_key"].astype(int)
+    return bridge[["id", "tm_player_code", "bridge_player_key", "confidenza", "metodo"]]
+
+
+def aggiungi_override(id_giocatore, codice, nota=None):
+    """Scelta manuale per un giocatore ('-' o None = nessun match), sostituisce quella precedente"""
+    override = leggi_override()
+    override = override[override["id"] != id_giocatore]
+    riga = pd.DataFrame([{"id": id_giocatore, "tm_player_code": None if codice in (None, "-") else codice, "nota": nota}])
+    override = pd.concat([override, riga], ignore_index=True).sort_values("id")
+    override[COLONNE_OVERRIDE].to_csv(OVERRIDE_PATH, index=False)
+    print(f"✍️ Override per {id_giocatore}: {riga['tm_player_code'].iloc[0] or 'nessun match'}")
+
+
+def candidati_falliti(supabase, transfermarket):
+    """Proposte fuori squadra (blocchi per token) per i giocatori ancora senza match, da rivedere"""
+    mappa = leggi_mappa().set_index("id").reindex(supabase["id"])
+    falliti = (mappa["tm_player_code"].isna() & mappa["metodo"].ne("manuale")).to_numpy()
+    proposte = match_giocatori(supabase[falliti], transfermarket, per_token=True)
+    proposte = proposte[proposte["metodo"] == "token"]
+    tm = transfermarket[["player_code", "name", "current_club_name"]].drop_duplicates(subset="player_code")
+    return (
+        proposte[["id", "tm_player_code", "confidenza"]]
+        .merge(supabase[["id", "nome", "club"]], on="id")
+        .merge(tm, left_on="tm_player_code", right_on="player_code")
+        .drop(columns=["player_code"])
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mappa persistente Supabase <-> Transfermarkt")
+    comandi = parser.add_subparsers(dest="comando", required=True)
+    agg = comandi.add_parser("aggiorna", help="match dei soli giocatori nuovi o cambiati")
+    agg.add_argument("--supabase", default=os.path.join(PROJECT_DIR, "supabase_ds.csv"))
+    agg.add_argument("--transfermarket", default=os.path.join(PROJECT_DIR, "transfermarket_ds.csv"))
+    agg.add_argument("--riprova-falliti", action="store_true", help="rifà il match anche dei giocatori senza player_code")
+    ovr = comandi.add_parser("override", help="imposta a mano il player_code di un giocatore")
+    ovr.add_argument("id", type=int)
+    ovr.add_argument("player_code", help="'-' per nessun match")
+    ovr.add_argument("--nota")
+    cand = comandi.add_parser("candidati", help="proposte per i giocatori senza match (da confermare con override)")
+    cand.add_argument("--supabase", default=os.path.join(PROJECT_DIR, "supabase_ds.csv"))
+    cand.add_argument("--transfermarket", default=os.path.join(PROJECT_DIR, "transfermarket_ds.csv"))
+    args = parser.parse_args(argv)
+
+    if args.comando == "aggiorna":
+        supabase = pd.read_csv(args.supabase)
+        transfermarket = pd.read_csv(args.transfermarket)
+        bridge = aggiorna_mappa(supabase, transfermarket, riprova_falliti=args.riprova_falliti)
+        print(f"✅ {bridge['tm_player_code'].notna().sum()} / {len(bridge)} giocatori collegati a Transfermarkt")
+    elif args.comando == "override":
+        aggiungi_override(args.id, args.player_code, args.nota)
+    elif args.comando == "candidati":
+        proposte = candidati_falliti(pd.read_csv(args.supabase), pd.read_csv(args.transfermarket))
+        print(proposte.to_string(index=False))
+        print(f"\n🔎 {len(proposte)} proposte: conferma con 'override ID PLAYER_CODE'")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,303 @@
+# Ingest Transfermarkt (ex exatraction_transfermarket_data.ipynb)
+# players.csv.gz e clubs.csv.gz scaricati in streaming in una cache su disco con GET condizionali
+# (ETag / Last-Modified) e sha256 del contenuto; il gzip viene letto a blocchi con le sole colonne
+# usate e filtrato durante la lettura (squadre del campionato, last_season minima), quindi in
+# memoria resta un blocco alla volta più le righe tenute. L'output tipizzato
+# (transfermarket_ds.parquet) viene rigenerato solo se cambiano i file sorgente o i filtri.
+#
+# Uso (dalla root del repo):
+#   python -m transfermarket_project.ingest                         # dal endpoint R2
+#   python -m transfermarket_project.ingest --sorgente transfermarket_project/fixture   # offline
+#   python -m transfermarket_project.ingest --csv --memoria         # anche il CSV del notebook, picco memoria
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import tempfile
+import tracemalloc
+
+import pandas as pd
+import requests
+
+from transfermarket_project.matching import PROJECT_DIR
+
+BASE_URL = os.environ.get("TRANSFERMARKT_URL", "https://pub-e682421888d945d684bcae8890b0ec20.r2.dev/data")
+# Senza uno User-Agent da browser Cloudflare risponde 403
+HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"}
+
+CACHE_DIR = os.path.join(PROJECT_DIR, "cache")
+OUTPUT_PATH = os.path.join(PROJECT_DIR, "transfermarket_ds.parquet")
+CSV_PATH = os.path.join(PROJECT_DIR, "transfermarket_ds.csv")
+
+CAMPIONATO = os.environ.get("TRANSFERMARKT_CAMPIONATO", "IT1")
+STAGIONE_MIN = int(os.environ.get("TRANSFERMARKT_STAGIONE_MIN", 2023))
+RIGHE_BLOCCO = int(os.environ.get("TRANSFERMARKT_RIGHE_BLOCCO", 20000))
+
+# Colonne di transfermarket_ds, nell'ordine del notebook
+COLONNE = [
+    "first_name",
+    "last_name",
+    "name",
+    "last_season",
+    "player_code",
+    "country_of_birth",
+    "date_of_birth",
+    "sub_position",
+    "position",
+    "foot",
+    "height_in_cm",
+    "contract_expiration_date",
+    "image_url",
+    "international_caps",
+    "international_goals",
+    "url",
+    "current_club_name",
+    "market_value_in_eur",
+    "highest_market_value_in_eur",
+]
+# Tipi in lettura: numeri compatti, il resto testo (le categorie si fanno sulle sole righe tenute)
+DTYPE_LETTURA = {
+    "current_club_id": "Int32",
+    "last_season": "Int16",
+    "height_in_cm": "float32",
+    "international_caps": "float32",
+    "international_goals": "float32",
+    "market_value_in_eur": "float64",
+    "highest_market_value_in_eur": "float64",
+}
+COLONNE_CATEGORIA = ["country_of_birth", "sub_position", "position", "foot", "current_club_name"]
+COLONNE_DATA = ["date_of_birth", "contract_expiration_date"]
+COLONNE_INTERE = {
+    "height_in_cm": "Int16",
+    "international_caps": "Int16",
+    "international_goals": "Int16",
+    "market_value_in_eur": "Int64",
+    "highest_market_value_in_eur": "Int64",
+}
+
+
+# === CACHE DOWNLOAD ===
+def leggi_json(percorso):
+    try:
+        with open(percorso, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def scrivi_json(percorso, dati):
+    os.makedirs(os.path.dirname(percorso), exist_ok=True)
+    with open(percorso, "w", encoding="utf-8") as f:
+        json.dump(dati, f, indent=2)
+
+
+def sha256_file(percorso, blocco=1 << 20):
+    sha = hashlib.sha256()
+    with open(percorso, "rb") as f:
+        for dati in iter(lambda: f.read(blocco), b""):
+            sha.update(dati)
+    return sha.hexdigest()
+
+
+def scarica(nome_file, session=None, timeout=60):
+    """Download condizionale in CACHE_DIR, scritto a blocchi. Restituisce (percorso, sha256).
+
+    304 o errore di rete con una copia in cache -> si usa la copia in cache.
+    """
+    percorso = os.path.join(CACHE_DIR, nome_file)
+    meta_path = os.path.join(CACHE_DIR, "meta.json")
+    meta = leggi_json(meta_path)
+    voce = meta.get(nome_file, {})
+    in_cache = voce.get("sha256") and os.path.exists(percorso)
+
+    headers = dict(HEADERS)
+    if in_cache:
+        if voce.get("etag"):
+            headers["If-None-Match"] = voce["etag"]
+        if voce.get("last_modified"):
+            headers["If-Modified-Since"] = voce["last_modified"]
+
+    session = session or requests.Session()
+    try:
+        risposta = session.get(f"{BASE_URL}/{nome_file}", headers=headers, timeout=timeout, stream=True)
+        if risposta.status_code == 304:
+            print(f"📦 {nome_file} non modificato (304): uso la copia in cache")
+            return percorso, voce["sha256"]
+        risposta.raise_for_status()
+    except requests.RequestException as e:
+        if in_cache:
+            print(f"⚠️ {nome_file}: download non riuscito ({e}), uso la copia in cache")
+            return percorso, voce["sha256"]
+        raise
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    sha = hashlib.sha256()
+    fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            # raw: i byte gzip così come arrivano (pandas li decomprime in lettura)
+            for dati in risposta.raw.stream(1 << 20, decode_content=False):
+                sha.update(dati)
+                f.write(dati)
+        os.replace(tmp, percorso)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+    meta[nome_file] = {
+        "sha256": sha.hexdigest(),
+        "etag": risposta.headers.get("ETag"),
+        "last_modified": risposta.headers.get("Last-Modified"),
+        "scaricato": time.time(),
+    }
+    scrivi_json(meta_path, meta)
+    print(f"⬇️ {nome_file}: {os.path.getsize(percorso) / 1e6:.1f} MB scaricati")
+    return percorso, meta[nome_file]["sha256"]
+
+
+def sorgenti(cartella=None):
+    """(percorso, sha256) di players e clubs: da una cartella locale (fixture) o dal download"""
+    if cartella:
+        return {
+            nome: (os.path.join(cartella, f"{nome}.csv.gz"), sha256_file(os.path.join(cartella, f"{nome}.csv.gz")))
+            for nome in ("players", "clubs")
+        }
+    session = requests.Session()
+    return {nome: scarica(f"{nome}.csv.gz", session) for nome in ("players", "clubs")}
+
+
+# === LETTURA FILTRATA ===
+def club_del_campionato(percorso_clubs, campionato=CAMPIONATO):
+    club = pd.read_csv(
+        percorso_clubs,
+        usecols=["club_id", "domestic_competition_id"],
+        dtype={"club_id": "Int32", "domestic_competition_id": "string"},
+    )
+    return set(club.loc[club["domestic_competition_id"] == campionato, "club_id"].dropna().tolist())
+
+
+def leggi_giocatori(percorso_players, club_ids, stagione_min=STAGIONE_MIN, righe_blocco=RIGHE_BLOCCO):
+    """Giocatori delle squadre indicate con last_season >= stagione_min, letti a blocchi.
+
+    Restituisce (DataFrame, righe lette).
+    """
+    usate = COLONNE + ["current_club_id"]
+    tenuti = []
+    lette = 0
+    blocchi = pd.read_csv(
+        percorso_players,
+        usecols=lambda c: c in usate,
+        dtype=DTYPE_LETTURA,
+        chunksize=righe_blocco,
+    )
+    for blocco in blocchi:
+        lette += len(blocco)
+        filtro = blocco["current_club_id"].isin(club_ids) & (blocco["last_season"] >= stagione_min)
+        tenuti.append(blocco[filtro.fillna(False)])
+    df = pd.concat(tenuti, ignore_index=True) if tenuti else pd.DataFrame(columns=usate)
+    return df, lette
+
+
+def tipizza(df):
+    """Tipi finali di transfermarket_ds: categorie, date, interi nullable; ordinato come nel notebook"""
+    out = df.reindex(columns=COLONNE).copy()
+    for col in COLONNE_CATEGORIA:
+        out[col] = out[col].astype("category")
+    for col in COLONNE_DATA:
+        out[col] = pd.to_datetime(out[col], errors="coerce")
+    for col, tipo in COLONNE_INTERE.items():
+        out[col] = pd.to_numeric(out[col], errors="coerce").round().astype(tipo)
+    out["last_season"] = out["last_season"].astype("Int16")
+    out = out.sort_values(
+        by=["current_club_name", "market_value_in_eur"], ascending=[True, False], na_position="last"
+    )
+    return out.reset_index(drop=True)
+
+
+def leggi_transfermarket(percorso=OUTPUT_PATH):
+    """transfermarket_ds tipizzato (parquet) o, se manca, il CSV storico del notebook"""
+    if os.path.exists(percorso):
+        return pd.read_parquet(percorso)
+    return pd.read_csv(CSV_PATH)
+
+
+# === INGEST ===
+def firma_ingest(file_sorgente, campionato=CAMPIONATO, stagione_min=STAGIONE_MIN):
+    """Hash di sorgenti + filtri + schema: se non cambia, l'output non va rigenerato"""
+    chiave = json.dumps(
+        {
+            "sorgenti": {nome: sha for nome, (_, sha) in sorted(file_sorgente.items())},
+            "campionato": campionato,
+            "stagione_min": stagione_min,
+            "colonne": COLONNE,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(chiave.encode("utf-8")).hexdigest()
+
+
+def leggi_meta_output(percorso=OUTPUT_PATH):
+    return leggi_json(f"{os.path.splitext(percorso)[0]}.json")
+
+
+def ingest(cartella=None, percorso=OUTPUT_PATH, campionato=CAMPIONATO, stagione_min=STAGIONE_MIN, forza=False, csv=False):
+    """Aggiorna transfermarket_ds se sorgenti o filtri sono cambiati.
+
+    Restituisce il meta dell'output: firma, righe lette/tenute e "cambiato".
+    """
+    t0 = time.perf_counter()
+    file_sorgente = sorgenti(cartella)
+    firma = firma_ingest(file_sorgente, campionato, stagione_min)
+    meta = leggi_meta_output(percorso)
+    if not forza and meta.get("firma") == firma and os.path.exists(percorso):
+        print(f"📦 transfermarket_ds invariato ({meta['righe']} giocatori), niente da rigenerare")
+        return dict(meta, cambiato=False)
+
+    club_ids = club_del_campionato(file_sorgente["clubs"][0], campionato)
+    giocatori, lette = leggi_giocatori(file_sorgente["players"][0], club_ids, stagione_min)
+    df = tipizza(giocatori)
+    df.to_parquet(percorso, index=False)
+    if csv:
+        df.to_csv(CSV_PATH, index=False)
+
+    meta = {
+        "firma": firma,
+        "campionato": campionato,
+        "stagione_min": stagione_min,
+        "righe_lette": lette,
+        "righe": len(df),
+        "squadre": len(club_ids),
+        "secondi": round(time.perf_counter() - t0, 3),
+    }
+    scrivi_json(f"{os.path.splitext(percorso)[0]}.json", meta)
+    print(
+        f"✅ transfermarket_ds: {len(df)} giocatori di {len(club_ids)} squadre {campionato} "
+        f"su {lette} righe lette in {meta['secondi']:.2f}s ({df.memory_usage(deep=True).sum() / 1e3:.0f} KB in memoria)"
+    )
+    return dict(meta, cambiato=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest Transfermarkt: players/clubs -> transfermarket_ds.parquet")
+    parser.add_argument("--sorgente", help="cartella locale con players.csv.gz e clubs.csv.gz (niente download)")
+    parser.add_argument("--campionato", default=CAMPIONATO)
+    parser.add_argument("--stagione-min", type=int, default=STAGIONE_MIN)
+    parser.add_argument("--forza", action="store_true", help="rigenera anche se le sorgenti non sono cambiate")
+    parser.add_argument("--csv", action="store_true", help="scrive anche transfermarket_ds.csv per il notebook")
+    parser.add_argument("--memoria", action="store_true", help="misura il picco di memoria (tracemalloc)")
+    args = parser.parse_args(argv)
+
+    if args.memoria:
+        tracemalloc.start()
+    ingest(args.sorgente, campionato=args.campionato, stagione_min=args.stagione_min, forza=args.forza, csv=args.csv)
+    if args.memoria:
+        _, picco = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"📈 Picco memoria: {picco / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
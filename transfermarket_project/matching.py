@@ -0,0 +1,249 @@
+# Matching giocatori Supabase <-> Transfermarkt (ex merge_and_mapping.ipynb)
+# Invece di un extractOne per giocatore su tutta la lista di candidati:
+#   1. pulizia dei nomi solo sui valori distinti;
+#   2. bridge_club: tutte le squadre Supabase contro tutte le squadre TM in un'unica cdist;
+#   3. blocchi per squadra: una cdist (token_set_ratio) tra i giocatori dello stesso bridge_club_key;
+#   4. (opzionale) chi resta senza match passa ai blocchi per token del nome (cognome), punteggi
+#      con cpdist sulle sole coppie che condividono un token: soglia più alta e candidato univoco.
+#      Con il solo cognome un omonimo in un'altra squadra prende comunque 100, quindi questi
+#      match sono candidati da rivedere e restano spenti di default.
+# Risultato: una riga per giocatore Supabase con bridge_player_key, player_code e confidenza.
+#
+# Uso (dalla root del repo):
+#   python -m transfermarket_project.matching                       # Serie A + scala sintetica
+#   python -m transfermarket_project.matching --players players.csv.gz  # anche il file completo
+
+import os
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+
+from normalizzazione import pulisci_testo, pulisci_serie
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SOGLIA_CLUB = 60
+SOGLIA_MATCH = 65
+# Fuori dal blocco squadra il nome da solo deve bastare: soglia più alta
+SOGLIA_TOKEN = 90
+# Token più corti (iniziali, "de", "da") non identificano un cognome
+LUNGHEZZA_TOKEN = 3
+# Thread per cdist/cpdist (-1 = tutti i core)
+WORKERS = int(os.environ.get("MATCH_WORKERS", -1))
+
+
+def bridge_club(club_supa, club_tm, soglia=SOGLIA_CLUB):
+    """Squadre pulite Supabase -> squadra TM più simile (partial_ratio) e bridge_club_key"""
+    supa = pd.unique(club_supa)
+    tm = pd.unique(club_tm)
+    if len(tm):
+        punteggi = process.cdist(supa, tm, scorer=fuzz.partial_ratio, workers=WORKERS)
+        migliori = punteggi.argmax(axis=1)
+        trovati = punteggi[np.arange(len(supa)), migliori] > soglia
+        tm_club = np.where(trovati, tm[migliori], None)
+    else:
+        tm_club = np.full(len(supa), None, dtype=object)
+    return pd.DataFrame(
+        {
+            "supa_club_clean": supa,
+            "tm_club_clean": tm_club,
+            "bridge_club_key": np.arange(1, len(supa) + 1),
+        }
+    )
+
+
+def _token(nomi, indici):
+    """(indice, token) per ogni token del nome abbastanza lungo da bloccare"""
+    token = pd.Series(nomi, index=indici).str.split().explode().dropna()
+    token = token[token.str.len() >= LUNGHEZZA_TOKEN]
+    return pd.DataFrame({"i": token.index, "token": token.to_numpy()}).drop_duplicates()
+
+
+def _match_per_token(nomi_supa, nomi_tm, codici_tm, da_cercare, liberi, soglia):
+    """Match fuori squadra: solo coppie che condividono un token, vince il migliore se univoco"""
+    token_supa = _token(nomi_supa[da_cercare], da_cercare)
+    token_tm = _token(nomi_tm[liberi], liberi).rename(columns={"i": "j"})
+    coppie = token_supa.merge(token_tm, on="token")[["i", "j"]].drop_duplicates()
+    if coppie.empty:
+        return coppie.assign(score=pd.Series(dtype=float))
+    coppie["score"] = process.cpdist(
+        nomi_supa[coppie["i"].to_numpy()],
+        nomi_tm[coppie["j"].to_numpy()],
+        scorer=fuzz.token_set_ratio,
+        workers=WORKERS,
+    )
+    # Stesso giocatore TM raggiunto da più token: una sola coppia
+    coppie["codice"] = codici_tm[coppie["j"].to_numpy()]
+    coppie = coppie.sort_values(["i", "score", "j"], ascending=[True, False, True])
+    coppie = coppie.drop_duplicates(subset=["i", "codice"])
+    # Migliore candidato per giocatore, scartato se il secondo ha lo stesso punteggio
+    coppie["rango"] = coppie.groupby("i").cumcount()
+    primi = coppie[coppie["rango"] == 0].set_index("i")
+    secondi = coppie[coppie["rango"] == 1].set_index("i")["score"]
+    univoci = secondi.reindex(primi.index).fillna(-1) < primi["score"]
+    return primi[univoci & (primi["score"] >= soglia)].reset_index()[["i", "j", "score"]]
+
+
+def match_giocatori(supabase, transfermarket, soglia=SOGLIA_MATCH, soglia_token=SOGLIA_TOKEN, per_token=False):
+    """bridge_player_key, tm_player_code, confidenza (0-100) e metodo per ogni giocatore Supabase.
+
+    supabase serve con id/nome/club, transfermarket con name/current_club_name/player_code.
+    metodo è "club" (stesso blocco squadra, come nel notebook), "token" (fuori squadra, solo con
+    per_token=True) o None.
+    """
+    nomi_supa = pulisci_serie(supabase["nome"]).to_numpy()
+    club_supa = pulisci_serie(supabase["club"]).to_numpy()
+    nomi_tm = pulisci_serie(transfermarket["name"]).to_numpy()
+    club_tm = pulisci_serie(transfermarket["current_club_name"]).to_numpy()
+    codici_tm = transfermarket["player_code"].to_numpy()
+
+    clubs = bridge_club(club_supa, club_tm)
+    chiave_supa = pd.Series(club_supa).map(clubs.set_index("supa_club_clean")["bridge_club_key"])
+    # Una squadra TM scelta da più squadre Supabase tiene la prima chiave
+    clubs_tm = clubs.dropna(subset=["tm_club_clean"]).drop_duplicates(subset=["tm_club_clean"])
+    chiave_tm = pd.Series(club_tm).map(clubs_tm.set_index("tm_club_clean")["bridge_club_key"])
+
+    n = len(supabase)
+    scelti = np.full(n, -1)
+    confidenza = np.full(n, np.nan)
+    metodo = np.full(n, None, dtype=object)
+
+    # Blocchi per squadra: una cdist per bridge_club_key
+    blocchi_tm = chiave_tm.groupby(chiave_tm).indices
+    for chiave, righe in chiave_supa.groupby(chiave_supa).indices.items():
+        candidati = blocchi_tm.get(chiave)
+        if candidati is None:
+            continue
+        punteggi = process.cdist(nomi_supa[righe], nomi_tm[candidati], scorer=fuzz.token_set_ratio, workers=WORKERS)
+        # argmax tiene il primo a parità di punteggio, come extractOne
+        migliori = punteggi.argmax(axis=1)
+        score = punteggi[np.arange(len(righe)), migliori]
+        ok = score >= soglia
+        scelti[righe[ok]] = candidati[migliori[ok]]
+        confidenza[righe[ok]] = score[ok]
+        metodo[righe[ok]] = "club"
+
+    if per_token:
+        da_cercare = np.flatnonzero(scelti < 0)
+        liberi = np.setdiff1d(np.arange(len(transfermarket)), scelti[scelti >= 0])
+        trovati = _match_per_token(nomi_supa, nomi_tm, codici_tm, da_cercare, liberi, soglia_token)
+        righe = trovati["i"].to_numpy()
+        scelti[righe] = trovati["j"].to_numpy()
+        confidenza[righe] = trovati["score"].to_numpy()
+        metodo[righe] = "token"
+
+    codice = np.where(scelti >= 0, codici_tm[np.maximum(scelti, 0)], None)
+    return pd.DataFrame(
+        {
+            "id": supabase["id"].to_numpy(),
+            "tm_player_code": codice,
+            "bridge_player_key": np.arange(1, n + 1),
+            "confidenza": confidenza,
+            "metodo": metodo,
+        }
+    )
+
+
+def applica_bridge(supabase, transfermarket, bridge):
+    """bridge_player_key su entrambi i lati: 1,1 per Supabase, 0,1 per Transfermarkt"""
+    supabase = supabase.merge(bridge[["id", "bridge_player_key"]], on="id", how="left")
+    trovati = bridge.dropna(subset=["tm_player_code"])[["tm_player_code", "bridge_player_key"]]
+    transfermarket = transfermarket.merge(
+        trovati, left_on="player_code", right_on="tm_player_code", how="left"
+    ).drop(columns=["tm_player_code"])
+    return supabase, transfermarket
+
+
+# === BENCHMARK ===
+def match_notebook(supabase, transfermarket):
+    """Il vecchio percorso del notebook: pulizia riga per riga ed extractOne per giocatore"""
+    supabase = supabase.copy()
+    transfermarket = transfermarket.copy()
+    supabase["nome_clean"] = supabase["nome"].apply(pulisci_testo)
+    supabase["club_clean"] = supabase["club"].apply(pulisci_testo)
+    transfermarket["name_clean"] = transfermarket["name"].apply(pulisci_testo)
+    transfermarket["club_clean"] = transfermarket["current_club_name"].apply(pulisci_testo)
+
+    squadre_tm = transfermarket["club_clean"].unique()
+    bridge = []
+    for i, club_s in enumerate(supabase["club_clean"].unique(), start=1):
+        match = process.extractOne(club_s, squadre_tm, scorer=fuzz.partial_ratio)
+        bridge.append((club_s, match[0] if (match and match[1] > SOGLIA_CLUB) else None, i))
+    bridge = pd.DataFrame(bridge, columns=["supa_club_clean", "tm_club_clean", "bridge_club_key"])
+    supabase = supabase.merge(
+        bridge[["supa_club_clean", "bridge_club_key"]], left_on="club_clean", right_on="supa_club_clean", how="left"
+    )
+    bridge_tm = bridge.dropna(subset=["tm_club_clean"]).drop_duplicates(subset=["tm_club_clean"])
+    transfermarket = transfermarket.merge(
+        bridge_tm[["tm_club_clean", "bridge_club_key"]], left_on="club_clean", right_on="tm_club_clean", how="left"
+    )
+
+    codici = []
+    for _, row in supabase.iterrows():
+        candidati = transfermarket[transfermarket["bridge_club_key"] == row["bridge_club_key"]]
+        codice = None
+        if not candidati.empty:
+            migliore = process.extractOne(row["nome_clean"], candidati["name_clean"].tolist(), scorer=fuzz.token_set_ratio)
+            if migliore and migliore[1] >= SOGLIA_MATCH:
+                codice = candidati[candidati["name_clean"] == migliore[0]].iloc[0]["player_code"]
+        codici.append(codice)
+    return pd.Series(codici, index=supabase.index, dtype=object)
+
+
+def tm_sintetico(transfermarket, leghe):
+    """Serie A replicata come se fossero altri campionati (squadre rinominate)"""
+    copie = [transfermarket]
+    for k in range(1, leghe):
+        copia = transfermarket.copy()
+        copia["current_club_name"] = copia["current_club_name"] + f" lega{k}"
+        copia["player_code"] = copia["player_code"] + f"-{k}"
+        copie.append(copia)
+    return pd.concat(copie, ignore_index=True)
+
+
+def _cronometra(funzione, *args):
+    t0 = time.perf_counter()
+    risultato = funzione(*args)
+    return risultato, time.perf_counter() - t0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark del matching Supabase <-> Transfermarkt")
+    parser.add_argument("--players", help="players.csv(.gz) completo di Transfermarkt (tutti i campionati)")
+    parser.add_argument("--leghe", type=int, nargs="*", default=[10, 30], help="scale sintetiche (default 10 30)")
+    args = parser.parse_args(argv)
+
+    supabase = pd.read_csv(os.path.join(PROJECT_DIR, "supabase_ds.csv"))
+    serie_a = pd.read_csv(os.path.join(PROJECT_DIR, "transfermarket_ds.csv"))
+
+    atteso, t_vecchio = _cronometra(match_notebook, supabase, serie_a)
+    bridge, t_nuovo = _cronometra(match_giocatori, supabase, serie_a, SOGLIA_MATCH, SOGLIA_TOKEN, True)
+    per_club = bridge["tm_player_code"].where(bridge["metodo"] == "club")
+    uguali = (per_club.fillna("") == atteso.fillna("")).all()
+    print(f"📊 Serie A: {len(supabase)} giocatori Supabase, {len(serie_a)} Transfermarkt")
+    print(f"✅ Match per squadra identici al notebook: {uguali} ({per_club.notna().sum()} match)")
+    print(f"🔎 Candidati per token fuori squadra (da rivedere): {(bridge['metodo'] == 'token').sum()}")
+
+    scenari = [("Serie A", serie_a, t_vecchio, t_nuovo)]
+    for leghe in args.leghe:
+        tm = tm_sintetico(serie_a, leghe)
+        _, t_vecchio = _cronometra(match_notebook, supabase, tm)
+        _, t_nuovo = _cronometra(match_giocatori, supabase, tm, SOGLIA_MATCH, SOGLIA_TOKEN, True)
+        scenari.append((f"sintetico x{leghe}", tm, t_vecchio, t_nuovo))
+    if args.players:
+        tm = pd.read_csv(args.players, usecols=["name", "current_club_name", "player_code"])
+        _, t_vecchio = _cronometra(match_notebook, supabase, tm)
+        _, t_nuovo = _cronometra(match_giocatori, supabase, tm, SOGLIA_MATCH, SOGLIA_TOKEN, True)
+        scenari.append((os.path.basename(args.players), tm, t_vecchio, t_nuovo))
+
+    # I tempi "blocchi" includono anche il passaggio per token
+    print(f"\n{'scenario':<22} {'candidati TM':>12} {'notebook':>10} {'blocchi':>10} {'speedup':>8}")
+    for nome, tm, t_vecchio, t_nuovo in scenari:
+        print(f"{nome:<22} {len(tm):>12} {t_vecchio:>9.2f}s {t_nuovo:>9.2f}s {t_vecchio / t_nuovo:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
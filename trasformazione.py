@@ -0,0 +1,128 @@
+# Trasformazione del listone in righe di giocatore e rilevamento delle modifiche
+# Condivisa dall'ETL e dal benchmark della modalità a lotti (lotti.py): qui niente secrets,
+# niente I/O, solo DataFrame in ingresso e in uscita.
+
+import pandas as pd
+
+from giocatori import COLONNE_LOAD, COLONNE_NUMERICHE
+from identita import RisolutoreGiocatori, chiave_riga
+from normalizzazione import normalizza_testo, ruoli_come_testo
+
+# Colonne del listone usate dalla trasformazione
+COLONNE_LISTONE = ["Nome", "RM", "Squadra", "Qt.A M"]
+
+
+# === RILEVAMENTO MODIFICHE ===
+# Il LOAD abbina i giocatori per id: anche un nome scritto diversamente è una modifica
+def _forma_confronto(df):
+    """Porta le colonne caricate in una forma confrontabile tra listone trasformato e snapshot Supabase"""
+    out = df.reindex(columns=["id"] + COLONNE_LOAD)
+    for col in COLONNE_LOAD:
+        if col in COLONNE_NUMERICHE:
+            out[col] = pd.to_numeric(out[col], errors="coerce").astype(float)
+        elif col == "ruolo":
+            out[col] = ruoli_come_testo(out[col])
+        else:
+            out[col] = normalizza_testo(out[col])
+    out["id"] = out["id"].astype("Int64")
+    return out.set_index("id")
+
+
+def rileva_modifiche(df, sb):
+    """Confronta il listone trasformato con lo snapshot di giocatore tramite hash di riga.
+
+    Restituisce le sole righe da caricare (nuove o modificate) e un riepilogo con
+    i conteggi e il numero di giocatori modificati per colonna.
+    """
+    nuovo = _forma_confronto(df)
+    vecchio = _forma_confronto(sb)
+    vecchio = vecchio[~vecchio.index.duplicated()]
+
+    # Senza id = giocatore nuovo
+    presenti = nuovo.index.notna() & nuovo.index.isin(vecchio.index)
+    vecchio = vecchio.reindex(nuovo.index[presenti])
+    # I NULL non sovrascrivono: il valore dopo il LOAD resta quello già presente
+    effettivo = nuovo[presenti].where(nuovo[presenti].notna(), vecchio)
+
+    hash_effettivo = pd.util.hash_pandas_object(effettivo, index=False).values
+    hash_vecchio = pd.util.hash_pandas_object(vecchio, index=False).values
+    modificati = hash_effettivo != hash_vecchio
+
+    diff = effettivo[modificati].ne(vecchio[modificati]) & ~(
+        effettivo[modificati].isna() & vecchio[modificati].isna()
+    )
+    colonne = diff.sum()
+    colonne = {col: int(n) for col, n in colonne[colonne > 0].items()}
+
+    da_caricare = ~presenti
+    da_caricare[presenti] = modificati
+    riepilogo = {
+        "inserimenti": int((~presenti).sum()),
+        "aggiornamenti": int(modificati.sum()),
+        "invariati": int((~modificati).sum()),
+        "colonne": colonne,
+    }
+    return df[da_caricare], riepilogo
+
+
+# === FUNZIONE TRASFORMAZIONE ===
+def trasforma_listone(fc, sb):
+    """Unisce il listone Fantacalcio alla tabella giocatore (il listone ha la priorità).
+
+    I giocatori del listone prendono l'id di giocatore dal risolutore (nome normalizzato + club):
+    una variante di accenti o spazi aggiorna la riga esistente invece di crearne una nuova.
+    """
+    fc['priorita'] = 1
+    fc.rename(columns={'Nome': 'nome'}, inplace=True)
+    fc['id'] = RisolutoreGiocatori(sb).risolvi(fc['nome'], fc['Squadra'] if 'Squadra' in fc.columns else None)
+    # Un giocatore una volta sola: per id se già in tabella, altrimenti per nome normalizzato
+    fc = fc[~chiave_riga(fc).duplicated()]
+
+    # Lo snapshot sb resta intatto: serve al rilevamento modifiche prima del LOAD
+    merge_cols = [c for c in ['RM', 'Squadra', 'Qt.A M'] if c in fc.columns]
+    fuori_listone = sb.loc[~sb['id'].isin(fc['id'].dropna()), ['id', 'nome']].assign(priorita=0)
+    new_sb = pd.concat([fc[['id', 'nome', 'priorita'] + merge_cols], fuori_listone], ignore_index=True)
+    new_sb['id'] = new_sb['id'].astype('Int64')
+    new_sb = new_sb.merge(sb.drop(columns=['nome', 'priorita'], errors='ignore'), on='id', how='left')
+
+    # Colonne dal fc (se presenti)
+    if merge_cols:
+        if 'RM' in merge_cols:
+            # 🔧 IMPORTANTE: Aggiorna SEMPRE il ruolo da Fantacalcio, non solo se mancante
+            new_sb['ruolo'] = new_sb['RM']
+        if 'Squadra' in merge_cols:
+            # 🔧 IMPORTANTE: Aggiorna SEMPRE il club da Fantacalcio, non solo se mancante
+            new_sb['club'] = new_sb['Squadra']
+        if 'Qt.A M' in merge_cols:
+            # 🔧 IMPORTANTE: Aggiorna la quotazione da Fantacalcio SOLO se presente
+            if 'quot_att_mantra' in new_sb.columns:
+                new_sb['quot_att_mantra'] = new_sb['quot_att_mantra'].where(
+                    new_sb['Qt.A M'].isna(),
+                    new_sb['Qt.A M']
+                )
+            else:
+                new_sb['quot_att_mantra'] = new_sb['Qt.A M']
+        for c in merge_cols:
+            if c in new_sb.columns:
+                new_sb = new_sb.drop(c, axis=1)
+
+    # Pulizia valori mancanti / default
+    for col, default in [
+        ('squadra_att', 'Svincolato'),
+        ('detentore_cartellino', 'Svincolato'),
+        ('tipo_contratto', 'Svincolato'),
+    ]:
+        if col in new_sb.columns:
+            new_sb[col] = new_sb[col].fillna(default)
+
+    if 'costo' in new_sb.columns:
+        new_sb['costo'] = new_sb['costo'].fillna(0)
+    
+    # 🔧 IMPORTANTE: Converti le quotazioni in numerico e gestisci i valori nulli
+    if 'quot_att_mantra' in new_sb.columns:
+        new_sb['quot_att_mantra'] = pd.to_numeric(new_sb['quot_att_mantra'], errors='coerce')
+
+    if 'ruolo' in new_sb.columns:
+        new_sb['ruolo'] = new_sb['ruolo'].astype(str).str.replace('{', '').str.replace('}', '')
+
+    return new_sb